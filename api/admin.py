@@ -0,0 +1,37 @@
+"""
+admin.py
+who counts as an admin for diagnostic endpoints (profiles, memory, ...)
+
+a request is an admin request when either
+- it carries X-Admin-Token matching the ADMIN_TOKEN environment variable, or
+- the logged-in session user is listed in ADMIN_USERS (comma-separated)
+
+with neither variable set nobody is an admin and the endpoints return 403
+"""
+
+import os
+import hmac
+from functools import wraps
+
+from flask import jsonify, request, session
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+
+
+def is_admin_request() -> bool:
+    token = request.headers.get("X-Admin-Token", "")
+    if ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN):
+        return True
+    username = session.get("username")
+    return bool(username and username in ADMIN_USERS)
+
+
+def admin_required(fn):
+    """route decorator: 403 unless is_admin_request()"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({"error": "admin_only"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
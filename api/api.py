@@ -63,7 +63,8 @@ def handle_button_click(button_id, payload=None):
 
     from flask import session
     from database.users import get_user_by_username
-    from database.db_query import get_ratings_for_user, upsert_rating, delete_rating
+    from database.db_query import get_ratings_for_user, delete_rating
+    from recommender.refresh import notify_ratings_changed
 
     uname = session.get("username")
     if button_id == "view_ratings_button":
@@ -93,8 +94,14 @@ def handle_button_click(button_id, payload=None):
             return {"ok": False, "error": "user_not_found"}, 404
         user_id = int(user_row[0])
         try:
-            upsert_rating(user_id=user_id, movie_id=int(movie_id), rating=float(rating))
+            # goes through the group-commit writer so concurrent clicks share a transaction
+            from database.group_commit import CommitPending, rating_writer
+            rating_writer.write(user_id, [(int(movie_id), float(rating))])
+            notify_ratings_changed(user_id)
             return {"ok": True, "message": "Rating saved"}
+        except CommitPending as pending:
+            pending.on_commit(lambda _: notify_ratings_changed(user_id))
+            return {"ok": True, "pending": True, "message": "Rating is being saved"}, 202
         except Exception as ex:
             logger.exception("Failed to save rating")
             return {"ok": False, "error": str(ex)}, 500
@@ -111,6 +118,8 @@ def handle_button_click(button_id, payload=None):
         user_id = int(user_row[0])
         try:
             deleted = delete_rating(user_id=user_id, movie_id=int(movie_id))
+            if deleted:
+                notify_ratings_changed(user_id)
             return {"ok": True, "deleted": deleted}
         except Exception as ex:
             logger.exception("Failed to delete rating")
@@ -133,9 +142,9 @@ def handle_button_click(button_id, payload=None):
         # DB-only stats (no JSON fallback)
         try:
             stats = get_user_rating_stats(user_id) or {}
-            total_db = int(stats.get("total", 0) or 0)
-            avg_db = float(stats["avg"]) if stats.get("avg") is not None else 0.0
-            by_genre_db = stats.get("by_genre", []) or []
+            total_db = int(stats.get("total_ratings", 0) or 0)
+            avg_db = float(stats["average_rating"]) if stats.get("average_rating") is not None else 0.0
+            by_genre_db = stats.get("top_genres", []) or []
 
             statistics = {
                 "total_ratings": total_db,
@@ -179,7 +188,9 @@ def handle_button_click(button_id, payload=None):
                     title = _resolve_title_from_entry(item if isinstance(item, dict) else {"movie": item})
                     results.append({"title": title, "movie": title, "rating": None})
 
-            return {"ratings": results, "source": "recs_db"}
+            # precomputed | live | fallback (popular-unseen after a missed deadline)
+            recs_source = recs[0].get("source") if recs and isinstance(recs[0], dict) else None
+            return {"ratings": results, "source": "recs_db", "recs_source": recs_source}
         except Exception:
             logger.exception("recs: failed")
             return {"error": "internal"}, 500
@@ -270,14 +281,9 @@ def save_rating(user_id, movie_id, rating):
     Save a user's rating for a movie into the database.
     Upsert style (delete then insert) to keep a single row per (user, movie).
     """
-    from database.paramstyle import PH
+    from database.db_query import write_ratings
     with get_db(readonly=False) as conn:
-        cur = conn.cursor()
-        cur.execute(f"DELETE FROM ratings WHERE user_id = {PH} AND movie_id = {PH};", (user_id, movie_id))
-        cur.execute(
-            f"INSERT INTO ratings (user_id, movie_id, rating, timestamp) VALUES ({PH}, {PH}, {PH}, {PH});",
-            (user_id, movie_id, float(rating), int(time.time()))
-        )
+        write_ratings(conn.cursor(), [(user_id, movie_id, float(rating), int(time.time()))])
 
 
 def get_user_profile(user_id):
@@ -0,0 +1,132 @@
+"""
+instrumentation.py
+per-request timing for the flask app, exported through metrics.registry
+
+records for every request:
+- latency histogram and request counter by method / route / status
+- in-flight requests
+- response size histogram by method / route
+- SQL statements per request (database.query_log), with a warning for
+  requests over DB_QUERY_WARN_COUNT
+- a tracing.Trace per request; with X-Debug-Trace: 1 (or ?debug=trace) the
+  stage breakdown comes back as Server-Timing and a "_trace" JSON field
+
+routes are labelled by their url rule ("/api/movies/<int:movie_id>"), not the
+raw path, so label cardinality stays bounded
+"""
+
+import json
+import time
+import logging
+
+from flask import Flask, g, request
+
+import tracing
+from metrics import registry, SIZE_BUCKETS
+from database.query_log import finish_request, request_summary
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Request latency in seconds.", ["method", "route", "status"]
+)
+REQUESTS = registry.counter("http_requests_total", "Requests handled.", ["method", "route", "status"])
+IN_FLIGHT = registry.gauge("http_requests_in_flight", "Requests currently being handled.")
+RESPONSE_SIZE = registry.histogram(
+    "http_response_size_bytes", "Response body size in bytes.", ["method", "route"], buckets=SIZE_BUCKETS
+)
+
+
+def _route_label() -> str:
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def _before_request():
+    g._metrics_t0 = time.perf_counter()
+    IN_FLIGHT.inc()
+    g._trace_token = tracing.start_trace()
+
+
+def _wants_trace() -> bool:
+    return request.headers.get("X-Debug-Trace", "").strip() in ("1", "true") or request.args.get("debug") == "trace"
+
+
+def _attach_trace(response) -> None:
+    """Server-Timing header (+ "_trace" field on JSON object responses) for debug requests"""
+    trace = tracing.current_trace()
+    if trace is None:
+        return
+    tree = trace.tree()
+    timing = tracing.server_timing(trace)
+    db = request_summary()
+    if db:
+        timing = ", ".join(t for t in (timing, f"db;dur={db['seconds'] * 1000.0:.3f};desc=\"{db['queries']} queries\"") if t)
+    response.headers["Server-Timing"] = ", ".join(t for t in (timing, f"total;dur={tree['ms']:.3f}") if t)
+    if response.is_json and not response.direct_passthrough:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body["_trace"] = {
+                "spans": tree,
+                "stages_ms": {k: round(v, 3) for k, v in trace.totals().items()},
+                "db": {"queries": db["queries"], "ms": round(db["seconds"] * 1000.0, 3)} if db else None,
+            }
+            response.set_data(json.dumps(body))
+
+
+def _record(t0: float, status: str, size: int | None) -> None:
+    route = _route_label()
+    REQUEST_LATENCY.observe(time.perf_counter() - t0, method=request.method, route=route, status=status)
+    REQUESTS.inc(method=request.method, route=route, status=status)
+    if size is not None:
+        RESPONSE_SIZE.observe(size, method=request.method, route=route)
+
+
+def _after_request(response):
+    t0 = g.get("_metrics_t0")
+    if t0 is not None and _wants_trace():
+        try:
+            _attach_trace(response)
+        except Exception:
+            logger.exception("failed to attach trace")
+    if t0 is not None:
+        _record(t0, str(response.status_code), response.calculate_content_length())
+        g._metrics_recorded = True
+    return response
+
+
+def _teardown_request(exc):
+    # always runs, also when no response was built (counted as a 500)
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is None:
+        return
+    IN_FLIGHT.dec()
+    finish_request()
+    token = g.pop("_trace_token", None)
+    if token is not None:
+        tracing.end_trace(token)
+    if not g.pop("_metrics_recorded", False):
+        _record(t0, "500", None)
+
+
+def _component_stats():
+    # components keep their own counters; read them at scrape time
+    from database.group_commit import rating_writer
+    registry.register_collector("rating_writer", rating_writer.stats, "Group-commit rating writer")
+
+    from recommender.refresh import refresh_queue
+    registry.register_collector("rec_refresh", refresh_queue.metrics, "Recommendation refresh queue")
+
+    from recommender.fallback import popular_fallback
+    registry.register_collector("recs_fallback", popular_fallback.stats, "Popular-unseen fallback list")
+
+
+def init_app(app: Flask) -> None:
+    """attach the request hooks to `app` (call once, before serving)"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    try:
+        _component_stats()
+    except Exception:
+        logger.exception("metrics: component collectors not registered")
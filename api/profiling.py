@@ -0,0 +1,249 @@
+"""
+profiling.py
+opt-in profiling of single production requests
+
+a request is profiled when it hits one of PROFILE_ROUTES and either
+- an admin sends it with "X-Profile: cprofile" (or "sample"), or
+- an admin armed the route beforehand (POST /api/admin/profiles/arm), so
+  the next matching request(s) from any user get profiled
+
+modes:
+- cprofile: deterministic cProfile over the request; saved as .pstats
+  (snakeviz / gprof2dot / `python -m pstats`)
+- sample:   a background thread samples the request thread's stack every
+  PROFILE_SAMPLE_MS; saved as collapsed stacks (.collapsed), ready for
+  flamegraph.pl / speedscope
+
+profiles are rate-limited (one at a time, at most one per
+PROFILE_MIN_INTERVAL_S), written to PROFILE_DIR with a .json sidecar, and
+only the newest PROFILE_KEEP are kept
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import logging
+import threading
+from pathlib import Path
+
+from flask import Flask, g, request
+
+from api.admin import is_admin_request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(__file__).resolve().parent.parent / "profiles"))
+PROFILE_ROUTES = {
+    r.strip() for r in os.getenv(
+        "PROFILE_ROUTES", "/api/recommendations/content,/api/button-click"
+    ).split(",") if r.strip()
+}
+PROFILE_MIN_INTERVAL_S = float(os.getenv("PROFILE_MIN_INTERVAL_S", "10"))
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+MODES = ("cprofile", "sample")
+
+
+class StackSampler(threading.Thread):
+    """samples one thread's Python stack into collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        super().__init__(name="request-stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.counts: dict[str, int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self) -> dict[str, int]:
+        self._stop_event.set()
+        self.join(timeout=1.0)
+        return self.counts
+
+
+class _Limiter:
+    """one profile at a time, at most one start per PROFILE_MIN_INTERVAL_S; plus armed routes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = False
+        self._last_start = 0.0
+        self._armed: dict[str, list] = {}     # route -> [remaining, mode]
+
+    def arm(self, route: str, count: int, mode: str) -> None:
+        with self._lock:
+            self._armed[route] = [max(int(count), 1), mode]
+
+    def armed(self) -> dict:
+        with self._lock:
+            return {r: {"remaining": n, "mode": m} for r, (n, m) in self._armed.items()}
+
+    def try_start(self, route: str, requested_mode: str | None) -> str | None:
+        """mode to profile this request with, or None"""
+        with self._lock:
+            mode = requested_mode
+            armed = self._armed.get(route)
+            if mode is None and armed:
+                mode = armed[1]
+            if mode is None or self._busy:
+                return None
+            now = time.monotonic()
+            if now - self._last_start < PROFILE_MIN_INTERVAL_S:
+                return None
+            if requested_mode is None and armed:
+                armed[0] -= 1
+                if armed[0] <= 0:
+                    del self._armed[route]
+            self._busy = True
+            self._last_start = now
+            return mode
+
+    def done(self) -> None:
+        with self._lock:
+            self._busy = False
+
+
+limiter = _Limiter()
+
+
+def arm(route: str, count: int = 1, mode: str = "cprofile") -> None:
+    if route not in PROFILE_ROUTES:
+        raise ValueError(f"route not profilable: {route} (PROFILE_ROUTES={sorted(PROFILE_ROUTES)})")
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    limiter.arm(route, count, mode)
+
+
+def _before_request():
+    if request.path not in PROFILE_ROUTES:
+        return
+    header = (request.headers.get("X-Profile") or "").strip().lower()
+    requested = None
+    if header and is_admin_request():
+        requested = header if header in MODES else "cprofile"
+    mode = limiter.try_start(request.path, requested)
+    if mode is None:
+        return
+    g._profile = {"mode": mode, "t0": time.perf_counter(), "created_at": time.time()}
+    if mode == "cprofile":
+        prof = cProfile.Profile()
+        g._profile["profiler"] = prof
+        prof.enable()
+    else:
+        sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_MS / 1000.0)
+        g._profile["sampler"] = sampler
+        sampler.start()
+
+
+def _finish(status: int | None):
+    state = g.pop("_profile", None)
+    if state is None:
+        return None
+    try:
+        duration_ms = (time.perf_counter() - state["t0"]) * 1000.0
+        if "profiler" in state:
+            state["profiler"].disable()
+        counts = state["sampler"].stop() if "sampler" in state else None
+
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        slug = request.path.strip("/").replace("/", "_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(state['created_at']))}-{int(state['created_at'] * 1000) % 1000:03d}-{slug}"
+        if counts is None:
+            data_file = f"{name}.pstats"
+            state["profiler"].dump_stats(str(PROFILE_DIR / data_file))
+        else:
+            data_file = f"{name}.collapsed"
+            with open(PROFILE_DIR / data_file, "w", encoding="utf-8") as fh:
+                for stack, n in sorted(counts.items()):
+                    fh.write(f"{stack} {n}\n")
+        meta = {
+            "id": name,
+            "file": data_file,
+            "mode": state["mode"],
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode("utf-8", "replace"),
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "created_at": int(state["created_at"]),
+        }
+        if counts is not None:
+            meta["samples"] = int(sum(counts.values()))
+        (PROFILE_DIR / f"{name}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        _prune()
+        logger.info("profiled %s %s in %.1fms -> %s", request.method, request.path, duration_ms, data_file)
+        return name
+    except Exception:
+        logger.exception("failed to write request profile")
+        return None
+    finally:
+        limiter.done()
+
+
+def _after_request(response):
+    if "_profile" in g:
+        profile_id = _finish(response.status_code)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _teardown_request(exc):
+    # request died before after_request: still stop the profiler and release the slot
+    if "_profile" in g:
+        _finish(None)
+
+
+def _prune() -> None:
+    metas = sorted(PROFILE_DIR.glob("*.json"))
+    for old in metas[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        try:
+            data_file = json.loads(old.read_text(encoding="utf-8")).get("file")
+            if data_file:
+                (PROFILE_DIR / data_file).unlink(missing_ok=True)
+        except Exception:
+            pass
+        old.unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    """newest first"""
+    out = []
+    if not PROFILE_DIR.exists():
+        return out
+    for meta in sorted(PROFILE_DIR.glob("*.json"), reverse=True):
+        try:
+            out.append(json.loads(meta.read_text(encoding="utf-8")))
+        except Exception:
+            continue
+    return out
+
+
+def profile_path(profile_id: str) -> Path | None:
+    """data file for a listed profile id (None if unknown)"""
+    for meta in list_profiles():
+        if meta.get("id") == profile_id:
+            path = PROFILE_DIR / meta["file"]
+            return path if path.exists() else None
+    return None
+
+
+def init_app(app: Flask) -> None:
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -8,7 +8,7 @@ handles:
 - profile sync and button-click dispatcher
 """
 
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, flash
+from flask import Blueprint, Response, request, jsonify, session, render_template, redirect, url_for, flash, send_file
 from pathlib import Path
 import json
 import logging
@@ -17,6 +17,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 # DB helpers for users (you already have this module)
 from database.users import get_user_by_username, create_user, set_password  # noqa: F401
+from api.admin import admin_required
 
 # create flask blueprint
 api_bp = Blueprint("api_bp", __name__)
@@ -203,15 +204,79 @@ def button_click():
     try:
         api_module = importlib.import_module("api.api")
         result = api_module.handle_button_click(button_id, payload)
+        # handlers return a body or (body, status)
+        body, status = result if isinstance(result, tuple) else (result, 200)
         logger.info(
             "button_click result: %s",
-            {"button": button_id, "result_keys": list(result.keys()) if isinstance(result, dict) else type(result)}
+            {"button": button_id, "status": status,
+             "result_keys": list(body.keys()) if isinstance(body, dict) else type(body)}
         )
-        return jsonify(result)
+        return jsonify(body), status
     except Exception as ex:
         logger.exception("Error in handle_button_click")
         return jsonify({"error": str(ex)}), 500
 
+# ---------- RATINGS: batch write (group commit) ----------
+MAX_BATCH_RATINGS = 500
+
+@api_bp.post("/api/ratings/batch")
+def api_ratings_batch():
+    """
+    Save many ratings for the logged-in user in one request.
+    Body: {"ratings": [{"movie_id": 1, "rating": 4.5}, ...]}  (or [[movie_id, rating], ...])
+    Writes are handed to the group-commit writer, which shares one
+    transaction between concurrent requests. 202 {"pending": true} when the
+    commit is still in progress after the writer's timeout.
+    """
+    from database.group_commit import CommitPending, rating_writer
+    from recommender.refresh import notify_ratings_changed
+
+    uname = session.get("username")
+    if not uname:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    payload = request.get_json(silent=True) or {}
+    raw = payload.get("ratings") if isinstance(payload, dict) else payload
+    if not isinstance(raw, list) or not raw:
+        return jsonify({"ok": False, "error": "ratings list required"}), 400
+    if len(raw) > MAX_BATCH_RATINGS:
+        return jsonify({"ok": False, "error": f"at most {MAX_BATCH_RATINGS} ratings per batch"}), 400
+
+    items = []
+    for entry in raw:
+        try:
+            if isinstance(entry, dict):
+                movie_id = int(entry.get("movie_id", entry.get("movie")))
+                rating = float(entry.get("rating"))
+            else:
+                movie_id, rating = int(entry[0]), float(entry[1])
+        except (TypeError, ValueError, IndexError):
+            return jsonify({"ok": False, "error": f"invalid rating entry: {entry}"}), 400
+        if not 0.5 <= rating <= 5.0:
+            return jsonify({"ok": False, "error": f"rating out of range for movie {movie_id}"}), 400
+        items.append((movie_id, rating))
+
+    user_row = get_user_by_username(uname)
+    if not user_row:
+        return jsonify({"ok": False, "error": "user_not_found"}), 404
+    user_id = int(user_row[0])
+
+    try:
+        saved = rating_writer.write(user_id, items)
+    except CommitPending as pending:
+        # still queued behind a slow commit: it may yet succeed, so not an error
+        pending.on_commit(lambda _: notify_ratings_changed(user_id))
+        return jsonify({"ok": True, "pending": True, "saved": None, "user_id": user_id}), 202
+    except Exception as ex:
+        logger.exception("batch rating write failed")
+        return jsonify({"ok": False, "error": str(ex)}), 500
+
+    # one refresh for the whole batch (the queue dedupes per user anyway)
+    notify_ratings_changed(user_id)
+
+    return jsonify({"ok": True, "saved": saved, "user_id": user_id}), 200
+
+
 # ---------- BROWSE API: genres ----------
 @api_bp.get("/api/genres")
 def api_genres():
@@ -255,6 +320,16 @@ def api_ping():
     return "ok", 200
 
 
+@api_bp.get("/api/metrics")
+def api_metrics():
+    """
+    Prometheus text exposition of request timing (api.instrumentation)
+    and component stats (group-commit writer, recommendation refresh queue).
+    """
+    from metrics import registry
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @api_bp.get("/api/stats")
 def api_stats():
     """
@@ -292,47 +367,117 @@ def api_stats():
     stats = get_user_rating_stats(user_id)
     return jsonify(stats), 200
 
+def _request_k(default: int = 20) -> int:
+    """?k= as a positive int; ValueError otherwise"""
+    k = int(request.args.get("k") or default)
+    if k < 1:
+        raise ValueError(f"k must be >= 1, got {k}")
+    return k
+
+def _request_user_id():
+    """(user_id, None) from ?user_id= or the session user, else (None, error response)"""
+    from database.users import get_user_by_username
+
+    user_id_param = request.args.get("user_id")
+    if user_id_param:
+        try:
+            return int(user_id_param), None
+        except ValueError:
+            return None, (jsonify({"error": "invalid_user_id"}), 400)
+    uname = session.get("username")
+    if not uname:
+        return None, (jsonify({"error": "not_logged_in"}), 401)
+    user_row = get_user_by_username(uname)
+    if not user_row:
+        return None, (jsonify({"error": "user_not_found"}), 404)
+    try:
+        return int(user_row[0]), None  # (id, username, hash)
+    except Exception:
+        # fallback dict-like
+        for kname in ("user_id", "id", "USER_ID", "ID"):
+            if kname in user_row:
+                return int(user_row[kname]), None
+        return None, (jsonify({"error": "could_not_resolve_user_id"}), 500)
+
 # ---------- RECS: content-based (genres + year) ----------
 @api_bp.get("/api/recommendations/content")
 def api_content_recs():
     """
     Content-based recommendations for the current user (or a provided user_id).
+    "source" is precomputed | live, or fallback (popular-unseen) when scoring
+    missed the deadline (recommender.fallback).
+    Query params:
+      user_id:     optional int; if omitted, use the logged-in session user
+      k:           optional int; default 20
+      deadline_ms: optional float; default RECS_DEADLINE_MS
+    """
+    from recommender.content import recommend_titles_for_user
+
+    user_id, error = _request_user_id()
+    if error:
+        return error
+    try:
+        k = _request_k()
+        deadline_ms = float(request.args["deadline_ms"]) if request.args.get("deadline_ms") else None
+    except ValueError as e:
+        return jsonify({"error": "invalid_params", "detail": str(e)}), 400
+
+    items = recommend_titles_for_user(user_id=user_id, k=k, deadline_ms=deadline_ms)
+    source = items[0]["source"] if items else None
+    return jsonify({"user_id": user_id, "source": source, "items": items}), 200
+
+# ---------- RECS: two-stage pipeline (candidates -> re-rank) ----------
+@api_bp.get("/api/recommendations/pipeline")
+def api_pipeline_recs():
+    """
+    Candidate generators + re-ranker (recommender.pipeline) for the current
+    user (or a provided user_id). Each item carries the generator that found
+    it; "pipeline" has per-stage timings and budgets.
     Query params:
       user_id: optional int; if omitted, use the logged-in session user
       k:       optional int; default 20
     """
-    from recommender.content import recommend_titles_for_user
-    from database.users import get_user_by_username
+    from recommender.pipeline import recommend_titles_for_user
 
-    # resolve user_id
-    user_id_param = request.args.get("user_id")
-    k = int(request.args.get("k") or 20)
+    user_id, error = _request_user_id()
+    if error:
+        return error
+    try:
+        k = _request_k()
+    except ValueError as e:
+        return jsonify({"error": "invalid_params", "detail": str(e)}), 400
 
-    if user_id_param:
-        try:
-            user_id = int(user_id_param)
-        except ValueError:
-            return jsonify({"error": "invalid_user_id"}), 400
-    else:
-        uname = session.get("username")
-        if not uname:
-            return jsonify({"error": "not_logged_in"}), 401
-        user_row = get_user_by_username(uname)
-        if not user_row:
-            return jsonify({"error": "user_not_found"}), 404
-        try:
-            user_id = int(user_row[0])  # (id, username, hash)
-        except Exception:
-            # fallback dict-like
-            for kname in ("user_id", "id", "USER_ID", "ID"):
-                if kname in user_row:
-                    user_id = int(user_row[kname])
-                    break
-            else:
-                return jsonify({"error": "could_not_resolve_user_id"}), 500
+    items, report = recommend_titles_for_user(user_id=user_id, k=k)
+    return jsonify({"user_id": user_id, "items": items, "pipeline": report}), 200
 
-    items = recommend_titles_for_user(user_id=user_id, k=k)
-    return jsonify({"user_id": user_id, "items": items}), 200
+# ---------- RECS: hybrid (engines blended under a deadline) ----------
+@api_bp.get("/api/recommendations/hybrid")
+def api_hybrid_recs():
+    """
+    Weighted blend of several engines scored concurrently (recommender.hybrid);
+    engines that miss the deadline are left out and listed in "hybrid".
+    Query params:
+      user_id:     optional int; if omitted, use the logged-in session user
+      k:           optional int; default 20
+      weights:     optional "factor:0.5,content:0.2"; default HYBRID_WEIGHTS
+      deadline_ms: optional float; default HYBRID_DEADLINE_MS
+    """
+    from recommender.hybrid import parse_weights, recommend_titles_for_user
+
+    user_id, error = _request_user_id()
+    if error:
+        return error
+    try:
+        k = _request_k()
+        weights = parse_weights(request.args["weights"]) if request.args.get("weights") else None
+        deadline_ms = float(request.args["deadline_ms"]) if request.args.get("deadline_ms") else None
+    except ValueError as e:
+        return jsonify({"error": "invalid_params", "detail": str(e)}), 400
+    if weights == {}:
+        return jsonify({"error": "invalid_params", "detail": "no engine with a positive weight"}), 400
+
+    items, report = recommend_titles_for_user(user_id=user_id, k=k, weights=weights, deadline_ms=deadline_ms)
+    return jsonify({"user_id": user_id, "items": items, "hybrid": report}), 200
 
 @api_bp.route("/api/movies/search", methods=["GET"])
 def search_movies():
@@ -405,3 +550,111 @@ def api_user_stats():
         return jsonify({"error": "internal_error"}), 500
 
     return jsonify(stats), 200
+
+
+# ---------- ADMIN: request profiles (api.profiling) ----------
+@api_bp.get("/api/admin/profiles")
+@admin_required
+def api_admin_profiles():
+    """List stored request profiles, newest first, plus currently armed routes."""
+    from api import profiling
+    return jsonify({
+        "profiles": profiling.list_profiles(),
+        "armed": profiling.limiter.armed(),
+        "routes": sorted(profiling.PROFILE_ROUTES),
+    }), 200
+
+
+@api_bp.get("/api/admin/profiles/<profile_id>")
+@admin_required
+def api_admin_profile_download(profile_id):
+    """Download one profile (.pstats or .collapsed)."""
+    from api import profiling
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({"error": "profile_not_found"}), 404
+    return send_file(path, as_attachment=True, download_name=path.name)
+
+
+@api_bp.post("/api/admin/profiles/arm")
+@admin_required
+def api_admin_profile_arm():
+    """
+    Profile the next `count` requests to `route` from any user.
+    Body: {"route": "/api/recommendations/content", "count": 1, "mode": "cprofile"|"sample"}
+    """
+    from api import profiling
+    payload = request.get_json(silent=True) or {}
+    try:
+        profiling.arm(
+            payload.get("route", ""),
+            count=int(payload.get("count", 1)),
+            mode=payload.get("mode", "cprofile"),
+        )
+    except (TypeError, ValueError) as ex:
+        return jsonify({"ok": False, "error": str(ex)}), 400
+    return jsonify({"ok": True, "armed": profiling.limiter.armed()}), 200
+
+
+# ---------- ADMIN: memory accounting (memory.accountant) ----------
+@api_bp.get("/api/admin/memory")
+@admin_required
+def api_admin_memory():
+    """
+    Byte size of every registered in-memory structure (models, caches, ...)
+    next to process RSS. ?tracemalloc=1 adds the top allocating lines
+    (only once tracing was started via POST /api/admin/memory/tracemalloc).
+    """
+    import memory
+    report = memory.accountant.report()
+    if request.args.get("tracemalloc"):
+        report["tracemalloc_top"] = memory.tracemalloc_top(limit=int(request.args.get("limit", 20)))
+    return jsonify(report), 200
+
+
+@api_bp.post("/api/admin/memory/tracemalloc")
+@admin_required
+def api_admin_tracemalloc():
+    """Body: {"action": "start"|"stop"|"snapshot", "frames": 1, "limit": 20}"""
+    import memory
+    payload = request.get_json(silent=True) or {}
+    action = payload.get("action", "snapshot")
+    if action == "start":
+        return jsonify({"ok": True, "started": memory.tracemalloc_start(int(payload.get("frames", 1)))}), 200
+    if action == "stop":
+        memory.tracemalloc_stop()
+        return jsonify({"ok": True}), 200
+    if action == "snapshot":
+        return jsonify(memory.tracemalloc_top(limit=int(payload.get("limit", 20)))), 200
+    return jsonify({"ok": False, "error": "action must be start, stop or snapshot"}), 400
+
+
+@api_bp.post("/api/admin/memory/enforce")
+@admin_required
+def api_admin_memory_enforce():
+    """Run budget eviction now (no-op without WORKER_MEMORY_BUDGET)."""
+    import memory
+    freed = memory.accountant.enforce_budget()
+    return jsonify({"ok": True, "freed_bytes": freed, **memory.accountant.report()}), 200
+
+
+# ---------- ADMIN: dataset merge (database.load_movielens) ----------
+@api_bp.post("/api/admin/dataset/merge")
+@admin_required
+def api_admin_dataset_merge():
+    """
+    Apply only the differences between a MovieLens directory on the server
+    and the database, in this worker, so its caches/models follow the change
+    events. Body: {"path": "data/ml-latest-small"}
+    """
+    from database.load_movielens import merge_dataset
+    import recommender.refresh  # noqa: F401  (registers the change-event subscriber)
+    payload = request.get_json(silent=True) or {}
+    path = payload.get("path")
+    if not path:
+        return jsonify({"ok": False, "error": "path required"}), 400
+    try:
+        changes = merge_dataset(path)
+    except FileNotFoundError as ex:
+        return jsonify({"ok": False, "error": str(ex)}), 400
+    return jsonify({"ok": True, **changes.summary()}), 200
@@ -17,6 +17,7 @@ from typing import Optional
 from database.connection import get_db
 from database.paramstyle import PH
 from database.id_to_title import id_to_title
+from database.user_stats import rebuild_user_stats
 
 logger = logging.getLogger(__name__)
 
@@ -171,6 +172,9 @@ def sync_user_ratings(profile_path: Path) -> bool:
                 )
                 inserted += 1
 
+            #ratings were replaced wholesale, so recompute this user's stats
+            rebuild_user_stats(cur, [uid])
+
         logger.info(f"sync_user_ratings: user {username} (id={uid}) - inserted {inserted} ratings")
         return True
 
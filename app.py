@@ -47,6 +47,11 @@ def init():
             init_database_and_sync(data_path="data/ml-latest-small", profile_path=profile_path)
             logger.info("Database initialized")
         else:
+            #schema is idempotent; picks up tables added since the DB was created
+            from database.init_db import main as init_db
+            from database.user_stats import ensure_user_stats
+            init_db()
+            ensure_user_stats()
             logger.info("Database ready; skipping initialization")
     except Exception:
         logger.exception("Database initialization failed")
@@ -56,6 +61,16 @@ init()
 from api.routes import api_bp
 app.register_blueprint(api_bp)
 
+from api.instrumentation import init_app as init_instrumentation
+init_instrumentation(app)
+
+from api.profiling import init_app as init_profiling
+init_profiling(app)
+
+#popular-unseen list served when personalized recs miss their deadline
+from recommender.fallback import popular_fallback
+popular_fallback.refresh_async()
+
 @app.route("/")
 def index():
     return render_template("index.html")
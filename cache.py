@@ -1,33 +1,91 @@
 # cache.py
+import os
 import time
+import threading
 from functools import wraps
 from typing import Any, Callable, Hashable, Tuple
 
+from memory import accountant, parse_bytes, sizeof
+
+#byte cap for the shared cache (0 = unbounded); oldest/least recently used entries go first
+CACHE_MAX_BYTES = parse_bytes(os.getenv("CACHE_MAX_BYTES", "256M"))
+
 class SimpleCache:
-    def __init__(self, default_ttl: int = 900):
-        self.store: dict[Hashable, Tuple[Any, float | None]] = {}
+    def __init__(self, default_ttl: int = 900, max_bytes: int = 0):
+        # key -> (value, expiry, approx bytes); dict order doubles as LRU order
+        self.store: dict[Hashable, Tuple[Any, float | None, int]] = {}
         self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
 
     def _expired(self, exp: float | None) -> bool:
         return exp is not None and exp < time.time()
 
+    def _pop(self, key: Hashable):
+        item = self.store.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+        return item
+
     def get(self, key: Hashable):
-        item = self.store.get(key)
-        if not item:
-            return None
-        value, exp = item
-        if self._expired(exp):
-            self.store.pop(key, None)
-            return None
-        return value
+        with self._lock:
+            item = self.store.get(key)
+            if not item:
+                return None
+            value, exp, _ = item
+            if self._expired(exp):
+                self._pop(key)
+                return None
+            # move to the most-recently-used end
+            self.store[key] = self.store.pop(key)
+            return value
 
     def set(self, key: Hashable, value: Any, ttl: int | None = None):
         ttl = self.default_ttl if ttl is None else ttl
         exp = (time.time() + ttl) if ttl > 0 else None
-        self.store[key] = (value, exp)
+        nbytes = sizeof(value) + sizeof(key)
+        with self._lock:
+            self._pop(key)
+            self.store[key] = (value, exp, nbytes)
+            self.bytes += nbytes
+            if self.max_bytes and self.bytes > self.max_bytes:
+                self._evict_locked(self.bytes - self.max_bytes)
+        if accountant.budget is not None:
+            accountant.enforce_budget()
 
     def delete(self, key: Hashable):
-        self.store.pop(key, None)
+        with self._lock:
+            self._pop(key)
+
+    def delete_where(self, pred: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [k for k in list(self.store) if pred(k)]
+            for k in keys:
+                self._pop(k)
+        return len(keys)
+
+    def _evict_locked(self, nbytes: int) -> int:
+        # expired entries first, then least recently used
+        freed = 0
+        now = time.time()
+        for k in [k for k, (_, exp, _) in self.store.items() if exp is not None and exp < now]:
+            freed += self._pop(k)[2]
+        for k in list(self.store):
+            if freed >= nbytes:
+                break
+            freed += self._pop(k)[2]
+            self.evictions += 1
+        return freed
+
+    def evict_bytes(self, nbytes: int) -> int:
+        """free at least `nbytes` (if there is that much); returns bytes freed"""
+        with self._lock:
+            return self._evict_locked(nbytes)
+
+    def memory_usage(self) -> dict:
+        return {"bytes": self.bytes, "items": len(self.store), "max_bytes": self.max_bytes, "evictions": self.evictions}
 
     def cached(self, ttl: int | None = None, key_fn: Callable[..., Hashable] | None = None):
         def deco(fn):
@@ -43,9 +101,27 @@ class SimpleCache:
             return wrapper
         return deco
 
-cache = SimpleCache()
+cache = SimpleCache(max_bytes=CACHE_MAX_BYTES)
+accountant.register("cache", "cache", cache.memory_usage)
+accountant.register_evictor("cache", cache.evict_bytes, priority=10)
 
 # helper for targeted invalidation used by rating updates
 def key_content_recs(user_id: int, k: int = 20, **kw):
     # keep tuple stable & hashable
     return ("content_recs", int(user_id), int(k), tuple(sorted(kw.items())))
+
+def key_item_item_recs(user_id: int | None, k: int = 500, **kw):
+    return ("item_item_recs", None if user_id is None else int(user_id), int(k), tuple(sorted(kw.items())))
+
+RECS_NAMESPACES = ("content_recs", "item_item_recs")
+
+def invalidate_user_recs(user_id: int) -> int:
+    """drop every cached recommendation list for one user (any k)"""
+    uid = int(user_id)
+    return cache.delete_where(
+        lambda key: isinstance(key, tuple) and len(key) > 1 and key[0] in RECS_NAMESPACES and key[1] == uid
+    )
+
+def invalidate_all_recs() -> int:
+    """drop every cached recommendation list (bulk data changes)"""
+    return cache.delete_where(lambda key: isinstance(key, tuple) and len(key) > 1 and key[0] in RECS_NAMESPACES)
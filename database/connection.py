@@ -10,6 +10,8 @@ from pathlib import Path
 from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from database.query_log import instrument
+
 #load environment variables from .env file
 load_dotenv()
 
@@ -41,7 +43,7 @@ def get_db(readonly: bool = False):
         import psycopg2
         conn = psycopg2.connect(DATABASE_URL)
         try:
-            yield conn
+            yield instrument(conn)
             #commit changes if not readonly
             if not readonly:
                 conn.commit()
@@ -62,7 +64,7 @@ def get_db(readonly: bool = False):
         #enable dict-like row access
         conn.row_factory = sqlite3.Row
         try:
-            yield conn
+            yield instrument(conn)
             #commit changes if not readonly
             if not readonly:
                 conn.commit()
@@ -3,9 +3,9 @@ db_query.py
 database query helpers for user ratings, movie search, and recommendations
 """
 
-from typing import List, Dict, Tuple, Optional
+from typing import Iterable, List, Dict, Tuple, Optional
 from database.connection import get_db
-from database.paramstyle import PH
+from database.paramstyle import PH, ph_list
 from .id_to_title import id_to_title
 import time
 
@@ -146,6 +146,45 @@ def search_movies_by_title(query: str, limit: int = 20) -> list:
 # -----------------------------
 # Insert/replace a rating
 # -----------------------------
+def write_ratings(cur, rows: Iterable[Tuple[int, int, float, int]]) -> int:
+    """
+    Apply (user_id, movie_id, rating, timestamp) rows on an open cursor.
+    Keeps a single row per (user, movie); the caller owns the transaction.
+    Returns number of rows written.
+    """
+    from database.user_stats import apply_rating_changes
+
+    rows = [(int(u), int(m), float(r), int(ts)) for u, m, r, ts in rows]
+    if not rows:
+        return 0
+
+    # collect the rows being replaced so user_stats can subtract them
+    by_user: Dict[int, List[int]] = {}
+    for u, m, _, _ in rows:
+        by_user.setdefault(u, []).append(m)
+    removed: List[Tuple[int, int, float]] = []
+    for u, mids in by_user.items():
+        cur.execute(
+            f"SELECT movie_id, rating FROM ratings WHERE user_id = {PH} AND movie_id IN ({ph_list(len(mids))})",
+            (u, *mids),
+        )
+        removed.extend((u, int(mid), float(r)) for mid, r in cur.fetchall())
+
+    cur.executemany(
+        f"DELETE FROM ratings WHERE user_id = {PH} AND movie_id = {PH};",
+        [(u, m) for u, m, _, _ in rows],
+    )
+    cur.executemany(
+        f"""
+        INSERT INTO ratings (user_id, movie_id, rating, timestamp)
+        VALUES ({PH}, {PH}, {PH}, {PH})
+        """,
+        rows,
+    )
+    apply_rating_changes(cur, removed=removed, added=[(u, m, r) for u, m, r, _ in rows])
+    return len(rows)
+
+
 def upsert_rating(user_id: int, movie_id: int, rating: float) -> None:
     """
     Keep a single row per (user, movie). Insert with current timestamp.
@@ -154,29 +193,31 @@ def upsert_rating(user_id: int, movie_id: int, rating: float) -> None:
 
     with get_db(readonly=False) as conn:
         cur = conn.cursor()
-        cur.execute(f"DELETE FROM ratings WHERE user_id = {PH} AND movie_id = {PH};", (user_id, movie_id))
-        cur.execute(
-            f"""
-            INSERT INTO ratings (user_id, movie_id, rating, timestamp)
-            VALUES ({PH}, {PH}, {PH}, {PH})
-            """,
-            (user_id, movie_id, rating, ts),
-        )
+        write_ratings(cur, [(user_id, movie_id, rating, ts)])
 
 
 def delete_rating(user_id: int, movie_id: int) -> int:
     """
     Delete a user's rating for a movie. Returns number of rows deleted.
     """
+    from database.user_stats import apply_rating_changes
+
     with get_db(readonly=False) as conn:
         cur = conn.cursor()
+        cur.execute(
+            f"SELECT rating FROM ratings WHERE user_id = {PH} AND movie_id = {PH};",
+            (user_id, movie_id),
+        )
+        removed = [(int(user_id), int(movie_id), float(r)) for (r,) in cur.fetchall()]
         cur.execute(f"DELETE FROM ratings WHERE user_id = {PH} AND movie_id = {PH};", (user_id, movie_id))
+        deleted = cur.rowcount
+        apply_rating_changes(cur, removed=removed)
         try:
             conn.commit()
         except Exception:
             # some connection wrappers auto-commit; ignore commit errors
             pass
-        return cur.rowcount
+        return deleted
 
 # -----------------------------
 # Popular unseen (Bayesian weighted)
@@ -206,10 +247,10 @@ def top_unseen_for_user(user_id: int, limit: int = 20, min_votes: int = 50, m_pa
                 s.movie_id,
                 m.title,
                 m.year,
-                s.v::INTEGER AS votes,
-                ROUND(s.R::numeric, 3) AS avg_rating,
-                ROUND(((s.v::numeric / (s.v + {PH})) * s.R
-                    + ({PH}::numeric / (s.v + {PH})) * g.C)::numeric, 3) AS weighted_rating,
+                CAST(s.v AS INTEGER) AS votes,
+                ROUND(CAST(s.R AS NUMERIC), 3) AS avg_rating,
+                ROUND(CAST((s.v * 1.0 / (s.v + {PH})) * s.R
+                    + ({PH} * 1.0 / (s.v + {PH})) * g.C AS NUMERIC), 3) AS weighted_rating,
                 m.poster_url,
                 m.genres
             FROM stats s
@@ -342,97 +383,12 @@ def list_movies(
 def get_user_rating_stats(user_id: int) -> dict:
     """
     Return user rating statistics including top genres.
-    Works with both SQLite and PostgreSQL.
+    Reads the incrementally maintained user_stats / user_genre_stats rows
+    (see database.user_stats) instead of aggregating the rating history.
     """
-    from database.connection import get_db, DATABASE_URL
-    
-    is_postgres = DATABASE_URL and DATABASE_URL.startswith("postgres")
-    
-    with get_db(readonly=True) as conn:
-        cur = conn.cursor()
-        
-        # Basic stats (works for both databases)
-        cur.execute(
-            """
-            SELECT 
-                COUNT(*) as total_ratings,
-                AVG(rating) as average_rating
-            FROM ratings
-            WHERE user_id = %s
-            """,
-            (user_id,)
-        )
-        row = cur.fetchone()
-        total_ratings = row[0] if row else 0
-        average_rating = float(row[1]) if row and row[1] else 0.0
-        
-        # Top genres (different SQL for PostgreSQL vs SQLite)
-        if is_postgres:
-            # PostgreSQL version: use string_to_array and unnest
-            cur.execute(
-                """
-                WITH user_movies AS (
-                    SELECT m.genres
-                    FROM ratings r
-                    JOIN movies m ON m.movie_id = r.movie_id
-                    WHERE r.user_id = %s AND m.genres IS NOT NULL
-                ),
-                genre_splits AS (
-                    SELECT unnest(string_to_array(genres, '|')) as genre
-                    FROM user_movies
-                )
-                SELECT 
-                    genre,
-                    COUNT(*) as count
-                FROM genre_splits
-                WHERE genre IS NOT NULL AND genre != '' AND genre != '(no genres listed)'
-                GROUP BY genre
-                ORDER BY count DESC
-                LIMIT 5
-                """,
-                (user_id,)
-            )
-        else:
-            # SQLite version
-            cur.execute(
-                """
-                WITH RECURSIVE split(movie_id, genre, rest) AS (
-                    SELECT 
-                        m.movie_id,
-                        substr(m.genres, 1, instr(m.genres || '|', '|') - 1) as genre,
-                        substr(m.genres, instr(m.genres || '|', '|') + 1) as rest
-                    FROM ratings r
-                    JOIN movies m ON m.movie_id = r.movie_id
-                    WHERE r.user_id = ? AND m.genres IS NOT NULL
-                    UNION ALL
-                    SELECT 
-                        movie_id,
-                        substr(rest, 1, instr(rest || '|', '|') - 1),
-                        substr(rest, instr(rest || '|', '|') + 1)
-                    FROM split
-                    WHERE rest != ''
-                )
-                SELECT genre, COUNT(*) as count
-                FROM split
-                WHERE genre != '' AND genre != '(no genres listed)'
-                GROUP BY genre
-                ORDER BY count DESC
-                LIMIT 5
-                """,
-                (user_id,)
-            )
-        
-        genre_rows = cur.fetchall()
-        top_genres = [
-            {"genre": row[0], "count": row[1]}
-            for row in genre_rows
-        ]
-        
-        return {
-            "total_ratings": total_ratings,
-            "average_rating": average_rating,
-            "top_genres": top_genres
-        }
+    from database.user_stats import read_user_stats
+
+    return read_user_stats(int(user_id), top_n=5)
 
 
 def get_movie_by_id(movie_id: int) -> dict:
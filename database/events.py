@@ -0,0 +1,85 @@
+"""
+events.py
+in-process change events for bulk data changes (dataset merges)
+
+    from database.events import subscribe
+
+    def on_change(changes):
+        for uid in changes.user_ids: ...
+
+    subscribe(on_change)
+
+publish() is called after the writing transaction committed and runs every
+subscriber in registration order; a failing subscriber is logged and does
+not stop the others. derived data that must stay transactionally consistent
+(user_stats) is updated inside the transaction instead, not through here.
+subscribers only see changes made by the process they live in.
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from typing import Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeSet:
+    """what one bulk write changed: row counts per table plus the touched ids"""
+
+    def __init__(self, source: str):
+        self.source = source
+        #table -> {"inserted": n, "updated": n, "deleted": n}
+        self.tables: Dict[str, Dict[str, int]] = {}
+        #users whose ratings were inserted / updated / deleted
+        self.user_ids: Set[int] = set()
+        #movies inserted / updated / deleted in the catalog
+        self.movie_ids: Set[int] = set()
+
+    def count(self, table: str, kind: str, n: int) -> None:
+        counts = self.tables.setdefault(table, {"inserted": 0, "updated": 0, "deleted": 0})
+        counts[kind] += int(n)
+
+    def changed(self, table: str) -> bool:
+        return any(self.tables.get(table, {}).values())
+
+    def is_empty(self) -> bool:
+        return not any(self.changed(t) for t in self.tables)
+
+    def summary(self) -> dict:
+        return {
+            "source": self.source,
+            "tables": {t: dict(c) for t, c in self.tables.items()},
+            "users": len(self.user_ids),
+            "movies": len(self.movie_ids),
+        }
+
+
+_subscribers: List[Callable[[ChangeSet], None]] = []
+_lock = threading.Lock()
+
+
+def subscribe(fn: Callable[[ChangeSet], None]) -> Callable[[ChangeSet], None]:
+    """register fn(changes); usable as a decorator"""
+    with _lock:
+        if fn not in _subscribers:
+            _subscribers.append(fn)
+    return fn
+
+
+def unsubscribe(fn: Callable[[ChangeSet], None]) -> None:
+    with _lock:
+        if fn in _subscribers:
+            _subscribers.remove(fn)
+
+
+def publish(changes: ChangeSet) -> None:
+    if changes.is_empty():
+        return
+    with _lock:
+        subscribers = list(_subscribers)
+    for fn in subscribers:
+        try:
+            fn(changes)
+        except Exception:
+            logger.exception("change event subscriber %s failed", getattr(fn, "__name__", fn))
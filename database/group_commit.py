@@ -0,0 +1,172 @@
+"""
+group_commit.py
+coalesces rating writes from concurrent requests into shared transactions
+
+a single background thread drains the pending queue every few milliseconds
+and applies everything it collected inside one get_db() transaction, so a
+burst of star clicks costs one connection and one commit instead of one each
+"""
+
+from __future__ import annotations
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Iterable, List, Tuple
+
+from database.connection import get_db
+from database.db_query import write_ratings
+
+logger = logging.getLogger(__name__)
+
+#how long the writer waits to collect more writes before committing
+FLUSH_INTERVAL_MS = float(os.getenv("RATING_GROUP_COMMIT_MS", "5"))
+#upper bound on rows applied in a single transaction
+MAX_BATCH_ROWS = int(os.getenv("RATING_GROUP_COMMIT_MAX_ROWS", "1000"))
+
+
+class CommitPending(Exception):
+    """
+    write() stopped waiting, but the rows are still queued and may commit
+    afterwards: report them as pending, not failed
+    """
+
+    def __init__(self, future: Future):
+        super().__init__("rating write still pending")
+        self.future = future
+
+    def on_commit(self, fn: Callable[[int], None]) -> None:
+        """call fn(rows written) once the write commits (not at all if it fails)"""
+        def done(f: Future) -> None:
+            if f.exception() is None:
+                fn(f.result())
+        self.future.add_done_callback(done)
+
+
+class GroupCommitWriter:
+    """
+    background writer that batches (user_id, movie_id, rating) submissions
+
+    usage:
+        fut = rating_writer.submit(user_id, [(movie_id, rating), ...])
+        saved = fut.result(timeout=5)
+    """
+
+    def __init__(self, flush_interval_ms: float = FLUSH_INTERVAL_MS, max_batch_rows: int = MAX_BATCH_ROWS):
+        self.flush_interval = max(flush_interval_ms, 0.0) / 1000.0
+        self.max_batch_rows = max(int(max_batch_rows), 1)
+        self._queue: "queue.Queue[Tuple[List[Tuple[int, int, float, int]], Future]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        #counters for monitoring (only mutated by the writer thread)
+        self.commits = 0
+        self.rows_written = 0
+        self.submissions = 0
+        self.failures = 0
+
+    def submit(self, user_id: int, items: Iterable[Tuple[int, float]]) -> Future:
+        """
+        queue ratings for one user; the future resolves to the number of rows
+        written once the transaction containing them has committed
+        """
+        ts = int(time.time())
+        #last entry wins for a repeated movie, so the grouped and the one-by-one
+        #write paths see the same rows (all share ts: duplicates would collide)
+        latest = {int(mid): float(r) for mid, r in items}
+        rows = [(int(user_id), mid, r, ts) for mid, r in latest.items()]
+        fut: Future = Future()
+        if not rows:
+            fut.set_result(0)
+            return fut
+        self._ensure_started()
+        self._queue.put((rows, fut))
+        return fut
+
+    def write(self, user_id: int, items: Iterable[Tuple[int, float]], timeout: float | None = 10.0) -> int:
+        """
+        blocking helper: submit and wait for the commit; raises CommitPending
+        if it has not committed (or failed) within `timeout`
+        """
+        fut = self.submit(user_id, items)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            raise CommitPending(fut) from None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rating-group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            n_rows = len(first[0])
+            #give concurrent requests a few ms to join this transaction
+            deadline = time.monotonic() + self.flush_interval
+            while n_rows < self.max_batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[List[Tuple[int, int, float, int]], Future]]) -> None:
+        #last write wins for a repeated (user, movie) within the group
+        merged: dict[Tuple[int, int], Tuple[int, int, float, int]] = {}
+        for rows, _ in batch:
+            for row in rows:
+                merged[(row[0], row[1])] = row
+
+        try:
+            with get_db(readonly=False) as conn:
+                write_ratings(conn.cursor(), merged.values())
+        except Exception:
+            #one bad submission must not fail everyone else in the group:
+            #retry each one in its own transaction
+            logger.exception("group commit failed for %d submissions; retrying individually", len(batch))
+            self._flush_individually(batch)
+            return
+
+        self.commits += 1
+        self.rows_written += len(merged)
+        self.submissions += len(batch)
+        for rows, fut in batch:
+            fut.set_result(len(rows))
+
+    def _flush_individually(self, batch: List[Tuple[List[Tuple[int, int, float, int]], Future]]) -> None:
+        for rows, fut in batch:
+            try:
+                with get_db(readonly=False) as conn:
+                    written = write_ratings(conn.cursor(), rows)
+                self.commits += 1
+                self.rows_written += written
+                self.submissions += 1
+                fut.set_result(written)
+            except Exception as ex:
+                self.failures += 1
+                fut.set_exception(ex)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "submissions": self.submissions,
+            "failures": self.failures,
+        }
+
+
+#shared writer for the whole process
+rating_writer = GroupCommitWriter()
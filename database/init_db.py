@@ -46,6 +46,36 @@ CREATE TABLE IF NOT EXISTS links (
     tmdb_id INTEGER,
     FOREIGN KEY (movie_id) REFERENCES movies(movie_id)
 );
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    n_ratings INTEGER NOT NULL DEFAULT 0,
+    rating_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at BIGINT NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_genre_stats (
+    user_id INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    n_ratings INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, genre)
+);
+CREATE TABLE IF NOT EXISTS user_recs (
+    engine TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    rec_rank INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (engine, user_id, rec_rank)
+);
+CREATE TABLE IF NOT EXISTS user_recs_runs (
+    engine TEXT PRIMARY KEY,
+    computed_at BIGINT NOT NULL,
+    top_n INTEGER NOT NULL,
+    n_users INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dataset_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
 CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id);
 CREATE INDEX IF NOT EXISTS idx_ratings_movie ON ratings(movie_id);
 CREATE INDEX IF NOT EXISTS idx_tags_movie ON tags(movie_id);
@@ -88,6 +118,36 @@ CREATE TABLE IF NOT EXISTS links (
     tmdb_id INTEGER,
     FOREIGN KEY (movie_id) REFERENCES movies(movie_id)
 );
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    n_ratings INTEGER NOT NULL DEFAULT 0,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_genre_stats (
+    user_id INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    n_ratings INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, genre)
+);
+CREATE TABLE IF NOT EXISTS user_recs (
+    engine TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    rec_rank INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (engine, user_id, rec_rank)
+);
+CREATE TABLE IF NOT EXISTS user_recs_runs (
+    engine TEXT PRIMARY KEY,
+    computed_at INTEGER NOT NULL,
+    top_n INTEGER NOT NULL,
+    n_users INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dataset_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
 CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id);
 CREATE INDEX IF NOT EXISTS idx_ratings_movie ON ratings(movie_id);
 CREATE INDEX IF NOT EXISTS idx_tags_movie ON tags(movie_id);
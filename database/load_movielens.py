@@ -1,18 +1,80 @@
+"""
+load_movielens.py
+streams the MovieLens CSVs into the database
+
+CSVs are read in chunks of LOAD_CHUNK_ROWS rows (bounded memory even for
+ml-25m) and written with the backend's native bulk path:
+- postgres: COPY ... FROM STDIN (csv) per chunk
+- sqlite:   executemany per chunk, with pragmas tuned for a bulk load
+
+tables are loaded by a small dependency scheduler (TABLES): parents before
+the tables referencing them, independent tables concurrently
+- postgres: every table is COPYed into an unlogged load_<table> copy, up to
+  LOAD_WORKERS at once, each on its own connection; one final transaction
+  then clears the live tables, copies the load tables in (INSERT ... SELECT),
+  rebuilds indexes and user stats, and the load tables are dropped (the
+  database needs room for a second copy of the dataset meanwhile)
+- sqlite:   one writer at a time anyway, so tables run one after another on a
+  single connection and the whole load (clear, insert, index rebuild, user
+  stats) is one transaction
+either way a failed import leaves the previous data and indexes as they were.
+secondary indexes are dropped before the inserts into the live tables and
+rebuilt once at the end.
+
+merge mode (merge_dataset, `--merge`) refreshes an existing database
+instead: the CSVs are staged into temp tables and only the inserted /
+changed / deleted rows are applied, in one transaction, followed by a
+database.events ChangeSet for caches and models.
+
+    python -m database.load_movielens data/ml-25m
+    python -m database.load_movielens data/ml-25m --merge
+"""
+
 from __future__ import annotations
+import io
+import os
 import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-import os
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-from database.connection import get_db
 
-#speed up bulk inserts with chunking and multi-row statements
-TO_SQL_KW = dict(chunksize=10_000, method="multi")
+from database.connection import get_db
+from database.paramstyle import PH
 
 #regex to extract year from titles like "Movie Title (1999)"
 YEAR_RE = re.compile(r"\((\d{4})\)$")
 IS_PG = bool(os.getenv("DATABASE_URL", "").strip())
 
+#rows per CSV chunk (and per COPY / executemany batch)
+CHUNK_ROWS = int(os.getenv("LOAD_CHUNK_ROWS", "500000"))
+#seconds between progress lines
+PROGRESS_EVERY_S = float(os.getenv("LOAD_PROGRESS_EVERY_S", "5"))
+#tables loaded concurrently on postgres (sqlite always loads one at a time)
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "3"))
+#postgres full loads COPY into <prefix><table> before the final swap
+LOAD_PREFIX = "load_"
+
+#secondary indexes dropped for the bulk load and rebuilt afterwards
+#(same definitions as database/init_db.py)
+BULK_INDEXES = {
+    "idx_ratings_user": "CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id)",
+    "idx_ratings_movie": "CREATE INDEX IF NOT EXISTS idx_ratings_movie ON ratings(movie_id)",
+    "idx_tags_movie": "CREATE INDEX IF NOT EXISTS idx_tags_movie ON tags(movie_id)",
+}
+
+#sqlite settings for the loading connection only (not persisted in the file)
+SQLITE_BULK_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",     # 256MB page cache
+    "PRAGMA foreign_keys = OFF",
+)
+
+
 #extract year from movie title string
 def parse_year(title: str) -> int | None:
     if not isinstance(title, str):
@@ -21,132 +83,528 @@ def parse_year(title: str) -> int | None:
     m = YEAR_RE.search(title.strip())
     return int(m.group(1)) if m else None
 
-#create sqlalchemy engine for postgres or sqlite
-def _engine():
-    #use postgres if DATABASE_URL is set
-    url = os.getenv("DATABASE_URL", "").strip()
-    if url:
-        return create_engine(url, future=True)
-    #fallback to sqlite
-    from database.connection import DB_PATH
-    return create_engine(f"sqlite:///{DB_PATH}", future=True)
+
+class Progress:
+    """prints rows and rows/s for one table every PROGRESS_EVERY_S seconds"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.rows = 0
+        self.t0 = self._last = time.perf_counter()
+
+    def add(self, n: int) -> None:
+        self.rows += n
+        now = time.perf_counter()
+        if now - self._last >= PROGRESS_EVERY_S:
+            self._last = now
+            print(f"  {self.label}: {self.rows:,} rows ({self.rows / (now - self.t0):,.0f} rows/s)", flush=True)
+
+    def done(self) -> None:
+        dt = max(time.perf_counter() - self.t0, 1e-9)
+        print(f"  {self.label}: {self.rows:,} rows in {dt:.1f}s ({self.rows / dt:,.0f} rows/s)", flush=True)
+
+
+def _read_chunks(csv: Path, **kw) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(csv, chunksize=CHUNK_ROWS, **kw)
+
+
+def _rows(df: pd.DataFrame) -> list[tuple]:
+    """plain python tuples (NaN/NA -> None) for executemany"""
+    cols = []
+    for name in df.columns:
+        col = df[name]
+        if col.hasnans:
+            cols.append(col.astype(object).where(col.notna(), None).tolist())
+        else:
+            cols.append(col.tolist())
+    return list(zip(*cols))
+
+
+def write_chunk(cur, table: str, df: pd.DataFrame) -> None:
+    """bulk-insert one chunk: COPY on postgres, executemany on sqlite"""
+    if df.empty:
+        return
+    cols = ", ".join(df.columns)
+    if IS_PG:
+        buf = io.StringIO()
+        #explicit NULL marker: with the csv default (an empty field) "" would load as NULL
+        df.to_csv(buf, index=False, header=False, na_rep="\\N")
+        buf.seek(0)
+        cur.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+    else:
+        marks = ", ".join("?" * len(df.columns))
+        cur.executemany(f"INSERT INTO {table} ({cols}) VALUES ({marks})", _rows(df))
+
+
+def _load(cur, table: str, chunks: Iterable[pd.DataFrame]) -> int:
+    progress = Progress(table)
+    for df in chunks:
+        write_chunk(cur, table, df)
+        progress.add(len(df))
+    progress.done()
+    return progress.rows
+
 
 #clear existing data from tables in FK-safe order
-def clear_tables(keep_users: bool = False) -> None:
+def clear_tables(keep_users: bool = False, cur=None) -> None:
     """
     clears data in FK-safe order.
     - postgres + keep_users=True: TRUNCATE child tables and reset identities, don't touch users.
     - otherwise: DELETE in FK-safe order. if keep_users=True, skip users.
+    pass cur to run inside the caller's transaction
     """
-    with get_db(readonly=False) as conn:
-        cur = conn.cursor()
-        #postgres supports TRUNCATE with CASCADE for fast cleanup
-        if IS_PG and keep_users:
-            #fast + resets sequences; relies on FKs to cascade where needed
-            cur.execute("TRUNCATE ratings, tags, links, movies RESTART IDENTITY CASCADE;")
-        else:
-            #sqlite (no TRUNCATE) or full clean seed (also wipe users)
-            #delete in FK-safe order: children first, then parents
-            order = ["ratings", "tags", "links", "movies"]
-            if not keep_users:
-                order.append("users")
-            for table in order:
-                cur.execute(f"DELETE FROM {table};")
+    if cur is None:
+        with get_db(readonly=False) as conn:
+            clear_tables(keep_users, conn.cursor())
+        return
+    #postgres supports TRUNCATE with CASCADE for fast cleanup
+    if IS_PG and keep_users:
+        #fast + resets sequences; relies on FKs to cascade where needed
+        cur.execute("TRUNCATE user_recs, user_recs_runs, ratings, tags, links, movies RESTART IDENTITY CASCADE;")
+    else:
+        #sqlite (no TRUNCATE) or full clean seed (also wipe users)
+        #delete in FK-safe order: children first, then parents
+        #(precomputed recs are derived data and would be stale after a reload)
+        order = ["user_recs", "user_recs_runs", "ratings", "tags", "links", "movies"]
+        if not keep_users:
+            order.append("users")
+        for table in order:
+            cur.execute(f"DELETE FROM {table};")
+
+
+def drop_indexes(cur) -> None:
+    for name in BULK_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def create_indexes(cur) -> None:
+    t0 = time.perf_counter()
+    for ddl in BULK_INDEXES.values():
+        cur.execute(ddl)
+    if not IS_PG:
+        cur.execute("ANALYZE")
+    print(f"  indexes: rebuilt {len(BULK_INDEXES)} in {time.perf_counter() - t0:.1f}s", flush=True)
+
+
+#movies.csv -> movie_id, title (year stripped), year, genres
+def movie_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    for df in _read_chunks(path / "movies.csv", dtype={"movieId": np.int64, "title": str, "genres": str}):
+        title = df["title"].str.strip()
+        year = title.str.extract(r"\((\d{4})\)$", expand=False)
+        yield pd.DataFrame({
+            "movie_id": df["movieId"],
+            "title": title.str.replace(r"\s*\(\d{4}\)\s*$", "", regex=True),
+            "year": pd.to_numeric(year).astype("Int64"),
+            "genres": df["genres"],
+        })
+
+
+#distinct userIds of ratings.csv -> user_id, username
+def user_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    #one pass over the userId column only; the distinct set is small
+    users = np.unique(np.concatenate([
+        np.unique(df["userId"].to_numpy())
+        for df in _read_chunks(path / "ratings.csv", usecols=["userId"], dtype={"userId": np.int64})
+    ] or [np.empty(0, dtype=np.int64)]))
+    for start in range(0, len(users), CHUNK_ROWS):
+        ids = pd.Series(users[start:start + CHUNK_ROWS])
+        #satisfy NOT NULL + UNIQUE constraints
+        yield pd.DataFrame({"user_id": ids, "username": "user_" + ids.astype(str)})
+
+
+#ratings.csv -> user_id, movie_id, rating, timestamp
+def rating_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    dtype = {"userId": np.int64, "movieId": np.int64, "rating": np.float64, "timestamp": np.int64}
+    for df in _read_chunks(path / "ratings.csv", dtype=dtype):
+        yield df.rename(columns={"movieId": "movie_id", "userId": "user_id"})
+
+
+#tags.csv (optional in some datasets) -> user_id, movie_id, tag, timestamp
+def tag_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    tags_csv = path / "tags.csv"
+    if not tags_csv.exists():
+        return
+    dtype = {"userId": np.int64, "movieId": np.int64, "tag": str, "timestamp": np.int64}
+    for df in _read_chunks(tags_csv, dtype=dtype, keep_default_na=False):
+        yield df.rename(columns={"movieId": "movie_id", "userId": "user_id"})
+
+
+#links.csv -> movie_id, imdb_id, tmdb_id
+def link_chunks(path: Path) -> Iterator[pd.DataFrame]:
+    dtype = {"movieId": np.int64, "imdbId": "Int64", "tmdbId": "Int64"}
+    for df in _read_chunks(path / "links.csv", dtype=dtype):
+        yield df.rename(columns={"movieId": "movie_id", "imdbId": "imdb_id", "tmdbId": "tmdb_id"})
+
+
+def reset_user_sequence(cur) -> None:
+    """move the postgres users identity past the loaded ids (no-op on sqlite)"""
+    if IS_PG:
+        cur.execute("""
+            SELECT setval(
+              pg_get_serial_sequence('users','user_id'),
+              COALESCE((SELECT MAX(user_id) FROM users), 1),
+              true
+            )
+        """)
+
+
+def _renew_meta_id(cur, key: str) -> str:
+    import uuid
+    value = uuid.uuid4().hex
+    cur.execute(f"DELETE FROM dataset_meta WHERE key = {PH}", (key,))
+    cur.execute(f"INSERT INTO dataset_meta (key, value) VALUES ({PH}, {PH})", (key, value))
+    return value
+
+
+def set_load_id(cur) -> str:
+    """
+    renew dataset_meta.load_id after a full load; caches of whole tables
+    (recommender.snapshot) treat a new id as "everything changed"
+    """
+    return _renew_meta_id(cur, "load_id")
+
+
+def set_catalog_id(cur) -> str:
+    """
+    renew dataset_meta.catalog_id whenever the movies table changes (full
+    load, or a merge touching movies); model artifacts fit against another
+    catalog are not loaded (recommender.artifacts)
+    """
+    return _renew_meta_id(cur, "catalog_id")
+
 
 #load movies.csv into movies table
-def load_movies(path: Path, eng) -> None:
-    df = pd.read_csv(path / "movies.csv")
-    df["year"] = df["title"].apply(parse_year)
-    df["title"] = df["title"].apply(lambda t: re.sub(r"\s*\(\d{4}\)\s*$", "", t) if isinstance(t, str) else t)
-    df.rename(columns={"movieId": "movie_id"}, inplace=True)
-    df = df[["movie_id", "title", "year", "genres"]]
-
-    df.to_sql(
-        "movies",
-        eng,
-        if_exists="append",
-        index=False,
-        **TO_SQL_KW   # ← use ONLY this
-    )
+def load_movies(path: Path, cur, table: str = "movies") -> int:
+    return _load(cur, table, movie_chunks(path))
+
 
 #build users table from distinct user_ids in ratings.csv
-def load_users_from_ratings(path: Path, eng) -> None:
-    #read only userId column from ratings CSV
-    df = pd.read_csv(path / "ratings.csv", usecols=["userId"])
-    #get unique user IDs
-    users = df["userId"].drop_duplicates().astype(int)
-
-    #create users dataframe with generated usernames
-    users_df = pd.DataFrame({
-        "user_id": users,
-        "username": users.map(lambda x: f"user_{x}")  #satisfy NOT NULL + UNIQUE constraints
-    })
-
-    #bulk insert users into database
-    TO_SQL_KW = {"chunksize": 10_000, "method": "multi"}
-    users_df.to_sql("users", eng, if_exists="append", index=False, **TO_SQL_KW)
-
-    #reset postgres sequence to prevent future ID collisions
-    if IS_PG:
-        with eng.begin() as conn:
-            conn.execute(text("""
-                SELECT setval(
-                  pg_get_serial_sequence('users','user_id'),
-                  COALESCE((SELECT MAX(user_id) FROM users), 1),
-                  true
-                )
-            """))
+def load_users_from_ratings(path: Path, cur, table: str = "users") -> int:
+    n = _load(cur, table, user_chunks(path))
+    if table == "users":
+        #reset postgres sequence to prevent future ID collisions
+        reset_user_sequence(cur)
+    return n
+
 
 #load ratings.csv into ratings table
-def load_ratings(path: Path, eng) -> None:
-    #read ratings CSV file
-    df = pd.read_csv(path / "ratings.csv")
-    #rename columns to match database schema
-    df.rename(columns={"movieId": "movie_id", "userId": "user_id"}, inplace=True)
-    #bulk insert into database
-    df.to_sql("ratings", eng, if_exists="append", index=False, **TO_SQL_KW)
+def load_ratings(path: Path, cur, table: str = "ratings") -> int:
+    return _load(cur, table, rating_chunks(path))
+
 
 #load tags.csv into tags table if file exists
-def load_tags(path: Path, eng) -> None:
-    tags_csv = path / "tags.csv"
-    #tags.csv is optional in some datasets
-    if not tags_csv.exists():
-        return
-    #read tags CSV file
-    df = pd.read_csv(tags_csv)
-    #rename columns to match database schema
-    df.rename(columns={"movieId": "movie_id", "userId": "user_id"}, inplace=True)
-    #bulk insert into database
-    df.to_sql("tags", eng, if_exists="append", index=False, **TO_SQL_KW)
+def load_tags(path: Path, cur, table: str = "tags") -> int:
+    return _load(cur, table, tag_chunks(path))
+
 
 #load links.csv into links table (contains IMDb and TMDb IDs)
-def load_links(path: Path, eng) -> None:
-    #read links CSV file
-    df = pd.read_csv(path / "links.csv")
-    #rename columns to match database schema
-    df.rename(columns={"movieId": "movie_id", "imdbId": "imdb_id", "tmdbId": "tmdb_id"}, inplace=True)
-    #bulk insert into database
-    df.to_sql("links", eng, if_exists="append", index=False, **TO_SQL_KW)
+def load_links(path: Path, cur, table: str = "links") -> int:
+    return _load(cur, table, link_chunks(path))
+
+
+#table -> (loader, tables it references); see schedule()
+TABLES = {
+    "movies": (load_movies, ()),
+    "users": (load_users_from_ratings, ()),
+    "ratings": (load_ratings, ("movies", "users")),
+    "tags": (load_tags, ("movies",)),
+    "links": (load_links, ("movies",)),
+}
+
+
+def schedule(tasks: Dict[str, Tuple[Callable[[], object], Iterable[str]]], workers: int = 1) -> List[str]:
+    """
+    run name -> (fn, deps) tasks, each once all its deps finished and at most
+    `workers` at a time; returns names in completion order
+    the first failure stops scheduling new tasks and is re-raised
+    """
+    missing = {d for _, deps in tasks.values() for d in deps} - set(tasks)
+    if missing:
+        raise ValueError(f"unknown dependencies: {sorted(missing)}")
+    pending = {name: (fn, set(deps)) for name, (fn, deps) in tasks.items()}
+    done: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="load") as pool:
+        running = {}
+        while pending or running:
+            for name in [n for n, (_, deps) in pending.items() if deps <= set(done)]:
+                running[pool.submit(pending.pop(name)[0])] = name
+            if not running:
+                raise ValueError(f"dependency cycle between: {sorted(pending)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                fut.result()
+                done.append(name)
+    return done
+
+
+def _table_task(loader, src: Path, table: str, cur=None) -> Callable[[], int]:
+    """run loader on the shared cursor, or on a connection of its own"""
+    if cur is not None:
+        return lambda: loader(src, cur, table)
+
+    def run():
+        with get_db(readonly=False) as conn:
+            return loader(src, conn.cursor(), table)
+    return run
+
+
+def load_tables(src: Path, keep_users: bool = False, cur=None, prefix: str = "") -> List[str]:
+    """
+    load every table in TABLES in dependency order, into <prefix><table>
+    with cur: sequentially inside the caller's transaction
+    without: concurrently (LOAD_WORKERS), one connection and commit per table
+    (load tables have no foreign keys, so with a prefix nothing waits on a parent)
+    """
+    names = [t for t in TABLES if not (keep_users and t == "users")]
+    tasks = {
+        name: (_table_task(TABLES[name][0], src, f"{prefix}{name}", cur),
+               [] if prefix else [d for d in TABLES[name][1] if d in names])
+        for name in names
+    }
+    return schedule(tasks, workers=1 if cur is not None else LOAD_WORKERS)
+
+
+def create_load_tables(cur, names: Iterable[str]) -> None:
+    """empty unlogged <LOAD_PREFIX><table> copies (columns and NOT NULLs, no keys) - postgres only"""
+    for name in names:
+        cur.execute(f"DROP TABLE IF EXISTS {LOAD_PREFIX}{name}")
+        cur.execute(f"CREATE UNLOGGED TABLE {LOAD_PREFIX}{name} (LIKE {name} INCLUDING DEFAULTS)")
+
+
+def drop_load_tables(cur, names: Iterable[str]) -> None:
+    for name in names:
+        cur.execute(f"DROP TABLE IF EXISTS {LOAD_PREFIX}{name}")
+
+
+def swap_in_load_tables(cur, names: List[str]) -> None:
+    """copy the load tables into the (cleared) live tables, parents first"""
+    t0 = time.perf_counter()
+    for name in TABLES:
+        if name in names:
+            cur.execute(f"INSERT INTO {name} SELECT * FROM {LOAD_PREFIX}{name}")
+    reset_user_sequence(cur)
+    print(f"  swap: copied {len(names)} tables in {time.perf_counter() - t0:.1f}s", flush=True)
+
+
+#merge mode: table -> (key columns, compared value columns, chunk source), parents first
+MERGE_TABLES = {
+    "movies": (("movie_id",), ("title", "year", "genres"), movie_chunks),
+    "users": (("user_id",), ("username",), user_chunks),
+    "ratings": (("user_id", "movie_id"), ("rating", "timestamp"), rating_chunks),
+    "tags": (("user_id", "movie_id", "tag", "timestamp"), (), tag_chunks),
+    "links": (("movie_id",), ("imdb_id", "tmdb_id"), link_chunks),
+}
+#accounts are never renamed or removed by a dataset merge
+MERGE_INSERT_ONLY = {"users"}
+#column types of the staging tables (names both backends accept)
+STAGE_TYPES = {
+    "movie_id": "INTEGER", "user_id": "INTEGER", "title": "TEXT", "year": "INTEGER",
+    "genres": "TEXT", "username": "TEXT", "rating": "DOUBLE PRECISION", "timestamp": "BIGINT",
+    "tag": "TEXT", "imdb_id": "INTEGER", "tmdb_id": "INTEGER",
+}
+
+
+def _same(a: str, b: str) -> str:
+    """NULL-safe equality"""
+    return f"{a} IS NOT DISTINCT FROM {b}" if IS_PG else f"{a} IS {b}"
+
+
+def _match(keys, a: str, b: str) -> str:
+    return " AND ".join(f"{a}.{k} = {b}.{k}" for k in keys)
+
+
+def stage_table(cur, path: Path, table: str) -> int:
+    """stream one CSV into the temp table stage_<table> (indexed on its key)"""
+    keys, values, source = MERGE_TABLES[table]
+    cols = keys + values
+    cur.execute(f"DROP TABLE IF EXISTS stage_{table}")
+    cur.execute(f"CREATE TEMP TABLE stage_{table} ({', '.join(f'{c} {STAGE_TYPES[c]}' for c in cols)})")
+    n = _load(cur, f"stage_{table}", (df[list(cols)] for df in source(path)))
+    cur.execute(f"CREATE INDEX stage_{table}_key ON stage_{table} ({', '.join(keys)})")
+    return n
+
+
+def _delta(cur, table: str) -> None:
+    """materialize d_ins_/d_upd_/d_del_<table> from stage_<table> vs the live table"""
+    keys, values, _ = MERGE_TABLES[table]
+    for kind in ("ins", "upd", "del"):
+        cur.execute(f"DROP TABLE IF EXISTS d_{kind}_{table}")
+    cur.execute(f"""
+        CREATE TEMP TABLE d_ins_{table} AS
+        SELECT s.* FROM stage_{table} s
+        WHERE NOT EXISTS (SELECT 1 FROM {table} x WHERE {_match(keys, "x", "s")})
+    """)
+    if values and table not in MERGE_INSERT_ONLY:
+        unchanged = " AND ".join(_same(f"x.{v}", f"s.{v}") for v in values)
+        cur.execute(f"""
+            CREATE TEMP TABLE d_upd_{table} AS
+            SELECT s.* FROM stage_{table} s
+            JOIN {table} x ON {_match(keys, "x", "s")}
+            WHERE NOT ({unchanged})
+        """)
+    else:
+        cur.execute(f"CREATE TEMP TABLE d_upd_{table} AS SELECT * FROM stage_{table} WHERE 1 = 0")
+    if table in MERGE_INSERT_ONLY:
+        scope = "AND 1 = 0"
+    elif table == "ratings":
+        #ratings of accounts that are not in the dataset (app signups) stay,
+        #unless the movie they point at is going away
+        scope = """AND (x.user_id IN (SELECT user_id FROM stage_users)
+                        OR x.movie_id IN (SELECT movie_id FROM d_del_movies))"""
+    else:
+        scope = ""
+    cur.execute(f"""
+        CREATE TEMP TABLE d_del_{table} AS
+        SELECT {', '.join(f'x.{k}' for k in keys)} FROM {table} x
+        WHERE NOT EXISTS (SELECT 1 FROM stage_{table} s WHERE {_match(keys, "x", "s")})
+        {scope}
+    """)
+
+
+def _count(cur, table: str) -> int:
+    cur.execute(f"SELECT COUNT(*) FROM {table}")
+    return int(cur.fetchone()[0])
+
+
+def _ids(cur, sql: str) -> set:
+    cur.execute(sql)
+    return {int(r[0]) for r in cur.fetchall()}
+
+
+def merge_dataset(data_path, publish_events: bool = True):
+    """
+    bring the database in line with the CSVs under data_path by applying only
+    the differences, in one transaction (readers keep seeing the old data
+    until it commits):
+    - every CSV is staged into a temp table, then diffed against the live
+      table by key (MERGE_TABLES) into inserted / changed / deleted rows
+    - deletes run children first, updates and inserts parents first
+    - users are only ever added; ratings of users absent from ratings.csv
+      (accounts created in the app) are kept
+    - user_stats is rebuilt for the affected users only
+    returns the ChangeSet, which is published to database.events subscribers
+    once committed
+    """
+    from database.events import ChangeSet, publish
+    from database.user_stats import rebuild_user_stats
+
+    src = Path(data_path)
+    if not (src / "movies.csv").exists():
+        raise FileNotFoundError(f"Could not find movies.csv under {src}. Did you unzip the dataset?")
+
+    t0 = time.perf_counter()
+    changes = ChangeSet(source=f"merge:{src}")
+    with get_db(readonly=False) as conn:
+        cur = conn.cursor()
+        for table in MERGE_TABLES:
+            stage_table(cur, src, table)
+        #all deltas are computed against the untouched tables, parents first
+        #(the ratings scope needs d_del_movies)
+        for table in MERGE_TABLES:
+            _delta(cur, table)
+
+        for table in MERGE_TABLES:
+            for kind, label in (("ins", "inserted"), ("upd", "updated"), ("del", "deleted")):
+                changes.count(table, label, _count(cur, f"d_{kind}_{table}"))
+        changes.movie_ids = set().union(*(
+            _ids(cur, f"SELECT movie_id FROM d_{kind}_movies") for kind in ("ins", "upd", "del")
+        ))
+        changes.user_ids = set().union(*(
+            _ids(cur, f"SELECT DISTINCT user_id FROM d_{kind}_ratings") for kind in ("ins", "upd", "del")
+        ))
+        #genre changes shift the genre stats of everyone who rated the movie
+        regenred = _ids(cur, f"""
+            SELECT DISTINCT r.user_id FROM ratings r
+            JOIN movies m ON m.movie_id = r.movie_id
+            JOIN d_upd_movies d ON d.movie_id = m.movie_id
+            WHERE NOT ({_same("m.genres", "d.genres")})
+        """)
+
+        for table in reversed(MERGE_TABLES):
+            keys = MERGE_TABLES[table][0]
+            cur.execute(f"DELETE FROM {table} WHERE EXISTS (SELECT 1 FROM d_del_{table} d WHERE {_match(keys, 'd', table)})")
+        cur.execute("DELETE FROM user_recs WHERE movie_id IN (SELECT movie_id FROM d_del_movies)")
+        for table, (keys, values, _) in MERGE_TABLES.items():
+            cols = keys + values
+            if values and changes.tables[table]["updated"]:
+                sets = ", ".join(f"{v} = d.{v}" for v in values)
+                cur.execute(f"UPDATE {table} SET {sets} FROM d_upd_{table} d WHERE {_match(keys, 'd', table)}")
+            cur.execute(f"INSERT INTO {table} ({', '.join(cols)}) SELECT {', '.join(cols)} FROM d_ins_{table}")
+        reset_user_sequence(cur)
+
+        rebuild_user_stats(cur, user_ids=changes.user_ids | regenred)
+        if changes.movie_ids:
+            set_catalog_id(cur)
+        for table in MERGE_TABLES:
+            for name in (f"stage_{table}", f"d_ins_{table}", f"d_upd_{table}", f"d_del_{table}"):
+                cur.execute(f"DROP TABLE IF EXISTS {name}")
+
+    for table, c in changes.tables.items():
+        print(f"  {table}: +{c['inserted']:,} ~{c['updated']:,} -{c['deleted']:,}")
+    print(f"Merged MovieLens in {time.perf_counter() - t0:.1f}s")
+    if publish_events:
+        publish(changes)
+    return changes
+
 
 #main entry point to load all MovieLens CSV files into database
-def main(data_path, keep_users: bool = False) -> None:
+def main(data_path, keep_users: bool = False, merge: bool = False) -> None:
+    if merge:
+        #incremental refresh: apply only the differences, no clear
+        merge_dataset(data_path)
+        return
     src = Path(data_path)
     #validate dataset directory exists
     if not (src / "movies.csv").exists():
         raise FileNotFoundError(f"Could not find movies.csv under {src}. Did you unzip the dataset?")
 
-    #create database engine
-    eng = _engine()
-
-    #clear old data with the chosen strategy
-    clear_tables(keep_users=keep_users)
-
-    #load CSV files in FK-safe order (parents before children)
-    load_movies(src, eng)
-    if not keep_users:
-        #only rebuild users from ratings when doing a clean seed
-        load_users_from_ratings(src, eng)
-    load_ratings(src, eng)
-    load_tags(src, eng)
-    load_links(src, eng)
-    print("Loaded MovieLens")
+    from database.user_stats import rebuild_user_stats
+
+    t0 = time.perf_counter()
+    if IS_PG:
+        #users are only rebuilt from ratings when doing a clean seed
+        names = [t for t in TABLES if not (keep_users and t == "users")]
+        try:
+            with get_db(readonly=False) as conn:
+                create_load_tables(conn.cursor(), names)
+            #concurrent COPYs into the load tables; the live tables are untouched so far
+            load_tables(src, keep_users=keep_users, prefix=LOAD_PREFIX)
+            #the only transaction that changes live data: a failure rolls all of it back
+            with get_db(readonly=False) as conn:
+                cur = conn.cursor()
+                clear_tables(keep_users=keep_users, cur=cur)
+                drop_indexes(cur)
+                swap_in_load_tables(cur, names)
+                create_indexes(cur)
+                rebuild_user_stats(cur)
+                set_load_id(cur)
+                set_catalog_id(cur)
+        finally:
+            with get_db(readonly=False) as conn:
+                drop_load_tables(conn.cursor(), names)
+    else:
+        with get_db(readonly=False) as conn:
+            cur = conn.cursor()
+            for pragma in SQLITE_BULK_PRAGMAS:
+                cur.execute(pragma)
+            clear_tables(keep_users=keep_users, cur=cur)
+            drop_indexes(cur)
+            load_tables(src, keep_users=keep_users, cur=cur)
+            create_indexes(cur)
+            #derived per-user stats are rebuilt in bulk rather than row by row
+            rebuild_user_stats(cur)
+            set_load_id(cur)
+            set_catalog_id(cur)
+    print(f"Loaded MovieLens in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load MovieLens CSVs into the database.")
+    parser.add_argument("data_path", help="directory with movies.csv, ratings.csv, ...")
+    parser.add_argument("--keep-users", action="store_true", help="full reload that keeps the users table")
+    parser.add_argument("--merge", action="store_true", help="apply only the differences instead of clear-and-reload")
+    args = parser.parse_args()
+    main(args.data_path, keep_users=args.keep_users, merge=args.merge)
@@ -0,0 +1,310 @@
+"""
+query_log.py
+statement timing for every query that goes through get_db (and the
+sqlalchemy engines used by the pandas loaders)
+
+- per-statement latency + count exported through metrics.registry
+- normalized SQL fingerprints (literals / placeholders / IN lists collapsed)
+  with process-wide totals, see top_fingerprints()
+- per-request counters on flask.g, see request_summary(); count_queries()
+  gives the same counters for any block of code (benchmarks, scripts)
+- slow-query log: statements slower than DB_SLOW_QUERY_MS are logged with
+  their fingerprint on the "database.slow" logger
+
+set DB_INSTRUMENT=0 to hand out raw connections instead
+"""
+
+from __future__ import annotations
+import os
+import re
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+
+from memory import accountant
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("database.slow")
+
+DB_INSTRUMENT = os.getenv("DB_INSTRUMENT", "1").strip().lower() not in ("0", "false", "no", "off")
+#statements slower than this (ms) go to the slow-query log
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+#warn when one request issues more queries than this (0 disables)
+QUERY_WARN_COUNT = int(os.getenv("DB_QUERY_WARN_COUNT", "50"))
+
+QUERY_LATENCY = registry.histogram(
+    "db_query_duration_seconds", "SQL statement latency in seconds.", ["op"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+QUERIES = registry.counter("db_queries_total", "SQL statements executed.", ["op"])
+SLOW_QUERIES = registry.counter("db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS.", ["op"])
+REQUEST_QUERIES = registry.histogram(
+    "db_queries_per_request", "SQL statements issued per HTTP request.", [],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 500, 1000),
+)
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%s|%\(\w+\)s|\?|:\w+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_RE = re.compile(r"(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+", re.I)
+_SPACE_RE = re.compile(r"\s+")
+
+# fingerprint -> [count, total_seconds, max_seconds]
+_totals: dict[str, list] = {}
+_totals_lock = threading.Lock()
+#counters of the innermost count_queries() block in this context
+_scope: contextvars.ContextVar = contextvars.ContextVar("db_query_scope", default=None)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """
+    normalize a statement so calls that differ only in literals share a key:
+    "SELECT * FROM t WHERE id IN (%s,%s,%s) AND x = 'a'" -> "SELECT * FROM t WHERE id IN (...) AND x = ?"
+    """
+    s = _COMMENT_RE.sub(" ", str(sql))
+    s = _STRING_RE.sub("?", s)
+    s = _PARAM_RE.sub("?", s)
+    s = _NUMBER_RE.sub("?", s)
+    s = _IN_LIST_RE.sub("(...)", s)
+    s = _VALUES_RE.sub(r"\1, ...", s)
+    return _SPACE_RE.sub(" ", s).strip().rstrip(";").strip()
+
+
+def _op(fp: str) -> str:
+    word = fp.split(" ", 1)[0].upper() if fp else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "DROP", "PRAGMA", "COPY") else "OTHER"
+
+
+def _request_stats():
+    """the current request's counters, or None outside a request"""
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    stats = g.get("_db_stats")
+    if stats is None:
+        stats = g._db_stats = {"queries": 0, "seconds": 0.0, "fingerprints": {}}
+    return stats
+
+
+def record(sql, seconds: float) -> None:
+    fp = fingerprint(sql if isinstance(sql, str) else str(sql))
+    op = _op(fp)
+    QUERY_LATENCY.observe(seconds, op=op)
+    QUERIES.inc(op=op)
+
+    with _totals_lock:
+        row = _totals.get(fp)
+        if row is None:
+            row = _totals[fp] = [0, 0.0, 0.0]
+        row[0] += 1
+        row[1] += seconds
+        row[2] = max(row[2], seconds)
+
+    for stats in (_request_stats(), _scope.get()):
+        if stats is not None:
+            stats["queries"] += 1
+            stats["seconds"] += seconds
+            stats["fingerprints"][fp] = stats["fingerprints"].get(fp, 0) + 1
+
+    if seconds * 1000.0 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(op=op)
+        slow_logger.warning("slow query %.1fms%s: %s", seconds * 1000.0, _where(), fp[:500])
+
+
+def _where() -> str:
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return f" [{request.method} {request.path}]"
+    except ImportError:
+        pass
+    return ""
+
+
+def request_summary() -> dict | None:
+    """{"queries", "seconds", "fingerprints"} for the current request (None outside one)"""
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    return g.get("_db_stats")
+
+
+@contextmanager
+def count_queries():
+    """
+    {"queries", "seconds", "fingerprints"} of the statements this thread /
+    context runs while the block is open (needs DB_INSTRUMENT)
+    """
+    stats = {"queries": 0, "seconds": 0.0, "fingerprints": {}}
+    token = _scope.set(stats)
+    try:
+        yield stats
+    finally:
+        _scope.reset(token)
+
+
+def finish_request() -> None:
+    """
+    called from request teardown: records the per-request query count and
+    warns about requests over QUERY_WARN_COUNT (typically an N+1 loop)
+    """
+    stats = request_summary()
+    n = stats["queries"] if stats else 0
+    REQUEST_QUERIES.observe(n)
+    if QUERY_WARN_COUNT and n > QUERY_WARN_COUNT:
+        top = sorted(stats["fingerprints"].items(), key=lambda kv: -kv[1])[:3]
+        logger.warning(
+            "request issued %d queries (%.1fms in SQL)%s; most repeated: %s",
+            n, stats["seconds"] * 1000.0, _where(),
+            "; ".join(f"{c}x {fp[:120]}" for fp, c in top),
+        )
+
+
+def top_fingerprints(n: int = 20, by: str = "total") -> list[dict]:
+    """process-wide statement totals, heaviest first (by 'total', 'count' or 'max')"""
+    idx = {"count": 0, "total": 1, "max": 2}[by]
+    with _totals_lock:
+        rows = [(fp, list(v)) for fp, v in _totals.items()]
+    rows.sort(key=lambda r: -r[1][idx])
+    return [
+        {
+            "fingerprint": fp,
+            "count": v[0],
+            "total_ms": round(v[1] * 1000.0, 3),
+            "avg_ms": round(v[1] / v[0] * 1000.0, 3) if v[0] else 0.0,
+            "max_ms": round(v[2] * 1000.0, 3),
+        }
+        for fp, v in rows[:n]
+    ]
+
+
+def _memory_usage() -> dict:
+    from memory import sizeof
+    with _totals_lock:
+        return {"bytes": sizeof(_totals), "items": len(_totals)}
+
+
+accountant.register("query_fingerprints", "stats", _memory_usage)
+
+
+# ------------------------------
+# DB-API proxies
+# ------------------------------
+class InstrumentedCursor:
+    __slots__ = ("_cur",)
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.execute(sql, *args, **kwargs)
+        finally:
+            record(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.executemany(sql, *args, **kwargs)
+        finally:
+            record(sql, time.perf_counter() - t0)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        if name in InstrumentedCursor.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cur, name, value)
+
+    @property
+    def __class__(self):
+        # isinstance / __class__.__module__ checks see the driver's cursor type
+        return self._cur.__class__
+
+
+class InstrumentedConnection:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, sql, *args, **kwargs):
+        # sqlite3 shortcut; returns a plain cursor
+        t0 = time.perf_counter()
+        try:
+            return self._conn.execute(sql, *args, **kwargs)
+        finally:
+            record(sql, time.perf_counter() - t0)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in InstrumentedConnection.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    @property
+    def __class__(self):
+        # keeps conn.__class__.__module__ backend checks and pandas' sqlite detection working
+        return self._conn.__class__
+
+
+def instrument(conn):
+    return InstrumentedConnection(conn) if DB_INSTRUMENT else conn
+
+
+def instrument_engine(engine):
+    """time statements run through a sqlalchemy engine (pandas loaders)"""
+    if not DB_INSTRUMENT:
+        return engine
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["_query_t0"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = conn.info.pop("_query_t0", None)
+        if t0 is not None:
+            record(statement, time.perf_counter() - t0)
+
+    return engine
@@ -0,0 +1,201 @@
+"""
+user_stats.py
+incrementally maintained per-user rating statistics
+
+user_stats holds (count, sum, updated_at) per user and user_genre_stats holds
+per-genre rating counts, so the stats endpoints read a handful of rows instead
+of aggregating (and genre-splitting) the user's whole rating history
+
+- apply_rating_changes() is called inside the rating write path, on the same
+  cursor/transaction as the write itself
+- rebuild_user_stats() recomputes everything (or a set of users) in bulk and is
+  used by the loader and the profile JSON sync
+"""
+
+from __future__ import annotations
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from database.connection import get_db
+from database.paramstyle import PH, ph_list
+
+NO_GENRE = "(no genres listed)"
+
+
+def genre_tokens(genres: Optional[str]) -> List[str]:
+    """split a pipe-separated genres field the same way the stats page always has"""
+    if not genres:
+        return []
+    return [g for g in str(genres).split("|") if g and g != NO_GENRE]
+
+
+def _movie_genres(cur, movie_ids: Iterable[int]) -> Dict[int, List[str]]:
+    ids = sorted({int(m) for m in movie_ids})
+    if not ids:
+        return {}
+    cur.execute(f"SELECT movie_id, genres FROM movies WHERE movie_id IN ({ph_list(len(ids))})", ids)
+    return {int(mid): genre_tokens(genres) for mid, genres in cur.fetchall()}
+
+
+def apply_rating_changes(
+    cur,
+    removed: Sequence[Tuple[int, int, float]] = (),
+    added: Sequence[Tuple[int, int, float]] = (),
+) -> None:
+    """
+    fold (user_id, movie_id, rating) rows that left / entered the ratings table
+    into the stored stats; runs on the caller's cursor so it commits (or rolls
+    back) together with the rating write
+    """
+    if not removed and not added:
+        return
+
+    genres = _movie_genres(cur, [m for _, m, _ in removed] + [m for _, m, _ in added])
+    count_delta: Dict[int, int] = defaultdict(int)
+    sum_delta: Dict[int, float] = defaultdict(float)
+    genre_delta: Dict[Tuple[int, str], int] = defaultdict(int)
+
+    for sign, rows in ((-1, removed), (1, added)):
+        for user_id, movie_id, rating in rows:
+            uid = int(user_id)
+            count_delta[uid] += sign
+            sum_delta[uid] += sign * float(rating)
+            for g in genres.get(int(movie_id), []):
+                genre_delta[(uid, g)] += sign
+
+    now = int(time.time())
+    cur.executemany(
+        f"""
+        INSERT INTO user_stats (user_id, n_ratings, rating_sum, updated_at)
+        VALUES ({PH}, {PH}, {PH}, {PH})
+        ON CONFLICT (user_id) DO UPDATE SET
+            n_ratings = user_stats.n_ratings + excluded.n_ratings,
+            rating_sum = user_stats.rating_sum + excluded.rating_sum,
+            updated_at = excluded.updated_at
+        """,
+        [(uid, count_delta[uid], sum_delta[uid], now) for uid in count_delta],
+    )
+
+    changed = [(uid, g, n) for (uid, g), n in genre_delta.items() if n != 0]
+    if changed:
+        cur.executemany(
+            f"""
+            INSERT INTO user_genre_stats (user_id, genre, n_ratings)
+            VALUES ({PH}, {PH}, {PH})
+            ON CONFLICT (user_id, genre) DO UPDATE SET
+                n_ratings = user_genre_stats.n_ratings + excluded.n_ratings
+            """,
+            changed,
+        )
+        cur.executemany(
+            f"DELETE FROM user_genre_stats WHERE user_id = {PH} AND genre = {PH} AND n_ratings <= 0",
+            [(uid, g) for uid, g, _ in changed],
+        )
+
+
+def rebuild_user_stats(cur=None, user_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    recompute stats from the ratings table in bulk
+    pass user_ids to limit the rebuild to those users (e.g. after a profile sync)
+    """
+    if cur is None:
+        with get_db(readonly=False) as conn:
+            rebuild_user_stats(conn.cursor(), user_ids)
+        return
+
+    ids = None if user_ids is None else sorted({int(u) for u in user_ids})
+    if ids is not None and not ids:
+        return
+    where = where_r = ""
+    if ids is not None:
+        #the user set can be large (dataset merges): scope through a temp table, not an IN list
+        cur.execute("DROP TABLE IF EXISTS tmp_stat_users")
+        cur.execute("CREATE TEMP TABLE tmp_stat_users (user_id INTEGER PRIMARY KEY)")
+        cur.executemany(f"INSERT INTO tmp_stat_users (user_id) VALUES ({PH})", [(u,) for u in ids])
+        where = "WHERE user_id IN (SELECT user_id FROM tmp_stat_users)"
+        where_r = "WHERE r.user_id IN (SELECT user_id FROM tmp_stat_users)"
+    now = int(time.time())
+
+    cur.execute(f"DELETE FROM user_stats {where}")
+    cur.execute(f"DELETE FROM user_genre_stats {where}")
+    cur.execute(
+        f"""
+        INSERT INTO user_stats (user_id, n_ratings, rating_sum, updated_at)
+        SELECT user_id, COUNT(*), SUM(rating), {PH}
+        FROM ratings
+        {where}
+        GROUP BY user_id
+        """,
+        (now,),
+    )
+
+    #genre splitting happens once per movie in python; the per-user
+    #aggregation is a plain join + GROUP BY in the database
+    cur.execute("DROP TABLE IF EXISTS tmp_movie_genres")
+    cur.execute("CREATE TEMP TABLE tmp_movie_genres (movie_id INTEGER NOT NULL, genre TEXT NOT NULL)")
+    movie_scope = ""
+    if ids is not None:
+        #a scoped rebuild only needs the movies its users rated, not the whole catalog
+        movie_scope = """AND movie_id IN (SELECT movie_id FROM ratings
+                                          WHERE user_id IN (SELECT user_id FROM tmp_stat_users))"""
+    cur.execute(f"SELECT movie_id, genres FROM movies WHERE genres IS NOT NULL {movie_scope}")
+    pairs = [(int(mid), g) for mid, genres in cur.fetchall() for g in genre_tokens(genres)]
+    if pairs:
+        cur.executemany(f"INSERT INTO tmp_movie_genres (movie_id, genre) VALUES ({PH}, {PH})", pairs)
+    cur.execute(
+        f"""
+        INSERT INTO user_genre_stats (user_id, genre, n_ratings)
+        SELECT r.user_id, g.genre, COUNT(*)
+        FROM ratings r
+        JOIN tmp_movie_genres g ON g.movie_id = r.movie_id
+        {where_r}
+        GROUP BY r.user_id, g.genre
+        """
+    )
+    cur.execute("DROP TABLE tmp_movie_genres")
+    if ids is not None:
+        cur.execute("DROP TABLE tmp_stat_users")
+
+
+def ensure_user_stats() -> None:
+    """backfill the stats tables once for databases created before they existed"""
+    with get_db(readonly=False) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM user_stats LIMIT 1")
+        if cur.fetchone() is not None:
+            return
+        cur.execute("SELECT 1 FROM ratings LIMIT 1")
+        if cur.fetchone() is None:
+            return
+        rebuild_user_stats(cur)
+
+
+def read_user_stats(user_id: int, top_n: int = 5) -> dict:
+    """O(1) read of a user's stored stats"""
+    with get_db(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT n_ratings, rating_sum FROM user_stats WHERE user_id = {PH}",
+            (user_id,),
+        )
+        row = cur.fetchone()
+        cur.execute(
+            f"""
+            SELECT genre, n_ratings
+            FROM user_genre_stats
+            WHERE user_id = {PH} AND n_ratings > 0
+            ORDER BY n_ratings DESC, genre ASC
+            LIMIT {PH}
+            """,
+            (user_id, top_n),
+        )
+        genre_rows = cur.fetchall()
+
+    total = int(row[0]) if row else 0
+    average = float(row[1]) / total if total > 0 else 0.0
+    return {
+        "total_ratings": total,
+        "average_rating": average,
+        "top_genres": [{"genre": g, "count": int(n)} for g, n in genre_rows],
+    }
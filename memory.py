@@ -0,0 +1,230 @@
+# memory.py
+"""
+Byte accounting for the big in-memory structures of a worker process.
+
+Components register a size function (and optionally an evictor) with the
+shared `accountant`:
+
+    from memory import accountant
+    accountant.register("cache", "cache", cache.memory_usage)
+    accountant.register_evictor("cache", cache.evict_bytes, priority=10)
+
+report() lists every structure with its private bytes and file-backed
+(memory-mapped) bytes next to the process RSS; /api/admin/memory and
+scripts/memory_report.py show it. When WORKER_MEMORY_BUDGET (e.g. "1.5G")
+is set, enforce_budget() calls the evictors, lowest priority first, until
+the accounted private bytes fit again. Mapped artifact pages are reported
+but not counted against the budget: the kernel can drop them at will.
+
+tracemalloc helpers give the top allocating source lines on demand.
+"""
+
+import os
+import sys
+import logging
+import threading
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_bytes(text: str) -> int:
+    """'512M' / '4G' / '1.5g' / '1000000' -> bytes (argparse type)"""
+    t = str(text).strip().upper().removesuffix("B")
+    try:
+        if t and t[-1] in _UNITS:
+            return int(float(t[:-1]) * _UNITS[t[-1]])
+        return int(float(t))
+    except ValueError:
+        raise ValueError(f"invalid size: {text!r}") from None
+
+
+def _budget_from_env() -> Optional[int]:
+    raw = os.getenv("WORKER_MEMORY_BUDGET", "").strip()
+    return parse_bytes(raw) if raw else None
+
+
+# ------------------------------
+# Sizing
+# ------------------------------
+def array_bytes(arr: np.ndarray) -> tuple[int, int]:
+    """(private_bytes, mapped_bytes) of a numpy array; views of a memmap count as mapped"""
+    base = arr
+    while isinstance(base, np.ndarray) and base.base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    if isinstance(base, np.memmap) or not isinstance(base, np.ndarray):
+        # memmap, or an array over a foreign buffer (mmap / shared memory)
+        return 0, int(arr.nbytes)
+    return int(arr.nbytes), 0
+
+
+#lists/dicts longer than this are sized from a sample of their items
+_SAMPLE = 32
+
+
+def sizeof(obj, _seen: Optional[set] = None, _depth: int = 0) -> int:
+    """approximate deep size in bytes (numpy/pandas aware; large containers are sampled)"""
+    if _seen is None:
+        _seen = set()
+    oid = id(obj)
+    if oid in _seen or _depth > 8:
+        return 0
+    _seen.add(oid)
+
+    if isinstance(obj, np.ndarray):
+        return array_bytes(obj)[0] + sys.getsizeof(np.empty(0))
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):   # DataFrame
+        try:
+            return int(obj.memory_usage(deep=True).sum())
+        except Exception:
+            pass
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        sample = items[:_SAMPLE]
+        inner = sum(sizeof(k, _seen, _depth + 1) + sizeof(v, _seen, _depth + 1) for k, v in sample)
+        return size + (inner * len(items) // len(sample) if sample else 0)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj)
+        sample = items[:_SAMPLE]
+        inner = sum(sizeof(v, _seen, _depth + 1) for v in sample)
+        return size + (inner * len(items) // len(sample) if sample else 0)
+    return size
+
+
+def rss_bytes() -> Optional[int]:
+    """current resident set size (Linux /proc; None elsewhere)"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ------------------------------
+# Accountant
+# ------------------------------
+class Accountant:
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = budget
+        self._sizers: Dict[str, tuple[str, Callable[[], dict]]] = {}
+        self._evictors: list = []           # (priority, name, fn)
+        self._lock = threading.Lock()
+        self._enforcing = threading.Lock()
+
+    def register(self, name: str, kind: str, size_fn: Callable[[], dict]) -> None:
+        """size_fn() -> {"bytes": private, "mapped_bytes": optional, "items": optional, ...}"""
+        with self._lock:
+            self._sizers[name] = (kind, size_fn)
+
+    def register_evictor(self, name: str, fn: Callable[[int], int], priority: int = 50) -> None:
+        """fn(bytes_to_free) -> bytes freed; lower priority is evicted first"""
+        with self._lock:
+            self._evictors = sorted(
+                [e for e in self._evictors if e[1] != name] + [(priority, name, fn)], key=lambda e: e[0]
+            )
+
+    def sizes(self) -> list[dict]:
+        with self._lock:
+            sizers = list(self._sizers.items())
+        out = []
+        for name, (kind, fn) in sizers:
+            try:
+                info = dict(fn() or {})
+            except Exception as ex:
+                info = {"error": str(ex)}
+            info.setdefault("bytes", 0)
+            info.setdefault("mapped_bytes", 0)
+            out.append({"name": name, "kind": kind, **info})
+        return sorted(out, key=lambda r: -r["bytes"])
+
+    def total_bytes(self) -> int:
+        return sum(int(r["bytes"]) for r in self.sizes())
+
+    def report(self) -> dict:
+        structures = self.sizes()
+        return {
+            "structures": structures,
+            "total_bytes": sum(int(r["bytes"]) for r in structures),
+            "total_mapped_bytes": sum(int(r["mapped_bytes"]) for r in structures),
+            "rss_bytes": rss_bytes(),
+            "budget_bytes": self.budget,
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+
+    def enforce_budget(self) -> int:
+        """evict until accounted private bytes <= budget; returns bytes freed"""
+        if self.budget is None or not self._enforcing.acquire(blocking=False):
+            return 0
+        try:
+            over = self.total_bytes() - self.budget
+            freed = 0
+            if over <= 0:
+                return 0
+            with self._lock:
+                evictors = list(self._evictors)
+            for _, name, fn in evictors:
+                try:
+                    got = int(fn(over - freed) or 0)
+                except Exception:
+                    logger.exception("memory: evictor %s failed", name)
+                    continue
+                freed += got
+                if got:
+                    logger.info("memory: %s freed %.1f MB to stay under budget", name, got / 1e6)
+                if freed >= over:
+                    break
+            return freed
+        finally:
+            self._enforcing.release()
+
+
+accountant = Accountant(budget=_budget_from_env())
+
+
+# ------------------------------
+# tracemalloc
+# ------------------------------
+def tracemalloc_start(frames: int = 1) -> bool:
+    """start tracing allocations (no-op if already running); True if it was started now"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def tracemalloc_stop() -> None:
+    tracemalloc.stop()
+
+
+def tracemalloc_top(limit: int = 20, group_by: str = "lineno") -> dict:
+    """top allocating source lines since tracemalloc_start()"""
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "top": []}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    stats = snapshot.statistics(group_by)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {
+                "where": str(stat.traceback[0]) if stat.traceback else "?",
+                "bytes": int(stat.size),
+                "count": int(stat.count),
+            }
+            for stat in stats[:limit]
+        ],
+    }
@@ -0,0 +1,237 @@
+# metrics.py
+"""
+In-process metrics with Prometheus text exposition.
+
+Writes go to a per-thread shard (a plain dict owned by the calling thread),
+so recording a sample takes no lock; render() merges the shards when
+/api/metrics is scraped, folding the shards of threads that have exited into
+one base total so short-lived threads do not pile up. Values are per process: under gunicorn each worker
+reports its own numbers, like any multi-process Prometheus target.
+
+    from metrics import registry
+    REQS = registry.counter("things_total", "Things done.", ["kind"])
+    REQS.inc(kind="a")
+"""
+
+import math
+import bisect
+import threading
+from typing import Callable, Dict, Sequence, Tuple
+
+#seconds; tuned for web requests (5ms .. 10s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#bytes
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+LabelKey = Tuple[str, ...]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: list = []     # (owner thread, shard)
+        self._base: dict = {}       # shards of exited threads, folded together
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:    # once per thread
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        raise NotImplementedError
+
+    def _key(self, labels: dict) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _snapshot(self) -> list:
+        with self._shards_lock:
+            live = []
+            for owner, shard in self._shards:
+                if owner.is_alive():
+                    live.append((owner, shard))
+                else:
+                    # nothing writes this shard any more
+                    self._merge(self._base, shard)
+            self._shards = live
+            base = dict(self._base)
+        #copy each shard; its owner thread may be writing concurrently
+        return [base] + [dict(s) for _, s in live]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        for key, v in shard.items():
+            into[key] = into.get(key, 0.0) + v
+
+    def values(self) -> Dict[LabelKey, float]:
+        out: Dict[LabelKey, float] = {}
+        for shard in self._snapshot():
+            for key, v in shard.items():
+                out[key] = out.get(key, 0.0) + v
+        return out
+
+    def _samples(self):
+        for key, v in sorted(self.values().items()):
+            yield self.name, dict(zip(self.labelnames, key)), v
+
+
+class Gauge(Counter):
+    """inc/dec gauge (per-thread deltas summed on read), e.g. in-flight requests"""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        row = shard.get(key)
+        if row is None:
+            # [per-bucket counts..., +Inf count, sum]
+            row = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        # new lists, not in place: render() reads base rows outside the lock
+        for key, row in shard.items():
+            acc = into.get(key)
+            into[key] = list(row) if acc is None else [a + b for a, b in zip(acc, row)]
+
+    def values(self) -> Dict[LabelKey, list]:
+        out: Dict[LabelKey, list] = {}
+        for shard in self._snapshot():
+            for key, row in shard.items():
+                acc = out.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+                for i, v in enumerate(list(row)):
+                    acc[i] += v
+        return out
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """rough quantile from bucket counts (upper bound of the bucket); None without samples"""
+        row = self.values().get(self._key(labels))
+        if not row:
+            return None
+        total = sum(row[:-1])
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for bound, n in zip(self.buckets + (math.inf,), row[:-1]):
+            seen += n
+            if seen >= target:
+                return bound
+        return math.inf
+
+    def _samples(self):
+        for key, row in sorted(self.values().items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), row[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": _fmt(bound)}, cumulative
+            yield f"{self.name}_sum", labels, row[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: list = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, help_text, labelnames, **kw)
+            elif not isinstance(m, cls):
+                raise ValueError(f"metric {name} already registered as {m.kind}")
+            return m
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def register_collector(self, prefix: str, fn: Callable[[], dict], help_text: str = "") -> None:
+        """
+        fn() -> {name: number} read at scrape time and exposed as gauges
+        `<prefix>_<name>` (for components that already keep their own stats).
+        """
+        with self._lock:
+            self._collectors = [c for c in self._collectors if c[0] != prefix] + [(prefix, fn, help_text)]
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(_line(name, labels, v) for name, labels, v in m._samples())
+        for prefix, fn, help_text in collectors:
+            try:
+                stats = fn() or {}
+            except Exception:
+                continue
+            for key, v in sorted(stats.items()):
+                if not isinstance(v, (int, float)) or isinstance(v, bool):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help_text or prefix} ({key})")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(_line(name, {}, v))
+        return "\n".join(lines) + "\n"
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v)) if abs(v) < 1e15 else repr(float(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _line(name: str, labels: dict, value: float) -> str:
+    if labels:
+        inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        return f"{name}{{{inner}}} {_fmt(value)}"
+    return f"{name} {_fmt(value)}"
+
+
+registry = Registry()
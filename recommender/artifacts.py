@@ -0,0 +1,191 @@
+"""
+artifacts.py
+On-disk model artifacts and the in-process model store.
+
+An artifact is a directory per engine holding one .npy file per model array
+plus meta.json, so arrays can be memory-mapped instead of read:
+
+    recommender/artifacts/<engine>/<array>.npy
+    recommender/artifacts/<engine>/meta.json
+
+get_model() is what request handlers use: in-memory copy if fresh, else the
+artifact written by `python -m recommender train`, else a fit from the DB.
+
+meta.json records the database's dataset_meta.catalog_id at train time. Full
+loads and merges that touch movies renew that id, and an artifact recorded
+against another catalog is not loaded (it may recommend deleted movies or
+old genres): get_model() fits from the DB instead until the next `train`.
+"""
+
+from __future__ import annotations
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from memory import accountant, array_bytes
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = Path(os.getenv("RECOMMENDER_ARTIFACTS_DIR", Path(__file__).resolve().parent / "artifacts"))
+#in-memory models older than this are reloaded/refit on next use
+MODEL_TTL = int(os.getenv("RECOMMENDER_MODEL_TTL", "3600"))
+
+
+def save_model(name: str, model: Dict[str, np.ndarray], out_dir: Path | str = ARTIFACTS_DIR, **meta) -> Path:
+    """Write `model` atomically (tmp dir + rename) and return its directory."""
+    target = Path(out_dir) / name
+    tmp = Path(out_dir) / f".{name}.tmp"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    for key, arr in model.items():
+        np.save(tmp / f"{key}.npy", np.ascontiguousarray(arr))
+    info = {
+        "engine": name,
+        "created_at": int(time.time()),
+        "arrays": {k: {"shape": list(v.shape), "dtype": str(v.dtype)} for k, v in model.items()},
+        **meta,
+    }
+    (tmp / "meta.json").write_text(json.dumps(info, indent=2), encoding="utf-8")
+    if target.exists():
+        shutil.rmtree(target)
+    tmp.rename(target)
+    return target
+
+
+def load_model(name: str, in_dir: Path | str = ARTIFACTS_DIR, mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """Return the stored model (memory-mapped by default) or None if absent."""
+    src = Path(in_dir) / name
+    meta_path = src / "meta.json"
+    if not meta_path.exists():
+        return None
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    return {
+        key: np.load(src / f"{key}.npy", mmap_mode="r" if mmap else None)
+        for key in meta["arrays"]
+    }
+
+
+def model_meta(name: str, in_dir: Path | str = ARTIFACTS_DIR) -> Optional[dict]:
+    meta_path = Path(in_dir) / name / "meta.json"
+    if not meta_path.exists():
+        return None
+    return json.loads(meta_path.read_text(encoding="utf-8"))
+
+
+def catalog_id() -> str:
+    """dataset_meta.catalog_id of the database ("" if never set)"""
+    from database.connection import get_db
+    try:
+        with get_db(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT value FROM dataset_meta WHERE key = 'catalog_id'")
+            row = cur.fetchone()
+    except Exception:
+        # schema predates dataset_meta
+        return ""
+    return row[0] if row else ""
+
+
+def is_current(name: str, in_dir: Path | str = ARTIFACTS_DIR) -> bool:
+    """artifact exists and was trained on the database's current catalog"""
+    meta = model_meta(name, in_dir)
+    return meta is not None and meta.get("catalog_id", "") == catalog_id()
+
+
+class ModelStore:
+    """process-wide cache of fitted models keyed by engine name"""
+
+    def __init__(self, ttl: int = MODEL_TTL, artifacts_dir: Path | str = ARTIFACTS_DIR):
+        self.ttl = ttl
+        self.artifacts_dir = Path(artifacts_dir)
+        self._models: Dict[str, tuple[Dict[str, np.ndarray], float]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Dict[str, np.ndarray]:
+        hit = self._models.get(name)
+        if hit and time.time() - hit[1] < self.ttl:
+            self._last_used[name] = time.time()
+            return hit[0]
+        # one loader per engine; concurrent callers wait for its result
+        with self._lock_for(name):
+            hit = self._models.get(name)
+            if hit and time.time() - hit[1] < self.ttl:
+                return hit[0]
+            with span(f"{name}.load_model"):
+                model = load_model(name, self.artifacts_dir)
+            if model is not None and not is_current(name, self.artifacts_dir):
+                logger.warning("%s artifact was trained on an older catalog; fitting from database "
+                               "(run `python -m recommender train`)", name)
+                model = None
+            if model is None:
+                from recommender.engines import get_engine
+                from recommender.data_loader import load_movies_df, load_ratings_df
+                logger.info("no %s artifact; fitting from database", name)
+                ratings, movies = load_ratings_df(), load_movies_df()
+                with span(f"{name}.fit"):
+                    model = get_engine(name).fit(ratings, movies)
+            self._models[name] = (model, time.time())
+            self._last_used[name] = time.time()
+        if accountant.budget is not None:
+            accountant.enforce_budget()
+        return model
+
+    def drop(self, name: str | None = None) -> None:
+        if name is None:
+            self._models.clear()
+        else:
+            self._models.pop(name, None)
+
+    def memory_usage(self) -> dict:
+        """private vs memory-mapped bytes per loaded model"""
+        models = {}
+        for name, (model, loaded_at) in list(self._models.items()):
+            private = mapped = 0
+            for arr in model.values():
+                p, m = array_bytes(arr)
+                private += p
+                mapped += m
+            models[name] = {"bytes": private, "mapped_bytes": mapped, "loaded_at": int(loaded_at)}
+        return {
+            "bytes": sum(m["bytes"] for m in models.values()),
+            "mapped_bytes": sum(m["mapped_bytes"] for m in models.values()),
+            "items": len(models),
+            "models": models,
+        }
+
+    def evict_bytes(self, nbytes: int) -> int:
+        """drop least recently used models (they reload on next use) until `nbytes` are freed"""
+        freed = 0
+        # keep the most recently used model: evicting it would only trigger a reload
+        for name in sorted(self._models, key=lambda n: self._last_used.get(n, 0.0))[:-1]:
+            if freed >= nbytes:
+                break
+            hit = self._models.pop(name, None)
+            if hit is not None:
+                freed += sum(array_bytes(a)[0] for a in hit[0].values())
+                logger.info("evicted %s model to stay under the memory budget", name)
+        return freed
+
+
+model_store = ModelStore()
+accountant.register("models", "model", model_store.memory_usage)
+accountant.register_evictor("models", model_store.evict_bytes, priority=50)
+
+
+def get_model(name: str) -> Dict[str, np.ndarray]:
+    return model_store.get(name)
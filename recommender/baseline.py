@@ -1,62 +1,226 @@
 """
 baseline.py
-Very small item–item cosine similarity recommender using the SQLite-loaded data.
-This is just to prove the DB + loader works for modeling.
+Item–item cosine similarity recommender using the SQLite-loaded data.
+
+The model keeps the top N_NEIGHBORS most similar items per item instead of
+the full items x items matrix. fit() computes it out of core: items are
+processed in blocks (block x all items similarity from the sparse ratings,
+top-N per row, block discarded) on a thread pool, with block sizes derived
+from a memory budget, so 60k-item catalogs fit in a few GB.
 """
 
 from __future__ import annotations
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from typing import List, Tuple
-from .data_loader import load_user_item_matrix, get_movie_titles
+from .data_loader import load_ratings_df, load_user_history
+from .ids import ID_DTYPE, VALUE_DTYPE, id_rows
+from cache import cache, key_item_item_recs
+from memory import parse_bytes
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+#neighbours kept per item
+N_NEIGHBORS = int(os.getenv("ITEM_ITEM_NEIGHBORS", "200"))
+#peak working memory of fit() (both rating layouts, output and in-flight blocks)
+FIT_MEMORY_BUDGET = parse_bytes(os.getenv("ITEM_ITEM_MEMORY_BUDGET", "1G"))
+FIT_WORKERS = int(os.getenv("ITEM_ITEM_WORKERS", str(min(4, os.cpu_count() or 1))))
+#scratch per block cell (float64 accumulator + bincount result, then argpartition indices)
+_CELL_BYTES = 24
+#scratch per expanded (item, co-rated item) pair while accumulating
+_PAIR_BYTES = 48
+
+
+def _csr(major: np.ndarray, minor: np.ndarray, vals: np.ndarray, n_major: int):
+    """COO -> (indptr, minor, vals) grouped by `major`"""
+    order = np.argsort(major, kind="stable")
+    indptr = np.zeros(n_major + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=n_major), out=indptr[1:])
+    return indptr, minor[order], vals[order]
+
+
+def plan_blocks(n_items: int, n_neighbors: int, nnz: int, memory_budget: int, workers: int) -> Tuple[int, int]:
+    """(items per block, expanded pairs per step) so `workers` blocks in flight fit the budget"""
+    fixed = nnz * 2 * (4 + 4) + n_items * n_neighbors * (4 + 4)   # both layouts + output
+    per_worker = (memory_budget - fixed) // max(workers, 1)
+    min_need = n_items * _CELL_BYTES + 1024 * _PAIR_BYTES
+    if per_worker < min_need:
+        raise MemoryError(
+            f"memory budget {memory_budget / 1e6:.0f} MB too small for {n_items} items: "
+            f"ratings + output need {fixed / 1e6:.0f} MB and each worker at least {min_need / 1e6:.1f} MB"
+        )
+    # half for the dense block rows, half for the pair expansion feeding them
+    block = int(max(1, min(n_items, per_worker // 2 // (n_items * _CELL_BYTES))))
+    max_pairs = int(max(1024, per_worker // 2 // _PAIR_BYTES))
+    return block, max_pairs
+
+
+def _block_top_n(b0: int, b1: int, item_major, user_major, n_items: int, n_neighbors: int, max_pairs: int):
+    """top-n neighbours (indices, cosine) of items b0..b1 against all items"""
+    i_indptr, i_users, i_vals = item_major
+    u_indptr, u_items, u_vals = user_major
+    n_rows = b1 - b0
+    lo, hi = i_indptr[b0], i_indptr[b1]
+    rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(i_indptr[b0:b1 + 1]))
+    users, vals = i_users[lo:hi], i_vals[lo:hi]
+    starts = u_indptr[users]
+    deg = u_indptr[users + 1] - starts
+    cum = np.cumsum(deg)
+
+    acc = np.zeros(n_rows * n_items)
+    s = 0
+    while s < len(users):
+        # entries s..e expand to at most max_pairs (item, co-rated item) pairs
+        base = cum[s - 1] if s else 0
+        e = max(int(np.searchsorted(cum, base + max_pairs, side="right")), s + 1)
+        d = deg[s:e]
+        total = int(cum[e - 1] - base)
+        if total:
+            # every position of each entry's user row: starts[k] .. starts[k] + deg[k]
+            pos = np.repeat(starts[s:e] - (np.cumsum(d) - d), d) + np.arange(total)
+            keys = np.repeat(rows[s:e] * n_items, d) + u_items[pos]
+            acc += np.bincount(keys, weights=np.repeat(vals[s:e], d) * u_vals[pos], minlength=n_rows * n_items)
+        s = e
+
+    sim = acc.reshape(n_rows, n_items)
+    sim[np.arange(n_rows), np.arange(b0, b1)] = 0.0        # no self-neighbours
+    if n_neighbors < n_items:
+        idx = np.argpartition(sim, n_items - n_neighbors, axis=1)[:, n_items - n_neighbors:]
+    else:
+        idx = np.broadcast_to(np.arange(n_items), (n_rows, n_items))
+    w = np.take_along_axis(sim, idx, axis=1)
+    order = np.argsort(-w, axis=1, kind="stable")
+    return (np.take_along_axis(idx, order, axis=1).astype(np.int32),
+            np.take_along_axis(w, order, axis=1).astype(VALUE_DTYPE))
+
+
+def _rating_layouts(ratings: pd.DataFrame):
+    """
+    movie_ids plus item-major and user-major (indptr, indices int32, values float32)
+    arrays of the ratings, every value already divided by its item's norm
+    """
+    movie_ids, item_idx = np.unique(ratings["movie_id"].to_numpy(dtype=ID_DTYPE), return_inverse=True)
+    _, user_idx = np.unique(ratings["user_id"].to_numpy(dtype=ID_DTYPE), return_inverse=True)
+    vals = ratings["rating"].to_numpy(dtype=np.float64)
+    n_items = len(movie_ids)
+    n_users = int(user_idx.max()) + 1 if len(vals) else 0
+
+    # repeated (user, movie) rows are averaged, as the old pivot_table did
+    keys = user_idx.astype(np.int64) * n_items + item_idx
+    uniq, inv = np.unique(keys, return_inverse=True)
+    if len(uniq) < len(keys):
+        vals = np.bincount(inv, weights=vals) / np.bincount(inv)
+        user_idx, item_idx = uniq // n_items, uniq % n_items
+    user_idx, item_idx = user_idx.astype(np.int32), item_idx.astype(np.int32)
+
+    # cosine on raw ratings: scale every entry by its item's norm once
+    # (float32 storage; the block products accumulate in float64)
+    norms = np.sqrt(np.bincount(item_idx, weights=vals * vals, minlength=n_items)) + 1e-9
+    scaled = (vals / norms[item_idx]).astype(VALUE_DTYPE)
+    return movie_ids, _csr(item_idx, user_idx, scaled, n_items), _csr(user_idx, item_idx, scaled, n_users)
+
+
+def fit(ratings: pd.DataFrame, movies: pd.DataFrame | None = None, n_neighbors: int = N_NEIGHBORS,
+        memory_budget: int | None = None, workers: int | None = None) -> dict[str, np.ndarray]:
+    """
+    Fit the item-item model from a ratings DataFrame.
+    Returns {"neighbors": items x n int32 (indices into movie_ids, most similar first),
+             "weights": items x n float32 cosine similarities (0 = padding),
+             "movie_ids": sorted int32 row order}.
+    """
+    memory_budget = memory_budget or FIT_MEMORY_BUDGET
+    workers = max(int(workers or FIT_WORKERS), 1)
+    movie_ids, item_major, user_major = _rating_layouts(ratings)
+    n_items, nnz = len(movie_ids), len(item_major[1])
+    n = int(max(0, min(n_neighbors, n_items - 1)))
+    if n == 0:
+        return {"neighbors": np.zeros((n_items, 0), dtype=np.int32),
+                "weights": np.zeros((n_items, 0), dtype=VALUE_DTYPE), "movie_ids": movie_ids}
 
-def _cosine_sim(A: np.ndarray) -> np.ndarray:
-    # A: users x items (NaNs -> 0)
-    A = np.nan_to_num(A, copy=False)
-    norms = np.linalg.norm(A, axis=0, keepdims=True) + 1e-9
-    A_norm = A / norms
-    return A_norm.T @ A_norm   # items x items
+    block, max_pairs = plan_blocks(n_items, n, nnz, memory_budget, workers)
+    neighbors = np.zeros((n_items, n), dtype=np.int32)
+    weights = np.zeros((n_items, n), dtype=VALUE_DTYPE)
+
+    def run(b0):
+        b1 = min(b0 + block, n_items)
+        neighbors[b0:b1], weights[b0:b1] = _block_top_n(b0, b1, item_major, user_major, n_items, n, max_pairs)
+
+    logger.info("item_item fit: %d items, %d ratings, blocks of %d items on %d threads",
+                n_items, nnz, block, workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="item-item-fit") as pool:
+        list(pool.map(run, range(0, n_items, block)))
+    return {"neighbors": neighbors, "weights": weights, "movie_ids": movie_ids}
 
 def fit_item_item():
-    ui = load_user_item_matrix()             # users x movies
-    sim = _cosine_sim(ui.values)             # movies x movies
-    movie_ids = ui.columns.to_numpy()
-    return sim, movie_ids
+    return fit(load_ratings_df())
 
-def recommend_for_user(user_id: int, k: int = 10) -> List[Tuple[int, float]]:
-    ui = load_user_item_matrix()
-    if user_id not in ui.index:
-        return []
-    sim, movie_ids = fit_item_item()
-    num_movies = sim.shape[0]
-    if num_movies == 0:
+def score_user(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+    """
+    Score every item for one user's (movie_ids, ratings) history.
+    Returns top-k unseen (movie_id, score) sorted by score desc.
+    """
+    movie_ids = model["movie_ids"]
+    num_movies = len(movie_ids)
+    if num_movies == 0 or len(rated_ids) == 0:
         return []
     k = min(k, num_movies)
 
-    user_ratings = ui.loc[user_id]
-    rated = user_ratings.dropna()
-    if rated.empty:
+    rated_idx, known = id_rows(movie_ids, rated_ids)
+    if not known.any():
         return []
-
-    id_to_idx = {mid: i for i, mid in enumerate(movie_ids)}
-    rated_idx = np.array([id_to_idx[m] for m in rated.index if m in id_to_idx], dtype=int)
-    if rated_idx.size == 0:
-        return []
-
-    weights = rated.values[: rated_idx.size]
-    scores = (sim[:, rated_idx] @ weights)
+    weights = np.asarray(rated_vals, dtype=VALUE_DTYPE)[known]
+    with span("item_item.score"):
+        if "sim" in model:
+            # dense artifact written before neighbour lists
+            scores = model["sim"][:, rated_idx] @ weights
+        else:
+            # each rated item votes for its neighbours, weighted by the user's rating
+            nbrs = model["neighbors"][rated_idx]
+            votes = model["weights"][rated_idx] * weights[:, None]
+            scores = np.bincount(nbrs.ravel(), weights=votes.ravel(), minlength=num_movies)
+            # items no rated item links to have no evidence at all
+            scores[scores <= 0] = -np.inf
 
     # mask already-rated
-    for ri in rated_idx:
-        scores[ri] = -np.inf
+    scores[rated_idx] = -np.inf
 
-    top_idx = np.argpartition(scores, -k)[-k:]
-    top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
-    recs = [(int(movie_ids[i]), float(scores[i])) for i in top_idx if np.isfinite(scores[i])]
+    with span("item_item.top_k"):
+        top_idx = np.argpartition(scores, -k)[-k:]
+        top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
+        recs = [(int(movie_ids[i]), float(scores[i])) for i in top_idx if np.isfinite(scores[i])]
     return recs[:k]
 
-def recommend_titles_for_user(user_id: int, k: int = 500):  # Changed default from 10 to 500
-    recs = recommend_for_user(user_id, k)
+def score_scratch_bytes(model: dict[str, np.ndarray], max_history: int) -> int:
+    if "sim" in model:
+        # sim[:, rated_idx] copies one column per rated item
+        return int(model["sim"].shape[0]) * 8 * (max_history + 4)
+    # gathered neighbour rows + votes, and the per-item score vector
+    n = int(model["neighbors"].shape[1])
+    return max_history * n * (4 + 4 + 4) + len(model["movie_ids"]) * 8 * 4
+
+def recommend_for_user(user_id: int, k: int = 10) -> List[Tuple[int, float]]:
+    from .artifacts import get_model
+
+    if user_id is None:
+        return []
+    rated_ids, rated_vals = load_user_history(user_id)
+    if rated_ids.size == 0:
+        return []
+    return score_user(get_model("item_item"), rated_ids, rated_vals, k)
+
+@cache.cached(ttl=900, key_fn=lambda user_id, k=500, **kw: key_item_item_recs(user_id=user_id, k=k, **kw))
+def personalized_titles_for_user(user_id: int, k: int = 500):  # Changed default from 10 to 500
+    from .precompute import load_precomputed_recs
+
+    with span("item_item.precomputed"):
+        recs = load_precomputed_recs("item_item", user_id, k) if user_id is not None else None
+    source = "precomputed"
+    if recs is None:
+        recs, source = recommend_for_user(user_id, k), "live"
     
     from database.connection import get_db
     from database.paramstyle import PH, ph_list
@@ -65,7 +229,7 @@ def recommend_titles_for_user(user_id: int, k: int = 500):  # Changed default fr
     if not movie_ids:
         return []
     
-    with get_db(readonly=True) as conn:
+    with span("item_item.metadata"), get_db(readonly=True) as conn:
         cur = conn.cursor()
         cur.execute(
             f"SELECT movie_id, title, poster_url, year, genres FROM movies WHERE movie_id IN ({ph_list(len(movie_ids))})",
@@ -97,7 +261,19 @@ def recommend_titles_for_user(user_id: int, k: int = 500):  # Changed default fr
             "rating": score,
             "poster_url": info["poster_url"],
             "year": info["year"],
-            "genres": info["genres"]
+            "genres": info["genres"],
+            "source": source
         })
     
     return results
+
+
+def recommend_titles_for_user(user_id: int, k: int = 500, deadline_ms: float | None = None):
+    """
+    personalized_titles_for_user within `deadline_ms` (default RECS_DEADLINE_MS);
+    popular-unseen items (source "fallback") when it is slower or fails.
+    """
+    from .fallback import with_deadline
+
+    return with_deadline("item_item", personalized_titles_for_user, user_id, k, deadline_ms=deadline_ms,
+                         cache_key=key_item_item_recs(user_id=user_id, k=k), score_key="rating")
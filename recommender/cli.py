@@ -0,0 +1,174 @@
+"""
+cli.py
+Offline entry point for the recommender package.
+
+    python -m recommender train --engine item_item --engine factor
+    python -m recommender train --engine item_item --memory-budget 6G --workers 4
+    python -m recommender train --engine factor --quantize           # + int8 item vectors
+    python -m recommender score --engine content --users 1,2,3 --top-n 20
+    python -m recommender score --engine factor --output recs.csv --workers 16 --memory-budget 6G
+    python -m recommender score --engine item_item --write-db        # same table as recommender.precompute
+
+train fits each engine once from the database and writes an artifact
+(see recommender.artifacts). score loads the artifact (or fits if there is
+none) and scores all or selected users across worker processes that share
+the model and rating arrays through shared memory.
+"""
+
+from __future__ import annotations
+import sys
+import csv
+import inspect
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Sequence
+
+from recommender.engines import ENGINES, get_engine
+from recommender.parallel import parse_bytes, score_users
+from recommender.artifacts import ARTIFACTS_DIR, catalog_id, is_current, load_model, save_model
+from recommender.quantize import quantize_model
+
+logger = logging.getLogger(__name__)
+
+
+def _engines(args) -> list[str]:
+    names = args.engine or sorted(ENGINES)
+    return sorted(ENGINES) if "all" in names else names
+
+
+def _user_list(text: str | None) -> list[int] | None:
+    if not text:
+        return None
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _fit_options(engine, args) -> dict:
+    """--memory-budget / --workers, for engines whose fit() takes them"""
+    params = inspect.signature(engine.fit).parameters
+    options = {"memory_budget": args.memory_budget, "workers": args.workers}
+    return {k: v for k, v in options.items() if v is not None and k in params}
+
+
+def cmd_train(args) -> None:
+    from recommender.data_loader import load_movies_df, load_ratings_df
+
+    # read before the data: a merge during the fit leaves the artifact stale, not wrong
+    catalog = catalog_id()
+    ratings = load_ratings_df()
+    movies = load_movies_df(columns=["movie_id", "title", "year", "genres"])
+    for name in _engines(args):
+        engine = get_engine(name)
+        t0 = time.perf_counter()
+        model = engine.fit(ratings, movies, **_fit_options(engine, args))
+        if args.quantize and hasattr(engine, "QUANTIZE_KEY"):
+            model = quantize_model(model, engine.QUANTIZE_KEY)
+        fit_seconds = time.perf_counter() - t0
+        path = save_model(
+            name, model, args.artifacts,
+            fit_seconds=round(fit_seconds, 3),
+            n_ratings=int(len(ratings)),
+            n_users=int(ratings["user_id"].nunique()),
+            n_items=int(len(model["movie_ids"])),
+            catalog_id=catalog,
+        )
+        size_mb = sum(a.nbytes for a in model.values()) / 1e6
+        print(f"✅ {name}: fit {fit_seconds:.1f}s, {size_mb:.1f} MB -> {path}")
+
+
+def cmd_score(args) -> None:
+    from recommender.data_loader import load_movies_df, load_ratings_df, user_ratings_csr
+    from recommender.precompute import write_user_recs
+
+    engines = _engines(args)
+    if args.write_db and args.users:
+        raise SystemExit("--write-db replaces the whole table; it cannot be combined with --users")
+    if len(engines) > 1 and not args.write_db and args.output is None:
+        raise SystemExit("score one engine at a time unless --write-db is given")
+
+    computed_at = int(time.time())
+    ratings = load_ratings_df()
+    csr = user_ratings_csr(ratings)
+    movies = None
+
+    # one file per run: truncated here, then every engine's rows appended
+    out = None
+    if not args.write_db:
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        csv.writer(out).writerow(["engine", "user_id", "rank", "movie_id", "score"])
+    try:
+        for name in engines:
+            model = load_model(name, args.artifacts) if is_current(name, args.artifacts) else None
+            if model is None:
+                logger.info("no current %s artifact under %s; fitting", name, args.artifacts)
+                if movies is None:
+                    movies = load_movies_df(columns=["movie_id", "title", "year", "genres"])
+                model = get_engine(name).fit(ratings, movies)
+
+            t0 = time.perf_counter()
+            results = score_users(
+                name, model, csr,
+                top_n=args.top_n,
+                user_ids=_user_list(args.users),
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                memory_budget=args.memory_budget,
+            )
+            if args.write_db:
+                n_users = write_user_recs(name, results, computed_at, args.top_n)
+            else:
+                n_users = _write_csv(out, name, results)
+            print(f"✅ {name}: scored {n_users} users in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+
+def _write_csv(fh, engine_name: str, results) -> int:
+    w = csv.writer(fh)
+    n_users = 0
+    for uid, recs in results:
+        n_users += 1
+        w.writerows((engine_name, uid, rank, mid, f"{score:.6f}") for rank, (mid, score) in enumerate(recs))
+    return n_users
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m recommender", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--engine", action="append", choices=sorted(ENGINES) + ["all"],
+                        help="engine (repeatable; default: all)")
+    common.add_argument("--artifacts", type=Path, default=ARTIFACTS_DIR, help="artifact directory")
+
+    p_train = sub.add_parser("train", parents=[common], help="fit engines and write artifacts")
+    p_train.add_argument("--workers", type=int, default=None, help="fit threads, for engines that fit in blocks")
+    p_train.add_argument("--memory-budget", type=parse_bytes, default=None,
+                         help="peak fit memory, e.g. 6G (sets the item_item block size)")
+    p_train.add_argument("--quantize", action="store_true",
+                         help="also store int8 item vectors; scoring then re-ranks an int8 shortlist")
+    p_train.set_defaults(func=cmd_train)
+
+    p_score = sub.add_parser("score", parents=[common], help="score all or selected users")
+    p_score.add_argument("--users", help="comma-separated user ids (default: every user with ratings)")
+    p_score.add_argument("--top-n", type=int, default=20, help="recs per user")
+    p_score.add_argument("--output", type=Path, default=None, help="CSV file (default: stdout)")
+    p_score.add_argument("--write-db", action="store_true", help="replace the user_recs table instead of writing CSV")
+    p_score.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    p_score.add_argument("--chunk-size", type=int, default=64, help="users per worker task")
+    p_score.add_argument("--memory-budget", type=parse_bytes, default=None,
+                         help="cap on shared arrays + workers, e.g. 6G (limits worker count)")
+    p_score.set_defaults(func=cmd_score)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
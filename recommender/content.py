@@ -4,23 +4,29 @@ from typing import List, Tuple, Dict
 import numpy as np
 import pandas as pd
 
-from recommender.data_loader import load_movies_df, load_ratings_df
+from recommender.data_loader import load_movies_df, load_user_history
+from recommender.ids import ID_DTYPE, VALUE_DTYPE, id_rows, is_sorted
+from recommender.quantize import is_quantized, rerank_size, shortlist
 from database.connection import get_db
 from database.paramstyle import ph_list
 from database.db_query import top_unseen_for_user
 from cache import cache, key_content_recs
+from tracing import span, traced
 
 # ----------------------------
 # Feature building (genres + year)
 # ----------------------------
-def _build_item_features() -> tuple[pd.DataFrame, np.ndarray, dict[int, int]]:
+@traced("content.features")
+def _build_item_features(movies: pd.DataFrame | None = None) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
     """
     Returns:
-      meta_df: DataFrame with columns [movie_id, title, year, genres]
-      X:       numpy array (n_items x n_features)
-      id2row:  dict mapping movie_id -> row index in X
+      meta_df:   DataFrame with columns [movie_id, title, year, genres], sorted by movie_id
+      X:         float32 array (n_items x n_features)
+      movie_ids: sorted int32 movie_id of each row of X (see recommender.ids.id_rows)
     """
-    meta = load_movies_df(columns=["movie_id", "title", "year", "genres"]).copy()
+    if movies is None:
+        movies = load_movies_df(columns=["movie_id", "title", "year", "genres"])
+    meta = movies[["movie_id", "title", "year", "genres"]].sort_values("movie_id", kind="stable").reset_index(drop=True)
 
     # Genres: pipe-separated -> multi-hot columns
     genres_split = (
@@ -40,72 +46,120 @@ def _build_item_features() -> tuple[pd.DataFrame, np.ndarray, dict[int, int]]:
 
     # Assemble feature matrix: [genres..., year_z]
     feat_cols = [c for c in meta.columns if c.startswith("g::")] + ["year_z"]
-    X = meta[feat_cols].to_numpy(dtype=float)
+    X = meta[feat_cols].to_numpy(dtype=VALUE_DTYPE)
 
     # L2 normalize item feature rows to make cosine easy later
     norms = np.linalg.norm(X, axis=1, keepdims=True) + 1e-9
-    X = X / norms
+    X /= norms
 
-    id2row = {int(mid): i for i, mid in enumerate(meta["movie_id"].astype(int).tolist())}
-    return meta[["movie_id", "title", "year", "genres"]], X, id2row
+    movie_ids = meta["movie_id"].to_numpy(dtype=ID_DTYPE)
+    return meta[["movie_id", "title", "year", "genres"]], X, movie_ids
 
 
-def _user_profile_vector(user_id: int, X: np.ndarray, id2row: dict[int, int]) -> tuple[np.ndarray, list[int]]:
+@traced("content.profile")
+def _profile_from_history(
+    X: np.ndarray, rows: np.ndarray, rated_vals: np.ndarray
+) -> np.ndarray | None:
+    """
+    Weighted average of the features of rated items (rows of X), L2-normalized.
+    Returns None if none of the rated items are in the feature space.
+    """
+    if len(rows) == 0:
+        return None
+
+    # Weight by normalized rating (0..1); you can also use (rating - mean) for mean-centering
+    w = np.asarray(rated_vals, dtype=VALUE_DTYPE) / 5.0
+    uvec = w @ X[rows]
+    u_norm = np.linalg.norm(uvec) + 1e-9
+    return uvec / u_norm
+
+
+def _history_rows(movie_ids: np.ndarray, rated_ids: np.ndarray, rated_vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(rows of X, ratings) for the rated movies the model knows"""
+    if is_sorted(movie_ids):
+        rows, known = id_rows(movie_ids, rated_ids)
+    else:
+        # artifact written before rows were sorted by movie_id
+        order = np.argsort(movie_ids, kind="stable")
+        rows, known = id_rows(movie_ids[order], rated_ids)
+        rows = order[rows]
+    return rows, np.asarray(rated_vals)[known]
+
+
+def _user_profile_vector(user_id: int, X: np.ndarray, movie_ids: np.ndarray) -> tuple[np.ndarray, list[int]]:
     """
     Build a user profile as a weighted average of the features of items they've rated.
     Returns (uvec, seen_movie_ids). If user has no ratings, returns (None, []).
     """
-    df = load_ratings_df()
-    u = df[df["user_id"] == user_id]
-    if u.empty:
+    rated_ids, rated_vals = load_user_history(user_id)
+    if rated_ids.size == 0:
         return None, []
-
-    # Keep only items present in our feature space
-    rows = []
-    weights = []
-    for _, r in u.iterrows():
-        mid = int(r["movie_id"])
-        if mid in id2row:
-            rows.append(id2row[mid])
-            # Weight by normalized rating (0..1); you can also use (rating - mean) for mean-centering
-            weights.append(float(r["rating"]) / 5.0)
-
-    if not rows:
+    uvec = _profile_from_history(X, *_history_rows(movie_ids, rated_ids, rated_vals))
+    if uvec is None:
         return None, []
-
-    V = X[rows, :]
-    w = np.asarray(weights, dtype=float).reshape(-1, 1)
-    uvec = (V * w).sum(axis=0)
-    u_norm = np.linalg.norm(uvec) + 1e-9
-    uvec = uvec / u_norm
-    seen = [int(x) for x in u["movie_id"].tolist()]
-    return uvec, seen
+    return uvec, [int(x) for x in rated_ids]
 
 
 # ----------------------------
-# Public API
+# Engine interface (shared with batch jobs)
 # ----------------------------
-def recommend_for_user(user_id: int, k: int = 20) -> List[Tuple[int, float]]:
+#matrix that `train --quantize` stores as int8 (see recommender.quantize)
+QUANTIZE_KEY = "X"
+
+def fit(ratings: pd.DataFrame | None = None, movies: pd.DataFrame | None = None) -> dict[str, np.ndarray]:
     """
-    Content-based recommendations for a user using genres + year.
-    Returns list of (movie_id, score) sorted by score desc.
-    Falls back to popular-unseen if user has no usable ratings.
+    Build the content model. Ratings are not needed (features come from movie
+    metadata); the argument keeps the signature shared with other engines.
+    Returns {"X": n_items x n_features float32, "movie_ids": sorted int32 row order of X}.
     """
-    meta, X, id2row = _build_item_features()
-    uvec, seen = _user_profile_vector(user_id, X, id2row)
+    _, X, movie_ids = _build_item_features(movies)
+    return {"X": X, "movie_ids": movie_ids}
+
 
+def score_user(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray, k: int = 20) -> List[Tuple[int, float]]:
+    """
+    Score every item for one user's (movie_ids, ratings) history.
+    Returns top-k unseen (movie_id, score); empty if the history is unusable.
+    """
+    X, movie_ids = model["X"], model["movie_ids"]
+    rows, vals = _history_rows(movie_ids, rated_ids, rated_vals)
+    uvec = _profile_from_history(X, rows, vals)
     if uvec is None:
-        # Cold-start: no ratings -> fall back
-        fallback = top_unseen_for_user(user_id, limit=k)
-        return [(row["movie_id"], row["weighted_rating"]) for row in fallback]
+        return []
+    if is_quantized(model, QUANTIZE_KEY):
+        # int8 pass for a shortlist, exact float scores for the shortlist only
+        with span("content.score_int8"):
+            cand = shortlist(model, QUANTIZE_KEY, uvec, rerank_size(k), exclude=rows)
+            scores = X[cand] @ uvec.astype(X.dtype, copy=False)
+        return _top_k(scores, movie_ids[cand], (), k)
+    with span("content.score"):
+        scores = X @ uvec.astype(X.dtype, copy=False)
+    return _top_k(scores, movie_ids, rows, k)
+
+
+def score_items(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray,
+                candidate_ids: np.ndarray) -> np.ndarray:
+    """
+    Profile similarity of `candidate_ids` only (-inf for ids the model does
+    not know); cost follows the candidate count, not the catalog size.
+    """
+    X, movie_ids = model["X"], model["movie_ids"]
+    out = np.full(len(candidate_ids), -np.inf, dtype=np.float32)
+    uvec = _profile_from_history(X, *_history_rows(movie_ids, rated_ids, rated_vals))
+    if uvec is None:
+        return out
+    # positions in candidate_ids come back for the ids the model knows
+    rows, pos = _history_rows(movie_ids, candidate_ids, np.arange(len(candidate_ids)))
+    with span("content.score_items"):
+        out[pos] = X[rows] @ uvec.astype(X.dtype, copy=False)
+    return out
 
-    # Cosine similarity to all items
-    scores = X @ uvec  # (n_items,)
 
+@traced("content.top_k")
+def _top_k(scores: np.ndarray, movie_ids: np.ndarray, seen_idx, k: int) -> List[Tuple[int, float]]:
     # Mask already-seen items
-    if seen:
-        seen_idx = [id2row[mid] for mid in seen if mid in id2row]
-        scores[np.array(seen_idx, dtype=int)] = -np.inf
+    if len(seen_idx):
+        scores[seen_idx] = -np.inf
 
     # Top-k indices
     k = int(min(k, scores.shape[0]))
@@ -114,23 +168,52 @@ def recommend_for_user(user_id: int, k: int = 20) -> List[Tuple[int, float]]:
 
     top_idx = np.argpartition(scores, -k)[-k:]
     top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
+    return [(int(movie_ids[i]), float(scores[i])) for i in top_idx]
 
-    mids = meta.iloc[top_idx]["movie_id"].astype(int).tolist()
-    vals = scores[top_idx].astype(float).tolist()
-    return list(zip(mids, vals))
+
+# ----------------------------
+# Public API
+# ----------------------------
+def recommend_for_user(user_id: int, k: int = 20) -> List[Tuple[int, float]]:
+    """
+    Content-based recommendations for a user using genres + year.
+    Returns list of (movie_id, score) sorted by score desc.
+    Falls back to popular-unseen if user has no usable ratings.
+    """
+    from recommender.artifacts import get_model
+
+    if k <= 0:
+        # top_unseen_for_user would pass LIMIT -k, which SQLite reads as "no limit"
+        return []
+    rated_ids, rated_vals = load_user_history(user_id)
+    recs = score_user(get_model("content"), rated_ids, rated_vals, k) if rated_ids.size else []
+
+    if not recs:
+        # Cold-start: no usable ratings -> fall back
+        with span("content.fallback"):
+            fallback = top_unseen_for_user(user_id, limit=k)
+        return [(row["movie_id"], row["weighted_rating"]) for row in fallback]
+    return recs
 
 @cache.cached(ttl=900, key_fn=lambda user_id, k=20, **kw: key_content_recs(user_id=user_id, k=k, **kw))
-def recommend_titles_for_user(user_id: int, k: int = 20) -> List[Dict]:
+def personalized_titles_for_user(user_id: int, k: int = 20) -> List[Dict]:
     """
     Same as recommend_for_user, but returns movie metadata for convenience:
-    [{movie_id, title, score, year, genres, poster_url}]
+    [{movie_id, title, score, year, genres, poster_url, source}]
+    source is "precomputed" (batch job) or "live" (scored now).
     """
-    recs = recommend_for_user(user_id=user_id, k=k)
+    from recommender.precompute import load_precomputed_recs
+
+    with span("content.precomputed"):
+        recs = load_precomputed_recs("content", user_id, k)
+    source = "precomputed"
+    if recs is None:
+        recs, source = recommend_for_user(user_id=user_id, k=k), "live"
     mids = [mid for mid, _ in recs]
     if not mids:
         return []
 
-    with get_db(readonly=True) as conn:
+    with span("content.metadata"), get_db(readonly=True) as conn:
         cur = conn.cursor()
         cur.execute(
             f"""
@@ -161,7 +244,19 @@ def recommend_titles_for_user(user_id: int, k: int = 20) -> List[Dict]:
                 "poster_url": info["poster_url"],
                 "year": info["year"],
                 "genres": info["genres"],
+                "source": source,
             }
         )
     return out
 
+
+def recommend_titles_for_user(user_id: int, k: int = 20, deadline_ms: float | None = None) -> List[Dict]:
+    """
+    personalized_titles_for_user within `deadline_ms` (default RECS_DEADLINE_MS);
+    popular-unseen items (source "fallback") when it is slower or fails.
+    """
+    from recommender.fallback import with_deadline
+
+    return with_deadline("content", personalized_titles_for_user, user_id, k, deadline_ms=deadline_ms,
+                         cache_key=key_content_recs(user_id=user_id, k=k))
+
@@ -5,11 +5,16 @@ Provides utility functions for the recommendation engine.
 """
 
 from __future__ import annotations
+import os
+import uuid
 from typing import Generator, Iterable, Tuple
+import numpy as np
 import pandas as pd
 from database.connection import get_db, DATABASE_URL, DB_PATH
 from database.paramstyle import PH, ph_list
+from recommender.ids import ID_DTYPE, VALUE_DTYPE
 from sqlalchemy import create_engine
+from tracing import traced
 
 def _get_sqlalchemy_url():
     """
@@ -24,8 +29,10 @@ def _get_sqlalchemy_url():
 
 def _sa_engine_for_loader():
     """Create and return a SQLAlchemy engine for pandas operations."""
-    return create_engine(_get_sqlalchemy_url())
+    from database.query_log import instrument_engine
+    return instrument_engine(create_engine(_get_sqlalchemy_url()))
 
+@traced("load_movies")
 def load_movies_df(columns: list[str] | None = None) -> pd.DataFrame:
     """Load movies with specified columns using SQLAlchemy engine."""
     cols = columns or ["movie_id", "title", "year", "genres"]
@@ -36,12 +43,25 @@ def load_movies_df(columns: list[str] | None = None) -> pd.DataFrame:
     finally:
         engine.dispose()
 
+@traced("load_ratings")
 def load_ratings_df(min_ratings_per_user: int | None = None) -> pd.DataFrame:
     """
     Returns a DataFrame with columns: user_id, movie_id, rating, timestamp.
     Optionally filters to users with at least `min_ratings_per_user` ratings.
-    Uses SQLAlchemy engine to avoid pandas warnings.
+    Reads the columnar snapshot (recommender.snapshot: int32 ids, float32
+    ratings, sorted by user) unless RATINGS_SNAPSHOT=0; then it queries the
+    database through a SQLAlchemy engine to avoid pandas warnings.
     """
+    from recommender.snapshot import SNAPSHOT_ENABLED, ratings_arrays
+    if SNAPSHOT_ENABLED:
+        cols = ratings_arrays()
+        if min_ratings_per_user is not None:
+            # ids are sorted: per-user counts are run lengths
+            _, counts = np.unique(cols["user_id"], return_counts=True)
+            keep = np.repeat(counts >= min_ratings_per_user, counts)
+            cols = {name: arr[keep] for name, arr in cols.items()}
+        return pd.DataFrame(cols, copy=False)
+
     engine = _sa_engine_for_loader()
     try:
         if min_ratings_per_user is None:
@@ -67,15 +87,45 @@ def load_user_item_matrix() -> pd.DataFrame:
     Useful for baseline/item-item recommenders.
     """
     df = load_ratings_df()
-    return df.pivot_table(index="user_id", columns="movie_id", values="rating")
+    return df.pivot_table(index="user_id", columns="movie_id", values="rating").astype(VALUE_DTYPE)
 
-def iter_user_ratings(user_ids: Iterable[int] | None = None) -> Generator[Tuple[int,int,float,int], None, None]:
+#rows per batch for the streaming readers (postgres: rows per server round trip)
+ITER_BATCH_ROWS = int(os.getenv("RATINGS_ITER_BATCH", "50000"))
+
+RATING_COLUMNS = {"user_id": ID_DTYPE, "movie_id": ID_DTYPE, "rating": VALUE_DTYPE, "timestamp": np.int64}
+
+def streaming_cursor(conn, batch_rows: int = ITER_BATCH_ROWS):
     """
-    Yields (user_id, movie_id, rating, timestamp) one row at a time.
-    Use for streaming/online algorithms without loading everything into memory.
+    Cursor that really streams: a named (server-side) cursor on Postgres, so
+    rows come over in batches of `batch_rows` instead of the whole result at
+    execute(); sqlite3 cursors already step lazily through fetchmany().
+    Must be used inside the connection's transaction (get_db does that).
+    """
+    if DATABASE_URL:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}")
+        cur.itersize = batch_rows
+        return cur
+    return conn.cursor()
+
+def column_chunks(cur, columns: dict, batch_rows: int = ITER_BATCH_ROWS) -> Generator[dict[str, np.ndarray], None, None]:
+    """fetchmany() batches of an executed cursor as {column: array} (column order = select order)"""
+    while True:
+        rows = cur.fetchmany(batch_rows)
+        if not rows:
+            return
+        yield {name: np.asarray(col, dtype=dtype) for (name, dtype), col in zip(columns.items(), zip(*rows))}
+
+def iter_user_rating_chunks(
+    user_ids: Iterable[int] | None = None,
+    batch_rows: int = ITER_BATCH_ROWS,
+) -> Generator[dict[str, np.ndarray], None, None]:
+    """
+    Yields the ratings ordered by user_id as NumPy chunks of up to `batch_rows`
+    rows: {"user_id", "movie_id", "rating", "timestamp"}. Memory stays at one
+    batch regardless of table size; a user's rows may continue in the next chunk.
     """
     with get_db(readonly=True) as conn:
-        cur = conn.cursor()
+        cur = streaming_cursor(conn, batch_rows)
         if user_ids:
             ids = list(user_ids)
             q = f"""
@@ -87,8 +137,63 @@ def iter_user_ratings(user_ids: Iterable[int] | None = None) -> Generator[Tuple[
             cur.execute(q, ids)
         else:
             cur.execute("SELECT user_id, movie_id, rating, timestamp FROM ratings ORDER BY user_id")
-        for row in cur:
-            yield int(row[0]), int(row[1]), float(row[2]), int(row[3])
+        try:
+            yield from column_chunks(cur, RATING_COLUMNS, batch_rows)
+        finally:
+            cur.close()
+
+def iter_user_ratings(user_ids: Iterable[int] | None = None) -> Generator[Tuple[int,int,float,int], None, None]:
+    """
+    Yields (user_id, movie_id, rating, timestamp) one row at a time.
+    Use for streaming/online algorithms without loading everything into memory
+    (rows are fetched in batches; see iter_user_rating_chunks).
+    """
+    for chunk in iter_user_rating_chunks(user_ids):
+        yield from zip(
+            chunk["user_id"].tolist(), chunk["movie_id"].tolist(),
+            chunk["rating"].tolist(), chunk["timestamp"].tolist(),
+        )
+
+@traced("load_history")
+def load_user_history(user_id: int, newest_first: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (movie_ids, ratings) arrays for a single user, most recent rating
+    first if `newest_first`.
+    Cheap per-request alternative to filtering the full ratings DataFrame.
+    """
+    order = " ORDER BY timestamp DESC" if newest_first else ""
+    with get_db(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT movie_id, rating FROM ratings WHERE user_id = {PH}{order}", (int(user_id),))
+        rows = cur.fetchall()
+    if not rows:
+        return np.empty(0, dtype=ID_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+    mids, vals = zip(*rows)
+    return np.asarray(mids, dtype=ID_DTYPE), np.asarray(vals, dtype=VALUE_DTYPE)
+
+def user_ratings_csr(ratings: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Pack a ratings DataFrame into per-user CSR arrays:
+      user_ids (sorted, int32), indptr (int64), movie_ids (int32), ratings (float32)
+    User i's history is movie_ids[indptr[i]:indptr[i+1]] (same for ratings).
+    Flat arrays (unlike a dict of per-user arrays) can go into shared memory.
+    """
+    df = ratings.sort_values("user_id", kind="stable")
+    uids = df["user_id"].to_numpy(dtype=ID_DTYPE)
+    user_ids, counts = np.unique(uids, return_counts=True)
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return {
+        "user_ids": user_ids,
+        "indptr": indptr,
+        "movie_ids": df["movie_id"].to_numpy(dtype=ID_DTYPE),
+        "ratings": df["rating"].to_numpy(dtype=VALUE_DTYPE),
+    }
+
+def csr_history(csr: dict[str, np.ndarray], pos: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(movie_ids, ratings) of the user at row `pos` of a user_ratings_csr() pack."""
+    a, b = csr["indptr"][pos], csr["indptr"][pos + 1]
+    return csr["movie_ids"][a:b], csr["ratings"][a:b]
 
 def get_movie_titles(movie_ids: Iterable[int]) -> dict[int, str]:
     """
@@ -105,6 +210,24 @@ def get_movie_titles(movie_ids: Iterable[int]) -> dict[int, str]:
         rows = cur.fetchall()
     return {int(mid): title for (mid, title) in rows}
 
+def get_movie_info(movie_ids: Iterable[int]) -> dict[int, dict]:
+    """
+    Returns {movie_id: {"title", "poster_url", "year", "genres"}} for a list of IDs,
+    the metadata recommendation responses attach to each movie.
+    """
+    ids = [int(m) for m in movie_ids]
+    if not ids:
+        return {}
+    q = f"SELECT movie_id, title, poster_url, year, genres FROM movies WHERE movie_id IN ({ph_list(len(ids))})"
+    with get_db(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(q, ids)
+        rows = cur.fetchall()
+    return {
+        int(mid): {"title": title, "poster_url": poster, "year": year, "genres": genres}
+        for (mid, title, poster, year, genres) in rows
+    }
+
 def load_ratings_data():
     """Load ratings data using SQLAlchemy engine for pandas compatibility."""
     engine = _sa_engine_for_loader()
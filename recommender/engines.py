@@ -0,0 +1,33 @@
+"""
+engines.py
+Registry of recommender engines usable by batch jobs.
+
+Every engine module exposes the same two functions:
+  fit(ratings_df, movies_df)                       -> dict[str, np.ndarray] model
+  score_user(model, rated_ids, rated_vals, k)      -> [(movie_id, score), ...]
+Models are plain dicts of NumPy arrays so they can be saved, shared and
+measured without engine-specific code.
+
+Optional: score_scratch_bytes(model, max_history) (see recommender.parallel)
+and QUANTIZE_KEY, the item matrix that can be scored in int8 (see
+recommender.quantize).
+"""
+
+from __future__ import annotations
+import importlib
+from types import ModuleType
+
+ENGINES: dict[str, str] = {
+    "item_item": "recommender.baseline",
+    "content": "recommender.content",
+    "factor": "recommender.factor",
+    "popular": "recommender.popular",
+}
+
+
+def get_engine(name: str) -> ModuleType:
+    """Return the engine module registered under `name`."""
+    try:
+        return importlib.import_module(ENGINES[name])
+    except KeyError:
+        raise ValueError(f"unknown engine {name!r}; choose from {sorted(ENGINES)}") from None
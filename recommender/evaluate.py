@@ -0,0 +1,269 @@
+"""
+evaluate.py
+Offline quality + speed evaluation for every registered engine.
+
+    python -m recommender.evaluate                                   # all engines, leave-one-out
+    python -m recommender.evaluate --split time --test-fraction 0.2 --k 10
+    python -m recommender.evaluate --engine factor --max-users 200 --output reports/factor.json
+    python -m recommender.evaluate --quantized              # + "<engine>+int8" variants
+
+Reads the MovieLens CSVs directly (default data/ml-latest-small), splits
+them, fits each engine on the train part and scores test users in parallel
+(recommender.parallel). The JSON report is written with sorted keys so two
+runs can be compared with a plain diff.
+
+Quality: precision / recall / NDCG @k and catalog coverage, where the
+relevant items of a user are their held-out ratings >= --relevance.
+Speed: fit time, per-user scoring latency p50/p95/p99, users/s throughput.
+Memory: model size per engine, and at the top level the peak RSS of this
+process and its worker processes over the whole run (ru_maxrss is a
+high-water mark, so a per-engine reading would include earlier engines).
+
+--quantized also evaluates every engine with a QUANTIZE_KEY in int8 scoring
+mode (recommender.quantize) and reports it as "<engine>+int8" with a
+"vs_exact" block: recall/ndcg deltas, overlap with the exact top-k, scoring
+speedup and the item-matrix bytes scanned per user.
+"""
+
+from __future__ import annotations
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from recommender.engines import ENGINES, get_engine
+from recommender.data_loader import user_ratings_csr
+from recommender.parallel import parse_bytes, score_users
+from recommender.quantize import quantize_model, scan_bytes
+
+DEFAULT_DATA = Path(__file__).resolve().parent.parent / "data" / "ml-latest-small"
+
+
+def load_movielens_csv(path: Path | str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """ratings (user_id, movie_id, rating, timestamp) and movies (movie_id, title, year, genres)"""
+    from database.load_movielens import parse_year
+
+    src = Path(path)
+    ratings = pd.read_csv(src / "ratings.csv").rename(columns={"userId": "user_id", "movieId": "movie_id"})
+    movies = pd.read_csv(src / "movies.csv").rename(columns={"movieId": "movie_id"})
+    movies["year"] = movies["title"].map(parse_year)
+    return ratings, movies[["movie_id", "title", "year", "genres"]]
+
+
+def split_leave_one_out(ratings: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """hold out each user's most recent rating (users with >= 2 ratings)"""
+    df = ratings.sort_values(["user_id", "timestamp", "movie_id"], kind="stable")
+    last = ~df.duplicated("user_id", keep="last")
+    counts = df.groupby("user_id")["movie_id"].transform("size")
+    test_mask = last & (counts >= 2)
+    return df[~test_mask], df[test_mask]
+
+
+def split_by_time(ratings: pd.DataFrame, test_fraction: float = 0.2) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """global time cut: the newest `test_fraction` of ratings form the test set"""
+    cutoff = ratings["timestamp"].quantile(1.0 - test_fraction)
+    train = ratings[ratings["timestamp"] < cutoff]
+    test = ratings[ratings["timestamp"] >= cutoff]
+    # only users with some history can be scored
+    return train, test[test["user_id"].isin(train["user_id"].unique())]
+
+
+def ranking_metrics(recommended: Sequence[int], relevant: set, k: int) -> Tuple[float, float, float]:
+    """(precision@k, recall@k, ndcg@k) with binary relevance"""
+    hits = [1.0 if mid in relevant else 0.0 for mid in list(recommended)[:k]]
+    n_hits = sum(hits)
+    dcg = sum(h / np.log2(i + 2) for i, h in enumerate(hits))
+    idcg = sum(1.0 / np.log2(i + 2) for i in range(min(len(relevant), k)))
+    return n_hits / k, n_hits / len(relevant), (dcg / idcg if idcg else 0.0)
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 / 1024 ** 2 if platform.system() == "Darwin" else 1 / 1024
+    return {
+        "self_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        "workers_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+
+def evaluate_engine(name: str, train: pd.DataFrame, test: pd.DataFrame, movies: pd.DataFrame,
+                    k: int = 10, relevance: float = 3.5, workers: int | None = None,
+                    chunk_size: int = 32, memory_budget: int | None = None,
+                    quantize: bool = False, recs_out: Dict[int, list] | None = None) -> dict:
+    relevant: Dict[int, set] = {
+        int(uid): set(g["movie_id"].astype(int))
+        for uid, g in test[test["rating"] >= relevance].groupby("user_id")
+    }
+
+    engine = get_engine(name)
+    t0 = time.perf_counter()
+    model = engine.fit(train, movies)
+    fit_seconds = time.perf_counter() - t0
+    if quantize:
+        model = quantize_model(model, engine.QUANTIZE_KEY)
+
+    csr = user_ratings_csr(train)
+    precision, recall, ndcg, latencies = [], [], [], []
+    recommended_items: set = set()
+    t0 = time.perf_counter()
+    for uid, recs, seconds in score_users(name, model, csr, top_n=k, user_ids=sorted(relevant),
+                                          workers=workers, chunk_size=chunk_size,
+                                          memory_budget=memory_budget, with_timing=True):
+        latencies.append(seconds)
+        mids = [mid for mid, _ in recs]
+        recommended_items.update(mids)
+        if recs_out is not None:
+            recs_out[uid] = mids
+        p, r, n = ranking_metrics(mids, relevant[uid], k)
+        precision.append(p)
+        recall.append(r)
+        ndcg.append(n)
+    wall = time.perf_counter() - t0
+
+    lat_ms = np.asarray(latencies) * 1000.0
+    n_items = len(model["movie_ids"])
+    return {
+        "quality": {
+            f"precision@{k}": round(float(np.mean(precision)), 5) if precision else 0.0,
+            f"recall@{k}": round(float(np.mean(recall)), 5) if recall else 0.0,
+            f"ndcg@{k}": round(float(np.mean(ndcg)), 5) if ndcg else 0.0,
+            "coverage": round(len(recommended_items) / n_items, 5) if n_items else 0.0,
+            "users_evaluated": len(latencies),
+        },
+        "speed": {
+            "fit_seconds": round(fit_seconds, 3),
+            "score_wall_seconds": round(wall, 3),
+            "throughput_users_per_s": round(len(latencies) / wall, 1) if wall > 0 else 0.0,
+            "latency_ms": {
+                f"p{q}": round(float(np.percentile(lat_ms, q)), 3) if lat_ms.size else 0.0
+                for q in (50, 95, 99)
+            },
+        },
+        "memory": {
+            "model_mb": round(sum(a.nbytes for a in model.values()) / 1e6, 2),
+            **({"scan_mb": round(scan_bytes(model, engine.QUANTIZE_KEY) / 1e6, 3)}
+               if hasattr(engine, "QUANTIZE_KEY") else {}),
+        },
+    }
+
+
+def compare_quantized(exact: dict, quantized: dict, exact_recs: Dict[int, list],
+                      quantized_recs: Dict[int, list], k: int) -> dict:
+    """what int8 scoring costs in quality and gains in speed / bytes scanned"""
+    eq, qq = exact["quality"], quantized["quality"]
+    overlap = [
+        len(set(exact_recs[uid]) & set(quantized_recs.get(uid, []))) / len(exact_recs[uid])
+        for uid in exact_recs if exact_recs[uid]
+    ]
+    e_p50, q_p50 = exact["speed"]["latency_ms"]["p50"], quantized["speed"]["latency_ms"]["p50"]
+    e_scan, q_scan = exact["memory"]["scan_mb"], quantized["memory"]["scan_mb"]
+    return {
+        f"recall@{k}_delta": round(qq[f"recall@{k}"] - eq[f"recall@{k}"], 5),
+        f"ndcg@{k}_delta": round(qq[f"ndcg@{k}"] - eq[f"ndcg@{k}"], 5),
+        f"top{k}_overlap": round(float(np.mean(overlap)), 5) if overlap else 0.0,
+        "p50_speedup": round(e_p50 / q_p50, 2) if q_p50 else 0.0,
+        "scan_reduction": round(e_scan / q_scan, 2) if q_scan else 0.0,
+    }
+
+
+def run(engines: Sequence[str], data: Path | str = DEFAULT_DATA, split: str = "loo",
+        test_fraction: float = 0.2, k: int = 10, relevance: float = 3.5, max_users: int | None = None,
+        seed: int = 0, workers: int | None = None, chunk_size: int = 32,
+        memory_budget: int | None = None, quantized: bool = False) -> dict:
+    ratings, movies = load_movielens_csv(data)
+    if max_users:
+        users = ratings["user_id"].unique()
+        if len(users) > max_users:
+            keep = np.random.default_rng(seed).choice(users, size=max_users, replace=False)
+            ratings = ratings[ratings["user_id"].isin(keep)]
+    if split == "time":
+        train, test = split_by_time(ratings, test_fraction)
+    else:
+        train, test = split_leave_one_out(ratings)
+
+    report = {
+        "config": {
+            "data": str(Path(data).name),
+            "split": split,
+            "test_fraction": test_fraction if split == "time" else None,
+            "k": k,
+            "relevance": relevance,
+            "max_users": max_users,
+            "seed": seed,
+            "workers": workers,
+            "quantized": quantized,
+        },
+        "dataset": {
+            "train_ratings": int(len(train)),
+            "test_ratings": int(len(test)),
+            "users": int(ratings["user_id"].nunique()),
+            "movies": int(len(movies)),
+        },
+        "engines": {},
+    }
+    options = dict(k=k, relevance=relevance, workers=workers, chunk_size=chunk_size, memory_budget=memory_budget)
+    for name in engines:
+        variants = [(name, False)]
+        if quantized and hasattr(get_engine(name), "QUANTIZE_KEY"):
+            variants.append((f"{name}+int8", True))
+        recs: Dict[str, Dict[int, list]] = {}
+        for label, quantize in variants:
+            recs[label] = {}
+            report["engines"][label] = evaluate_engine(
+                name, train, test, movies, quantize=quantize, recs_out=recs[label], **options,
+            )
+            q = report["engines"][label]["quality"]
+            sp = report["engines"][label]["speed"]
+            print(f"{label:>14}: ndcg@{k}={q[f'ndcg@{k}']:.4f}  fit={sp['fit_seconds']:.2f}s  "
+                  f"p95={sp['latency_ms']['p95']:.2f}ms  {sp['throughput_users_per_s']:.0f} users/s",
+                  file=sys.stderr)
+        if len(variants) > 1:
+            label = variants[1][0]
+            report["engines"][label]["vs_exact"] = compare_quantized(
+                report["engines"][name], report["engines"][label], recs[name], recs[label], k,
+            )
+    report["memory"] = _peak_rss_mb()
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Evaluate recommender engines offline.")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), help="engine (repeatable; default: all)")
+    parser.add_argument("--data", type=Path, default=DEFAULT_DATA, help="MovieLens CSV directory")
+    parser.add_argument("--split", choices=["loo", "time"], default="loo", help="leave-one-out or global time split")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="newest share of ratings held out (time split)")
+    parser.add_argument("--k", type=int, default=10, help="cutoff for @k metrics")
+    parser.add_argument("--relevance", type=float, default=3.5, help="held-out rating counted as relevant")
+    parser.add_argument("--max-users", type=int, default=None, help="evaluate a random sample of users")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="users per worker task")
+    parser.add_argument("--memory-budget", type=parse_bytes, default=None, help="e.g. 4G")
+    parser.add_argument("--quantized", action="store_true",
+                        help="also evaluate int8 scoring (with exact re-rank) where engines support it")
+    parser.add_argument("--output", type=Path, default=None, help="JSON report path (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.engine or sorted(ENGINES), data=args.data, split=args.split,
+        test_fraction=args.test_fraction, k=args.k, relevance=args.relevance,
+        max_users=args.max_users, seed=args.seed, workers=args.workers,
+        chunk_size=args.chunk_size, memory_budget=args.memory_budget, quantized=args.quantized,
+    )
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
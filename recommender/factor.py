@@ -0,0 +1,147 @@
+"""
+factor.py
+Latent factor recommender: truncated SVD of the mean-centered rating matrix.
+
+The SVD is computed with a randomized range finder working directly on the
+(user, movie, rating) triples, so the users x items matrix is never
+materialized. Users are scored by folding their rating history into the
+item factor space, which also works for users who joined after the fit.
+"""
+
+from __future__ import annotations
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+
+from recommender.ids import ID_DTYPE, VALUE_DTYPE, id_rows
+from recommender.quantize import is_quantized, rerank_size, shortlist
+from tracing import span
+
+N_FACTORS = 32
+OVERSAMPLE = 10
+POWER_ITERS = 2
+SPMM_CHUNK = 1_000_000
+#matrix that `train --quantize` stores as int8 (see recommender.quantize)
+QUANTIZE_KEY = "item_factors"
+
+
+def _spmm(rows: np.ndarray, cols: np.ndarray, vals: np.ndarray, B: np.ndarray, n_out: int) -> np.ndarray:
+    """(sparse COO matrix) @ B, one bincount per output column, chunked over nnz."""
+    out = np.zeros((n_out, B.shape[1]))
+    for s in range(0, len(vals), SPMM_CHUNK):
+        r, c, v = rows[s:s + SPMM_CHUNK], cols[s:s + SPMM_CHUNK], vals[s:s + SPMM_CHUNK]
+        Bc = B[c]
+        for j in range(B.shape[1]):
+            out[:, j] += np.bincount(r, weights=v * Bc[:, j], minlength=n_out)
+    return out
+
+
+def fit(ratings: pd.DataFrame, movies: pd.DataFrame | None = None,
+        n_factors: int = N_FACTORS, seed: int = 0) -> dict[str, np.ndarray]:
+    """
+    Fit item factors from a ratings DataFrame.
+    Returns {"item_factors": items x f float32, "singular_values": f, "movie_ids": sorted int32 row order}.
+    The SVD itself runs in float64.
+    """
+    movie_ids, item_idx = np.unique(ratings["movie_id"].to_numpy(dtype=ID_DTYPE), return_inverse=True)
+    _, user_idx = np.unique(ratings["user_id"].to_numpy(dtype=ID_DTYPE), return_inverse=True)
+    item_idx, user_idx = item_idx.astype(np.int32), user_idx.astype(np.int32)
+    vals = ratings["rating"].to_numpy(dtype=float)
+    n_users, n_items = int(user_idx.max()) + 1 if len(vals) else 0, len(movie_ids)
+    if n_users == 0 or n_items == 0:
+        return {"item_factors": np.zeros((0, 0), dtype=VALUE_DTYPE), "singular_values": np.zeros(0, dtype=VALUE_DTYPE),
+                "movie_ids": movie_ids}
+
+    # center each user's ratings on their own mean
+    sums = np.bincount(user_idx, weights=vals, minlength=n_users)
+    counts = np.bincount(user_idx, minlength=n_users)
+    centered = vals - (sums / np.maximum(counts, 1))[user_idx]
+
+    f = min(n_factors, n_users, n_items)
+    ell = min(f + OVERSAMPLE, n_users, n_items)
+    rng = np.random.default_rng(seed)
+
+    def A(B):      # users x items  @  items x l
+        return _spmm(user_idx, item_idx, centered, B, n_users)
+
+    def At(B):     # items x users  @  users x l
+        return _spmm(item_idx, user_idx, centered, B, n_items)
+
+    Q, _ = np.linalg.qr(A(rng.standard_normal((n_items, ell))))
+    for _ in range(POWER_ITERS):
+        Z, _ = np.linalg.qr(At(Q))
+        Q, _ = np.linalg.qr(A(Z))
+    Bt = At(Q)                                   # items x l  ==  (Q.T @ A).T
+    V, S, _ = np.linalg.svd(Bt, full_matrices=False)
+    return {"item_factors": V[:, :f].astype(VALUE_DTYPE), "singular_values": S[:f].astype(VALUE_DTYPE),
+            "movie_ids": movie_ids}
+
+
+def _fold_in(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray):
+    """(user vector p, user mean, rows of the rated items), or None if no rated item is known"""
+    V = model["item_factors"]
+    if V.size == 0 or len(rated_ids) == 0:
+        return None
+    rated_vals = np.asarray(rated_vals, dtype=V.dtype)
+    mu = float(rated_vals.mean())
+    rated_idx, known = id_rows(model["movie_ids"], rated_ids)
+    if not known.any():
+        return None
+    return V[rated_idx].T @ (rated_vals[known] - mu), mu, rated_idx
+
+
+def score_user(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray, k: int = 20) -> List[Tuple[int, float]]:
+    """
+    Fold a (movie_ids, ratings) history into factor space and score all items.
+    Scores are predicted ratings (user mean + low-rank deviation).
+    """
+    V, movie_ids = model["item_factors"], model["movie_ids"]
+    folded = _fold_in(model, rated_ids, rated_vals)
+    if folded is None:
+        return []
+    p, mu, rated_idx = folded
+    if is_quantized(model, QUANTIZE_KEY):
+        # int8 pass for a shortlist, exact float scores for the shortlist only
+        with span("factor.score_int8"):
+            cand = shortlist(model, QUANTIZE_KEY, p, rerank_size(k), exclude=rated_idx)
+            scores = V[cand] @ p + mu
+        movie_ids = movie_ids[cand]
+    else:
+        with span("factor.score"):
+            scores = V @ p + mu
+        scores[rated_idx] = -np.inf
+
+    k = int(min(k, scores.shape[0]))
+    if k <= 0:
+        return []
+    with span("factor.top_k"):
+        top_idx = np.argpartition(scores, -k)[-k:]
+        top_idx = top_idx[np.argsort(scores[top_idx])[::-1]]
+        return [(int(movie_ids[i]), float(scores[i])) for i in top_idx if np.isfinite(scores[i])]
+
+
+def score_items(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray,
+                candidate_ids: np.ndarray) -> np.ndarray:
+    """
+    Predicted ratings of `candidate_ids` only (-inf for ids the model does
+    not know); cost follows the candidate count, not the catalog size.
+    """
+    out = np.full(len(candidate_ids), -np.inf, dtype=np.float32)
+    folded = _fold_in(model, rated_ids, rated_vals)
+    if folded is None:
+        return out
+    p, mu, _ = folded
+    rows, found = id_rows(model["movie_ids"], candidate_ids)
+    with span("factor.score_items"):
+        out[found] = model["item_factors"][rows] @ p + mu
+    return out
+
+
+def recommend_for_user(user_id: int, k: int = 20) -> List[Tuple[int, float]]:
+    from .artifacts import get_model
+    from .data_loader import load_user_history
+
+    rated_ids, rated_vals = load_user_history(user_id)
+    if rated_ids.size == 0:
+        return []
+    return score_user(get_model("factor"), rated_ids, rated_vals, k)
@@ -0,0 +1,285 @@
+"""
+fallback.py
+Deadline for personalized recommendations, with popular-unseen movies served
+from memory when the deadline passes.
+
+    items = with_deadline("content", personalized_titles_for_user, user_id, k,
+                          cache_key=key_content_recs(user_id, k))
+
+The personalized call (model load + scoring + metadata) runs on a small
+thread pool in a copy of the caller's context, so its spans stay in the
+request's trace. If it has not returned after RECS_DEADLINE_MS, or it fails,
+the request gets the top of popular_fallback instead: the ranking of
+database.db_query.top_unseen_for_user, snapshotted in memory (with metadata)
+and filtered by the user's history, so no GROUP BY and no model runs on the
+slow path. Concurrent requests for the same list wait on one call instead
+of queueing more. When every request waiting on a call has fallen back, the
+call is cancelled if it has not started yet; a call already running keeps
+going and fills the recs cache for the next request. At most
+RECS_MAX_PENDING calls are queued or running at once: past that, requests
+fall back right away instead of growing the backlog while models stall.
+
+Every item carries "source": precomputed | live | fallback, and responses are
+counted in recs_served_total{engine, source}; fallbacks also in
+recs_fallback_total{engine, reason} (reason: deadline | error | overload).
+
+The snapshot is built in the background at startup (refresh_async), rebuilt
+after RECS_FALLBACK_TTL seconds or a dataset merge, and the last good one is
+served meanwhile. Until the first snapshot exists there is nothing to fall
+back to and requests wait for the personalized call as before.
+"""
+
+from __future__ import annotations
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from cache import cache
+from database.events import subscribe
+from metrics import registry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+RECS_DEADLINE_MS = float(os.getenv("RECS_DEADLINE_MS", "300"))
+FALLBACK_WORKERS = int(os.getenv("RECS_FALLBACK_WORKERS", "4"))
+#personalized calls queued or running at once
+MAX_PENDING = int(os.getenv("RECS_MAX_PENDING", str(4 * FALLBACK_WORKERS)))
+#popular movies kept in memory; users who rated more of them than this get fewer recs
+FALLBACK_SIZE = int(os.getenv("RECS_FALLBACK_SIZE", "2000"))
+FALLBACK_TTL = int(os.getenv("RECS_FALLBACK_TTL", "3600"))
+
+RECS_SERVED = registry.counter(
+    "recs_served_total", "Recommendation lists served, by engine and source.", ["engine", "source"],
+)
+RECS_FALLBACKS = registry.counter(
+    "recs_fallback_total", "Personalized recommendations replaced by popular-unseen.", ["engine", "reason"],
+)
+
+
+class PopularFallback:
+    """in-memory snapshot of top_unseen_for_user for a user with no ratings"""
+
+    def __init__(self, size: int = FALLBACK_SIZE, ttl: int = FALLBACK_TTL):
+        self.size = int(size)
+        self.ttl = int(ttl)
+        self._items: Optional[List[dict]] = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._built_at = 0.0
+        self._stale = False
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshes = 0
+        self._failures = 0
+
+    def ready(self) -> bool:
+        return self._items is not None
+
+    def refresh(self) -> None:
+        """rebuild the snapshot now (one GROUP BY over ratings)"""
+        from database.db_query import top_unseen_for_user
+
+        with span("fallback.refresh"):
+            rows = top_unseen_for_user(-1, limit=self.size)   # no user has id -1: nothing is "seen"
+        items = [
+            {"movie_id": r["movie_id"], "title": r["title"], "score": r["weighted_rating"],
+             "poster_url": r["poster_url"], "year": r["year"], "genres": r["genres"]}
+            for r in rows
+        ]
+        ids = np.asarray([it["movie_id"] for it in items], dtype=np.int64)
+        with self._lock:
+            self._items, self._ids = items, ids
+            self._built_at = time.monotonic()
+            self._stale = False
+            self._refreshes += 1
+
+    def refresh_async(self) -> bool:
+        """rebuild on a daemon thread; False if a rebuild is already running"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name="recs-fallback-refresh", daemon=True).start()
+        return True
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            with self._lock:
+                self._failures += 1
+            logger.exception("popular fallback refresh failed")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            self._stale = True
+
+    def top_unseen(self, seen_ids: np.ndarray, k: int) -> List[dict]:
+        """first k snapshot movies not in `seen_ids` (copies, safe to tag)"""
+        with self._lock:
+            items, ids = self._items, self._ids
+            expired = self._stale or time.monotonic() - self._built_at > self.ttl
+        if expired:
+            self.refresh_async()
+        if items is None:
+            return []
+        keep = np.flatnonzero(~np.isin(ids, seen_ids))[: max(int(k), 0)]
+        return [dict(items[i]) for i in keep]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self._items is not None,
+                "items": len(self._ids),
+                "age_s": round(time.monotonic() - self._built_at, 1) if self._items is not None else None,
+                "stale": self._stale,
+                "refreshes": self._refreshes,
+                "failures": self._failures,
+            }
+
+
+popular_fallback = PopularFallback()
+
+
+@subscribe
+def on_dataset_changed(changes) -> None:
+    """database.events subscriber: vote counts moved, rebuild the snapshot"""
+    if changes.changed("ratings") or changes.movie_ids:
+        popular_fallback.mark_stale()
+        popular_fallback.refresh_async()
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+#reentrant: cancelling under it runs the done callback (_forget) right away
+_flight_lock = threading.RLock()
+_slots = threading.BoundedSemaphore(max(MAX_PENDING, 1))
+#cache key -> [personalized call not finished yet, requests still waiting on it]
+_in_flight: Dict[Hashable, list] = {}
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=FALLBACK_WORKERS, thread_name_prefix="recs")
+    return _pool
+
+
+def _submit(key: Hashable, fn: Callable[..., List[dict]], *args) -> Optional[Future]:
+    """the call for `key`, shared with concurrent requests; None if MAX_PENDING calls are outstanding"""
+    pool = _executor()
+    with _flight_lock:
+        entry = _in_flight.get(key)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0]
+        if not _slots.acquire(blocking=False):
+            return None
+        fut = pool.submit(contextvars.copy_context().run, fn, *args)
+        _in_flight[key] = [fut, 1]
+    fut.add_done_callback(lambda f: _forget(key, f))
+    return fut
+
+
+def _forget(key: Hashable, fut: Future) -> None:
+    with _flight_lock:
+        entry = _in_flight.get(key)
+        if entry is not None and entry[0] is fut:
+            del _in_flight[key]
+    _slots.release()
+
+
+def _give_up(key: Hashable, fut: Future) -> None:
+    """a request stopped waiting on `fut`; the last one out cancels it if it has not started"""
+    with _flight_lock:
+        entry = _in_flight.get(key)
+        if entry is None or entry[0] is not fut:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            fut.cancel()        # no-op once running
+
+
+def _served(engine: str, items: List[dict]) -> List[dict]:
+    RECS_SERVED.inc(engine=engine, source=items[0].get("source", "live") if items else "empty")
+    return items
+
+
+def _fallback(engine: str, user_id: int, k: int, score_key: str) -> List[dict]:
+    from recommender.data_loader import load_user_history
+
+    with span("fallback.popular"):
+        try:
+            seen, _ = load_user_history(user_id)
+        except Exception:
+            logger.exception("fallback: history for user %s unavailable, not filtering seen movies", user_id)
+            seen = np.empty(0, dtype=np.int64)
+        items = popular_fallback.top_unseen(seen, k)
+    for it in items:
+        it[score_key] = it.pop("score")
+        it["source"] = "fallback"
+    return items
+
+
+def with_deadline(
+    engine: str,
+    titles_fn: Callable[[int, int], List[dict]],
+    user_id: Optional[int],
+    k: int,
+    deadline_ms: Optional[float] = None,
+    cache_key: Optional[Hashable] = None,
+    score_key: str = "score",
+) -> List[dict]:
+    """
+    titles_fn(user_id, k), or popular-unseen items if it takes longer than
+    `deadline_ms` (default RECS_DEADLINE_MS) or raises. `cache_key` is
+    titles_fn's recs-cache key: a cached list is returned without the pool.
+    `score_key` names the score field of titles_fn's items.
+    """
+    key = cache_key if cache_key is not None else (engine, user_id, int(k))
+    hit = cache.get(key) if cache_key is not None else None
+    if hit is not None:
+        return _served(engine, hit)
+    if user_id is None:
+        # anonymous: nothing personal to wait for
+        return _served(engine, titles_fn(user_id, k))
+
+    deadline_ms = float(RECS_DEADLINE_MS if deadline_ms is None else deadline_ms)
+    fut = _submit(key, titles_fn, user_id, k)
+    if fut is None:
+        if not popular_fallback.ready():
+            # nothing to serve instead: score in the request, as without a deadline
+            popular_fallback.refresh_async()
+            return _served(engine, titles_fn(user_id, k))
+        RECS_FALLBACKS.inc(engine=engine, reason="overload")
+        return _served(engine, _fallback(engine, user_id, k, score_key))
+
+    with span(f"{engine}.deadline_wait"):
+        done, _ = wait([fut], timeout=max(deadline_ms, 0.0) / 1000.0)
+
+    if fut in done and not fut.cancelled() and fut.exception() is None:
+        return _served(engine, fut.result())
+    reason = "error" if fut in done and not fut.cancelled() else "deadline"
+    if not popular_fallback.ready():
+        popular_fallback.refresh_async()
+        if reason == "error":
+            raise fut.exception()
+        logger.warning("%s recs for user %s over %.0fms, no popular fallback yet; waiting", engine, user_id, deadline_ms)
+        return _served(engine, fut.result())
+    if reason == "error":
+        logger.warning("%s recs for user %s failed, serving popular fallback: %r", engine, user_id, fut.exception())
+    else:
+        _give_up(key, fut)
+    RECS_FALLBACKS.inc(engine=engine, reason=reason)
+    return _served(engine, _fallback(engine, user_id, k, score_key))
@@ -0,0 +1,171 @@
+"""
+hybrid.py
+Blend several engines' recommendations, scored concurrently under a
+per-request deadline.
+
+    recs, report = recommend(user_id, k=20)                 # HYBRID_WEIGHTS, HYBRID_DEADLINE_MS
+    recs, report = recommend(user_id, k=20, weights={"factor": 1.0, "content": 0.5}, deadline_ms=80)
+
+Every weighted engine loads its model and scores the user's history on a
+shared thread pool, each task in a copy of the caller's context so its
+tracing spans land in the request's trace. Engines still running when the
+deadline passes are dropped (their threads finish in the background and the
+result is discarded), as are engines that fail; the blend uses the rest, so
+tail latency follows the deadline rather than the slowest engine. Drops are
+counted in hybrid_engine_dropped_total{engine, reason}.
+
+Blending: each engine's top HYBRID_POOL_FACTOR * k scores are min-max scaled
+to [0, 1] (engines score on different scales) and summed with the engine's
+weight; a movie missing from an engine's list gets nothing from it.
+"""
+
+from __future__ import annotations
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import registry
+from recommender.artifacts import get_model
+from recommender.data_loader import get_movie_info, load_user_history
+from recommender.engines import ENGINES, get_engine
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """"factor=0.5,content=0.2" (or name:weight) -> {engine: weight}; zero weights are left out"""
+    weights: Dict[str, float] = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, sep, value = part.replace(":", "=").partition("=")
+        name = name.strip()
+        if name not in ENGINES:
+            raise ValueError(f"unknown engine {name!r}; choose from {sorted(ENGINES)}")
+        try:
+            weight = float(value) if sep else 1.0
+        except ValueError:
+            raise ValueError(f"invalid weight {value!r} for {name}") from None
+        if weight < 0:
+            raise ValueError(f"negative weight for {name}")
+        if weight > 0:
+            weights[name] = weight
+    return weights
+
+
+HYBRID_WEIGHTS = parse_weights(os.getenv("HYBRID_WEIGHTS", "factor=0.5,item_item=0.3,content=0.2"))
+HYBRID_DEADLINE_MS = float(os.getenv("HYBRID_DEADLINE_MS", "150"))
+HYBRID_WORKERS = int(os.getenv("HYBRID_WORKERS", "8"))
+#recs taken from each engine per blended rec
+HYBRID_POOL_FACTOR = 3
+
+ENGINE_DROPS = registry.counter(
+    "hybrid_engine_dropped_total", "Engines left out of a hybrid blend.", ["engine", "reason"],
+)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HYBRID_WORKERS, thread_name_prefix="hybrid")
+    return _pool
+
+
+def _score(name: str, rated_ids: np.ndarray, rated_vals: np.ndarray, n: int) -> Tuple[List[Tuple[int, float]], float]:
+    t0 = time.perf_counter()
+    with span(f"hybrid.{name}"):
+        recs = get_engine(name).score_user(get_model(name), rated_ids, rated_vals, n)
+    return recs, (time.perf_counter() - t0) * 1000.0
+
+
+def blend(results: Dict[str, List[Tuple[int, float]]], weights: Dict[str, float], k: int) -> List[Tuple[int, float, List[str]]]:
+    """top-k (movie_id, blended score, engines that proposed it)"""
+    totals: Dict[int, float] = {}
+    engines: Dict[int, List[str]] = {}
+    for name, recs in results.items():
+        if not recs:
+            continue
+        scores = np.asarray([s for _, s in recs], dtype=float)
+        lo, width = scores.min(), scores.max() - scores.min()
+        scaled = (scores - lo) / width if width > 0 else np.ones_like(scores)
+        for (mid, _), s in zip(recs, scaled):
+            totals[mid] = totals.get(mid, 0.0) + weights[name] * float(s)
+            engines.setdefault(mid, []).append(name)
+    ranked = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+    return [(mid, score, engines[mid]) for mid, score in ranked]
+
+
+def recommend(
+    user_id: int, k: int = 20, weights: Optional[Dict[str, float]] = None, deadline_ms: Optional[float] = None,
+) -> Tuple[List[Tuple[int, float, List[str]]], dict]:
+    """
+    Blended top-k (movie_id, score, engines) plus a report:
+    {"deadline_ms", "engines": {name: {"weight", "status": ok|deadline|error, "ms", "items"}}}.
+    The deadline covers the history query too.
+    """
+    weights = weights or HYBRID_WEIGHTS
+    deadline_ms = float(deadline_ms or HYBRID_DEADLINE_MS)
+    t0 = time.perf_counter()
+    deadline_at = t0 + deadline_ms / 1000.0
+    report: dict = {"deadline_ms": deadline_ms, "engines": {}}
+    if k <= 0:
+        return [], report
+
+    rated_ids, rated_vals = load_user_history(user_id)
+    if rated_ids.size == 0:
+        return [], report
+
+    pool = _executor()
+    n = HYBRID_POOL_FACTOR * int(k)
+    futures = {
+        pool.submit(contextvars.copy_context().run, _score, name, rated_ids, rated_vals, n): name
+        for name in weights
+    }
+    with span("hybrid.wait"):
+        done, _ = wait(futures, timeout=max(0.0, deadline_at - time.perf_counter()))
+
+    results: Dict[str, List[Tuple[int, float]]] = {}
+    for fut, name in futures.items():
+        entry = {"weight": weights[name]}
+        if fut not in done:
+            fut.cancel()        # only helps if it never started
+            entry.update(status="deadline", ms=round((time.perf_counter() - t0) * 1000.0, 3))
+            ENGINE_DROPS.inc(engine=name, reason="deadline")
+        elif fut.exception() is not None:
+            logger.warning("hybrid: engine %s failed: %r", name, fut.exception())
+            entry.update(status="error")
+            ENGINE_DROPS.inc(engine=name, reason="error")
+        else:
+            recs, ms = fut.result()
+            results[name] = recs
+            entry.update(status="ok", ms=round(ms, 3), items=len(recs))
+        report["engines"][name] = entry
+
+    with span("hybrid.blend"):
+        return blend(results, weights, int(k)), report
+
+
+def recommend_titles_for_user(
+    user_id: int, k: int = 20, weights: Optional[Dict[str, float]] = None, deadline_ms: Optional[float] = None,
+) -> Tuple[List[dict], dict]:
+    """recommend() with movie metadata: ([{movie_id, title, score, engines, year, genres, poster_url}], report)"""
+    recs, report = recommend(user_id, k, weights=weights, deadline_ms=deadline_ms)
+    with span("hybrid.metadata"):
+        info = get_movie_info([mid for mid, _, _ in recs])
+    items = []
+    for mid, score, engines in recs:
+        meta = info.get(mid, {"title": f"ID {mid}", "poster_url": None, "year": None, "genres": None})
+        items.append({"movie_id": mid, "score": score, "engines": engines, **meta})
+    return items, report
@@ -0,0 +1,39 @@
+"""
+ids.py
+id -> row lookups against sorted id arrays (model movie_ids, CSR user_ids).
+
+Models keep their row order in an ascending int32 `movie_ids` array, so
+mapping ids to rows is a binary search instead of a per-call Python dict:
+
+    rows, known = id_rows(model["movie_ids"], rated_ids)
+    X[rows], rated_vals[known]
+"""
+
+from __future__ import annotations
+from typing import Tuple
+
+import numpy as np
+
+#compact dtypes of model and rating arrays
+ID_DTYPE = np.int32
+VALUE_DTYPE = np.float32
+
+
+def is_sorted(ids: np.ndarray) -> bool:
+    return len(ids) < 2 or bool(np.all(ids[1:] > ids[:-1]))
+
+
+def id_rows(sorted_ids: np.ndarray, ids) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rows, known): rows (int32) of the `ids` present in `sorted_ids`, in input
+    order, and the boolean mask over `ids` telling which were found.
+    """
+    # same dtype as the table, so searchsorted does not upcast (copy) it per call;
+    # ids are INTEGER columns in the database and always fit
+    ids = np.asarray(ids).astype(sorted_ids.dtype, copy=False)
+    if len(sorted_ids) == 0 or len(ids) == 0:
+        return np.empty(0, dtype=np.int32), np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    known = sorted_ids[pos] == ids
+    return pos[known].astype(np.int32), known
+
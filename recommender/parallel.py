@@ -0,0 +1,143 @@
+"""
+parallel.py
+Score many users across a ProcessPoolExecutor.
+
+The model arrays and the per-user rating histories (CSR form, see
+data_loader.user_ratings_csr) are placed in shared memory once; each worker
+attaches to them in its initializer and then receives only small tasks
+(ranges of CSR row positions).
+"""
+
+from __future__ import annotations
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from recommender.engines import get_engine
+from recommender.data_loader import csr_history
+from recommender import shm
+from memory import parse_bytes  # noqa: F401  (re-exported for the CLIs)
+
+logger = logging.getLogger(__name__)
+
+#rough fixed cost of a worker process (interpreter + numpy + pandas)
+WORKER_OVERHEAD_BYTES = 96 * 1024 ** 2
+
+_WORKER: dict = {}
+
+def _init_worker(engine_name: str, model_spec: shm.Spec, csr_spec: shm.Spec, top_n: int, with_timing: bool = False) -> None:
+    model, model_blocks = shm.attach_arrays(model_spec)
+    csr, csr_blocks = shm.attach_arrays(csr_spec)
+    _WORKER.update(
+        engine=get_engine(engine_name),
+        model=model,
+        csr=csr,
+        top_n=top_n,
+        with_timing=with_timing,
+        blocks=model_blocks + csr_blocks,   # keep mappings alive for the worker's lifetime
+    )
+
+
+def _score_positions(positions: np.ndarray) -> list:
+    engine, model, csr, top_n = _WORKER["engine"], _WORKER["model"], _WORKER["csr"], _WORKER["top_n"]
+    with_timing = _WORKER.get("with_timing", False)
+    out = []
+    for pos in positions:
+        rated_ids, rated_vals = csr_history(csr, int(pos))
+        t0 = time.perf_counter()
+        recs = engine.score_user(model, rated_ids, rated_vals, top_n)
+        if with_timing:
+            out.append((int(csr["user_ids"][pos]), recs, time.perf_counter() - t0))
+        else:
+            out.append((int(csr["user_ids"][pos]), recs))
+    return out
+
+
+def worker_scratch_bytes(engine_name: str, model: Dict[str, np.ndarray], csr: Dict[str, np.ndarray],
+                         chunk_size: int, top_n: int) -> int:
+    """estimate of one worker's private memory while scoring a chunk"""
+    max_hist = int(np.diff(csr["indptr"]).max()) if len(csr["user_ids"]) else 0
+    engine = get_engine(engine_name)
+    if hasattr(engine, "score_scratch_bytes"):
+        scratch = engine.score_scratch_bytes(model, max_hist)
+    else:
+        scratch = len(model["movie_ids"]) * 8 * 4
+    results = chunk_size * top_n * 64       # (int, float) tuples in the result lists
+    return WORKER_OVERHEAD_BYTES + scratch + results
+
+
+def plan_workers(requested: Optional[int], memory_budget: Optional[int], shared_bytes: int, per_worker: int) -> int:
+    """cap the worker count so shared arrays + workers fit in `memory_budget` bytes"""
+    workers = requested or os.cpu_count() or 1
+    if memory_budget is None:
+        return workers
+    available = memory_budget - shared_bytes
+    if available < per_worker:
+        raise MemoryError(
+            f"memory budget {memory_budget / 1e6:.0f} MB too small: shared arrays need "
+            f"{shared_bytes / 1e6:.0f} MB and one worker ~{per_worker / 1e6:.0f} MB"
+        )
+    fit = int(available // per_worker)
+    if fit < workers:
+        logger.info("memory budget allows %d of %d requested workers", fit, workers)
+    return max(1, min(workers, fit))
+
+
+def score_users(
+    engine_name: str,
+    model: Dict[str, np.ndarray],
+    csr: Dict[str, np.ndarray],
+    top_n: int = 20,
+    user_ids: Optional[Iterable[int]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    memory_budget: Optional[int] = None,
+    with_timing: bool = False,
+) -> Iterator[Tuple[int, List[Tuple[int, float]]]]:
+    """
+    Yield (user_id, [(movie_id, score), ...]) for all users in `csr`, or only
+    `user_ids` (unknown ids are skipped). Order follows user_id.
+    with_timing=True appends each user's scoring time in seconds to the tuple.
+    """
+    if user_ids is None:
+        positions = np.arange(len(csr["user_ids"]))
+    else:
+        wanted = np.asarray(list(user_ids), dtype=np.int64)
+        positions = np.flatnonzero(np.isin(csr["user_ids"], wanted))
+    chunk_size = max(int(chunk_size), 1)
+    tasks: Sequence[np.ndarray] = [positions[i:i + chunk_size] for i in range(0, len(positions), chunk_size)]
+    if not tasks:
+        return
+
+    shared_bytes = sum(a.nbytes for a in model.values()) + sum(a.nbytes for a in csr.values())
+    per_worker = worker_scratch_bytes(engine_name, model, csr, chunk_size, top_n)
+    n_workers = min(plan_workers(workers, memory_budget, shared_bytes, per_worker), len(tasks))
+
+    if n_workers <= 1:
+        # no pool: score in this process against the original arrays
+        _WORKER.update(engine=get_engine(engine_name), model=model, csr=csr, top_n=top_n,
+                       with_timing=with_timing, blocks=[])
+        for task in tasks:
+            yield from _score_positions(task)
+        return
+
+    model_spec, model_blocks = shm.share_arrays(model)
+    try:
+        csr_spec, csr_blocks = shm.share_arrays(csr)
+    except Exception:
+        shm.release_arrays(model_blocks, unlink=True)
+        raise
+    try:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(engine_name, model_spec, csr_spec, top_n, with_timing),
+        ) as pool:
+            for results in pool.map(_score_positions, tasks):
+                yield from results
+    finally:
+        shm.release_arrays(model_blocks + csr_blocks, unlink=True)
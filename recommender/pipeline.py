@@ -0,0 +1,184 @@
+"""
+pipeline.py
+Two-stage recommendations: cheap candidate generators feed a bounded
+candidate set into a re-ranker that scores only those movies.
+
+    from recommender.pipeline import recommend
+    recs, report = recommend(user_id, k=20)
+
+Stage 1, candidate generation. GENERATORS run in order, each limited to its
+own item budget; movies the user rated or an earlier generator already
+produced are dropped:
+  item_neighbors  item_item neighbours of the user's RECENT_ITEMS latest ratings
+  genre_popular   best movies of the user's TOP_GENRES genres (popular model)
+  popular_unseen  overall best movies the user has not rated
+Generators are skipped once MAX_CANDIDATES movies are collected or
+CANDIDATE_BUDGET_MS has been spent.
+
+Stage 2, re-ranking. The RERANKER engine's score_items() scores the candidate
+set (factor by default), so a request costs O(candidates), not O(catalog).
+
+Every stage runs in a tracing span (pipeline.<stage>); the report lists each
+stage's time, items, budget and whether it was skipped or went over budget,
+plus the generator that brought in each returned movie.
+"""
+
+from __future__ import annotations
+import os
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from recommender.artifacts import get_model
+from recommender.data_loader import get_movie_info, load_user_history
+from recommender.engines import get_engine
+from recommender.ids import ID_DTYPE, id_rows
+from recommender.popular import unseen_rows
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+RERANKER = os.getenv("PIPELINE_RERANKER", "factor")
+MAX_CANDIDATES = int(os.getenv("PIPELINE_MAX_CANDIDATES", "500"))
+CANDIDATE_BUDGET_MS = float(os.getenv("PIPELINE_CANDIDATE_BUDGET_MS", "25"))
+RERANK_BUDGET_MS = float(os.getenv("PIPELINE_RERANK_BUDGET_MS", "25"))
+RECENT_ITEMS = 20
+TOP_GENRES = 3
+
+_EMPTY = np.empty(0, dtype=ID_DTYPE)
+
+
+def _first_occurrences(ids: np.ndarray) -> np.ndarray:
+    _, first = np.unique(ids, return_index=True)
+    return ids[np.sort(first)]
+
+
+# ---------- candidate generators: (rated_ids newest first, rated_vals, n) -> movie ids, best first ----------
+def _item_neighbors(rated_ids: np.ndarray, rated_vals: np.ndarray, n: int) -> np.ndarray:
+    model = get_model("item_item")
+    if "neighbors" not in model:
+        # dense artifact from before neighbour lists
+        return _EMPTY
+    rows, known = id_rows(model["movie_ids"], rated_ids[:RECENT_ITEMS])
+    if not len(rows):
+        return _EMPTY
+    nbrs = model["neighbors"][rows].ravel()
+    votes = (model["weights"][rows] * rated_vals[:RECENT_ITEMS][known][:, None]).ravel()
+    keep = votes > 0
+    cand, inv = np.unique(nbrs[keep], return_inverse=True)
+    total = np.bincount(inv, weights=votes[keep])
+    return model["movie_ids"][cand[np.argsort(-total, kind="stable")]]
+
+
+def _genre_popular(rated_ids: np.ndarray, rated_vals: np.ndarray, n: int) -> np.ndarray:
+    model = get_model("popular")
+    rows, known = id_rows(model["movie_ids"], rated_ids)
+    if not len(rows) or model["genre_hot"].shape[1] == 0:
+        return _EMPTY
+    prefs = rated_vals[known] @ model["genre_hot"][rows]
+    top = np.argsort(-prefs, kind="stable")[:TOP_GENRES]
+    top = top[prefs[top] > 0]
+    # round-robin over the genres' lists, best of each first
+    merged = model["genre_rank"][top, : n + len(rows)].T.ravel()
+    merged = _first_occurrences(merged[merged >= 0])
+    return model["movie_ids"][merged]
+
+
+def _popular_unseen(rated_ids: np.ndarray, rated_vals: np.ndarray, n: int) -> np.ndarray:
+    model = get_model("popular")
+    seen, _ = id_rows(model["movie_ids"], rated_ids)
+    return model["movie_ids"][unseen_rows(model["rank"], seen, n)]
+
+
+#name -> (generator, default item budget), in run order
+GENERATORS: Dict[str, Tuple[Callable[[np.ndarray, np.ndarray, int], np.ndarray], int]] = {
+    "item_neighbors": (_item_neighbors, 300),
+    "genre_popular": (_genre_popular, 150),
+    "popular_unseen": (_popular_unseen, 50),
+}
+
+
+def generate_candidates(
+    rated_ids: np.ndarray, rated_vals: np.ndarray, budgets: Optional[Dict[str, int]] = None,
+) -> Tuple[np.ndarray, List[str], List[dict]]:
+    """(candidate movie ids, generator of each, per-generator stage reports)"""
+    budgets = budgets or {}
+    parts: List[np.ndarray] = []
+    sources: List[str] = []
+    stages: List[dict] = []
+    total = 0
+    t0 = time.perf_counter()
+    for name, (fn, default_budget) in GENERATORS.items():
+        budget = min(int(budgets.get(name, default_budget)), MAX_CANDIDATES - total)
+        if budget <= 0 or (time.perf_counter() - t0) * 1000.0 > CANDIDATE_BUDGET_MS:
+            stages.append({"stage": name, "ms": 0.0, "items": 0, "budget": max(budget, 0), "skipped": True})
+            continue
+        ts = time.perf_counter()
+        with span(f"pipeline.{name}"):
+            try:
+                ids = np.asarray(fn(rated_ids, rated_vals, budget), dtype=ID_DTYPE)
+            except Exception:
+                logger.exception("candidate generator %s failed", name)
+                ids = _EMPTY
+            taken = np.concatenate([rated_ids.astype(ID_DTYPE, copy=False)] + parts)
+            new = _first_occurrences(ids[~np.isin(ids, taken)])[:budget]
+        parts.append(new)
+        sources.extend([name] * len(new))
+        total += len(new)
+        stages.append({"stage": name, "ms": round((time.perf_counter() - ts) * 1000.0, 3),
+                       "items": int(len(new)), "budget": budget, "skipped": False})
+    candidates = np.concatenate(parts) if parts else _EMPTY
+    return candidates, sources, stages
+
+
+def recommend(
+    user_id: int, k: int = 20, reranker: Optional[str] = None, budgets: Optional[Dict[str, int]] = None,
+) -> Tuple[List[Tuple[int, float]], dict]:
+    """
+    Top-k (movie_id, score) for `user_id` plus a report:
+    {"reranker", "candidates", "stages": [...], "sources": generator per rec}.
+    Empty recs when k <= 0, the user has no ratings or no candidate can be scored.
+    """
+    reranker = reranker or RERANKER
+    engine = get_engine(reranker)
+    if not hasattr(engine, "score_items"):
+        raise ValueError(f"engine {reranker!r} cannot re-rank candidates (no score_items)")
+
+    report = {"reranker": reranker, "candidates": 0, "stages": [], "sources": []}
+    if k <= 0:
+        # a negative slice bound below would keep nearly every candidate
+        return [], report
+    rated_ids, rated_vals = load_user_history(user_id, newest_first=True)
+    if rated_ids.size == 0:
+        return [], report
+
+    with span("pipeline.candidates"):
+        candidates, sources, report["stages"] = generate_candidates(rated_ids, rated_vals, budgets)
+    report["candidates"] = int(len(candidates))
+    if not len(candidates):
+        return [], report
+
+    ts = time.perf_counter()
+    with span("pipeline.rerank"):
+        scores = engine.score_items(get_model(reranker), rated_ids, rated_vals, candidates)
+        ok = np.flatnonzero(np.isfinite(scores))
+        top = ok[np.argsort(-scores[ok], kind="stable")[:k]]
+    rerank_ms = (time.perf_counter() - ts) * 1000.0
+    report["stages"].append({"stage": "rerank", "ms": round(rerank_ms, 3), "items": int(len(ok)),
+                             "budget_ms": RERANK_BUDGET_MS, "over_budget": rerank_ms > RERANK_BUDGET_MS})
+    report["sources"] = [sources[i] for i in top]
+    return [(int(candidates[i]), float(scores[i])) for i in top], report
+
+
+def recommend_titles_for_user(user_id: int, k: int = 20) -> Tuple[List[dict], dict]:
+    """recommend() with movie metadata: ([{movie_id, title, score, source, year, genres, poster_url}], report)"""
+    recs, report = recommend(user_id, k)
+    with span("pipeline.metadata"):
+        info = get_movie_info([mid for mid, _ in recs])
+    items = []
+    for (mid, score), source in zip(recs, report["sources"]):
+        meta = info.get(mid, {"title": f"ID {mid}", "poster_url": None, "year": None, "genres": None})
+        items.append({"movie_id": mid, "score": score, "source": source, **meta})
+    return items, report
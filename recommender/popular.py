@@ -0,0 +1,92 @@
+"""
+popular.py
+Popularity engine: Bayesian weighted rating per movie, the same ranking as
+database.db_query.top_unseen_for_user but computed once at fit time,
+
+    WR = (v / (v + M_PARAM)) * R + (M_PARAM / (v + M_PARAM)) * C
+
+so popular-unseen lists come from memory instead of a GROUP BY over ratings.
+The model also keeps each genre's best movies for the candidate pipeline
+(recommender.pipeline).
+"""
+
+from __future__ import annotations
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+
+from recommender.ids import ID_DTYPE, VALUE_DTYPE, id_rows
+from tracing import span
+
+MIN_VOTES = 50
+M_PARAM = 50
+#movies kept per genre in genre_rank
+GENRE_TOP = 500
+
+
+def fit(ratings: pd.DataFrame, movies: pd.DataFrame | None = None) -> dict[str, np.ndarray]:
+    """
+    Returns {"movie_ids", "weighted" (WR per movie), "votes",
+             "rank": rows with >= MIN_VOTES votes, best first,
+             "genre_names", "genre_hot": items x genres 0/1,
+             "genre_rank": genres x GENRE_TOP rows, best first, -1 padded}.
+    """
+    if movies is None:
+        from recommender.data_loader import load_movies_df
+        movies = load_movies_df(columns=["movie_id", "genres"])
+    movie_ids, idx = np.unique(ratings["movie_id"].to_numpy(dtype=ID_DTYPE), return_inverse=True)
+    vals = ratings["rating"].to_numpy(dtype=float)
+    n = len(movie_ids)
+
+    votes = np.bincount(idx, minlength=n)
+    mean = np.bincount(idx, weights=vals, minlength=n) / np.maximum(votes, 1)
+    c = float(vals.mean()) if len(vals) else 0.0
+    weighted = (votes / (votes + M_PARAM)) * mean + (M_PARAM / (votes + M_PARAM)) * c
+    eligible = np.flatnonzero(votes >= MIN_VOTES)
+    # ties on WR: more votes first, as in top_unseen_for_user
+    rank = eligible[np.lexsort((-votes[eligible], -weighted[eligible]))]
+
+    hot = (
+        movies.drop_duplicates("movie_id").set_index("movie_id")["genres"]
+        .reindex(movie_ids).fillna("").astype(str).str.get_dummies(sep="|")
+    )
+    hot = hot.drop(columns=[g for g in hot.columns if g.lower() == "(no genres listed)"])
+    names = list(hot.columns)
+    hot = hot.to_numpy(dtype=np.uint8)
+    genre_rank = np.full((len(names), GENRE_TOP), -1, dtype=np.int32)
+    for j in range(len(names)):
+        top = rank[hot[rank, j] == 1][:GENRE_TOP]
+        genre_rank[j, :len(top)] = top
+
+    return {
+        "movie_ids": movie_ids,
+        "weighted": weighted.astype(VALUE_DTYPE),
+        "votes": votes.astype(np.int32),
+        "rank": rank.astype(np.int32),
+        "genre_names": np.asarray(names, dtype=str),
+        "genre_hot": hot,
+        "genre_rank": genre_rank,
+    }
+
+
+def unseen_rows(ranked: np.ndarray, seen_rows: np.ndarray, n: int) -> np.ndarray:
+    """first n of `ranked` (rows, best first) that are not in `seen_rows`"""
+    head = ranked[: n + len(seen_rows)]
+    return head[~np.isin(head, seen_rows)][:n]
+
+
+def score_user(model: dict[str, np.ndarray], rated_ids: np.ndarray, rated_vals: np.ndarray, k: int = 20) -> List[Tuple[int, float]]:
+    """top-k popular movies the user has not rated, scored by weighted rating"""
+    movie_ids, weighted = model["movie_ids"], model["weighted"]
+    seen_rows, _ = id_rows(movie_ids, rated_ids)
+    with span("popular.score"):
+        rows = unseen_rows(model["rank"], seen_rows, int(k))
+    return [(int(movie_ids[i]), float(weighted[i])) for i in rows]
+
+
+def recommend_for_user(user_id: int, k: int = 20) -> List[Tuple[int, float]]:
+    from .artifacts import get_model
+    from .data_loader import load_user_history
+
+    rated_ids, rated_vals = load_user_history(user_id)
+    return score_user(get_model("popular"), rated_ids, rated_vals, k)
@@ -0,0 +1,145 @@
+"""
+precompute.py
+Nightly batch job: score every user with one or more engines and store the
+top-N in the user_recs table, so request handlers can read instead of score.
+
+Run:
+    python -m recommender.precompute                       # all engines
+    python -m recommender.precompute --engine content --top-n 100 --workers 8
+
+Endpoints call load_precomputed_recs(); it returns None (-> live scoring)
+when there is no run, the user has no stored rows, `k` is larger than the
+run's top-N, or the user's ratings changed since the run started
+(user_stats.updated_at >= user_recs_runs.computed_at). Both are whole
+seconds and computed_at is taken when the job starts, so a rating written
+in that same second may or may not have been scored: it counts as stale.
+"""
+
+from __future__ import annotations
+import sys
+import time
+import logging
+import argparse
+from typing import List, Optional, Sequence, Tuple
+
+from database.connection import get_db
+from database.paramstyle import PH
+from recommender.engines import ENGINES, get_engine
+from recommender.parallel import parse_bytes, score_users
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_N = 500
+INSERT_BATCH = 10_000
+
+
+def write_user_recs(engine_name: str, results, computed_at: int, top_n: int) -> int:
+    """Replace the stored recs for `engine_name` in one transaction."""
+    n_users = 0
+    with get_db(readonly=False) as conn:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM user_recs WHERE engine = {PH}", (engine_name,))
+        batch = []
+        for uid, recs in results:
+            n_users += 1
+            batch.extend((engine_name, int(uid), rank, int(mid), float(score)) for rank, (mid, score) in enumerate(recs))
+            if len(batch) >= INSERT_BATCH:
+                cur.executemany(
+                    f"INSERT INTO user_recs (engine, user_id, rec_rank, movie_id, score) VALUES ({PH}, {PH}, {PH}, {PH}, {PH})",
+                    batch,
+                )
+                batch = []
+        if batch:
+            cur.executemany(
+                f"INSERT INTO user_recs (engine, user_id, rec_rank, movie_id, score) VALUES ({PH}, {PH}, {PH}, {PH}, {PH})",
+                batch,
+            )
+        cur.execute(f"DELETE FROM user_recs_runs WHERE engine = {PH}", (engine_name,))
+        cur.execute(
+            f"INSERT INTO user_recs_runs (engine, computed_at, top_n, n_users) VALUES ({PH}, {PH}, {PH}, {PH})",
+            (engine_name, computed_at, top_n, n_users),
+        )
+    return n_users
+
+
+def load_precomputed_recs(engine_name: str, user_id: int, k: int) -> Optional[List[Tuple[int, float]]]:
+    """
+    Return stored [(movie_id, score)] for a user, or None if the caller
+    should fall back to live scoring.
+    """
+    try:
+        with get_db(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT run.computed_at, run.top_n, COALESCE(us.updated_at, 0)
+                FROM user_recs_runs run
+                LEFT JOIN user_stats us ON us.user_id = {PH}
+                WHERE run.engine = {PH}
+                """,
+                (int(user_id), engine_name),
+            )
+            run = cur.fetchone()
+            if not run:
+                return None
+            computed_at, top_n, updated_at = int(run[0]), int(run[1]), int(run[2])
+            # whole seconds: a write in the second the run started may have been missed
+            if k > top_n or updated_at >= computed_at:
+                return None
+            cur.execute(
+                f"""
+                SELECT movie_id, score FROM user_recs
+                WHERE engine = {PH} AND user_id = {PH}
+                ORDER BY rec_rank
+                LIMIT {PH}
+                """,
+                (engine_name, int(user_id), int(k)),
+            )
+            rows = cur.fetchall()
+    except Exception:
+        # tables missing on an old DB, etc. -> live scoring still works
+        logger.debug("precomputed recs unavailable", exc_info=True)
+        return None
+    if not rows:
+        return None
+    return [(int(mid), float(score)) for mid, score in rows]
+
+
+def run(engines: Sequence[str], top_n: int = DEFAULT_TOP_N, workers: int | None = None,
+        chunk_size: int = 64, memory_budget: int | None = None) -> None:
+    from recommender.data_loader import load_movies_df, load_ratings_df, user_ratings_csr
+
+    # recorded before loading so writes that land during the run count as stale
+    computed_at = int(time.time())
+    ratings = load_ratings_df()
+    movies = load_movies_df(columns=["movie_id", "title", "year", "genres"])
+    csr = user_ratings_csr(ratings)
+
+    for name in engines:
+        t0 = time.perf_counter()
+        model = get_engine(name).fit(ratings, movies)
+        t_fit = time.perf_counter() - t0
+        results = score_users(name, model, csr, top_n=top_n, workers=workers,
+                              chunk_size=chunk_size, memory_budget=memory_budget)
+        n_users = write_user_recs(name, results, computed_at, top_n)
+        print(f"✅ {name}: fit {t_fit:.1f}s, scored {n_users} users in {time.perf_counter() - t0:.1f}s")
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for every user.")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES),
+                        help="engine to run (repeatable; default: all)")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N, help="recs stored per user")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="users per worker task")
+    parser.add_argument("--memory-budget", type=parse_bytes, default=None,
+                        help="cap on shared arrays + workers, e.g. 4G (limits worker count)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    run(args.engine or sorted(ENGINES), top_n=args.top_n, workers=args.workers,
+        chunk_size=args.chunk_size, memory_budget=args.memory_budget)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
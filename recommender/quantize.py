@@ -0,0 +1,84 @@
+"""
+quantize.py
+Int8 item vectors for a cheap first scoring pass.
+
+Engines whose scores are a matrix-vector product over all items (content: X,
+factor: item_factors) declare the matrix as QUANTIZE_KEY. quantize_model()
+adds a per-row scaled int8 copy:
+
+    model[f"{key}_q"]      int8    items x d,  row ~= q * scale
+    model[f"{key}_scale"]  float32 items
+
+When those arrays are present, score_user scans the int8 rows (a quarter of
+the float32 bytes) for a shortlist of rerank_size(k) items and re-scores only
+the shortlist with the exact float rows. In an artifact the float matrix stays
+memory-mapped and only the shortlisted rows are ever touched.
+
+    python -m recommender train --engine factor --quantize
+    python -m recommender.evaluate --quantized       # recall loss vs speed/memory
+"""
+
+from __future__ import annotations
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+#shortlist = max(k * QUANT_RERANK_FACTOR, QUANT_RERANK_MIN) items
+QUANT_RERANK_FACTOR = int(os.getenv("QUANT_RERANK_FACTOR", "10"))
+QUANT_RERANK_MIN = int(os.getenv("QUANT_RERANK_MIN", "100"))
+#int8 rows widened to float32 per step of the scan (keeps the temporary in cache)
+QUANT_CHUNK_ROWS = 4096
+
+
+def quantize_rows(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """symmetric per-row int8: (q, scale) with X[i] ~= q[i] * scale[i]"""
+    X = np.asarray(X, dtype=np.float32)
+    scale = np.abs(X).max(axis=1) / 127.0 if X.size else np.zeros(len(X), dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    q = np.rint(X / scale[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scale
+
+
+def quantize_model(model: Dict[str, np.ndarray], key: str) -> Dict[str, np.ndarray]:
+    """copy of `model` with the int8 arrays for `key` added"""
+    q, scale = quantize_rows(model[key])
+    return {**model, f"{key}_q": q, f"{key}_scale": scale}
+
+
+def is_quantized(model: Dict[str, np.ndarray], key: str) -> bool:
+    return f"{key}_q" in model
+
+
+def scan_bytes(model: Dict[str, np.ndarray], key: str) -> int:
+    """bytes read from the item matrix by one full scoring pass"""
+    if is_quantized(model, key):
+        return int(model[f"{key}_q"].nbytes + model[f"{key}_scale"].nbytes)
+    return int(model[key].nbytes)
+
+
+def rerank_size(k: int) -> int:
+    return max(int(k) * QUANT_RERANK_FACTOR, QUANT_RERANK_MIN)
+
+
+def approx_scores(q: np.ndarray, scale: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """(q * scale) @ v, widening QUANT_CHUNK_ROWS int8 rows at a time"""
+    v = np.asarray(v, dtype=np.float32)
+    out = np.empty(len(q), dtype=np.float32)
+    for s in range(0, len(q), QUANT_CHUNK_ROWS):
+        out[s:s + QUANT_CHUNK_ROWS] = q[s:s + QUANT_CHUNK_ROWS].astype(np.float32) @ v
+    out *= scale
+    return out
+
+
+def shortlist(model: Dict[str, np.ndarray], key: str, v: np.ndarray, n: int,
+              exclude: Optional[np.ndarray] = None) -> np.ndarray:
+    """rows of the n best approximate scores, `exclude` rows left out"""
+    scores = approx_scores(model[f"{key}_q"], model[f"{key}_scale"], v)
+    if exclude is not None and len(exclude):
+        scores[exclude] = -np.inf
+    n = min(int(n), len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    cand = np.argpartition(scores, -n)[-n:]
+    return cand[np.isfinite(scores[cand])]
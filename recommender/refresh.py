@@ -0,0 +1,157 @@
+"""
+refresh.py
+Background refresh of a user's recommendations after their ratings change.
+
+Rating writes call notify_ratings_changed(user_id): the user's cached recs
+are dropped right away (so nothing stale is served) and the user is queued.
+Worker threads recompute the recs and put them back in the cache, usually
+before the user navigates back to the home page.
+
+The queue is keyed by user_id: a user already waiting is not queued twice,
+and once `max_depth` users are waiting new users are dropped (their next
+request simply scores live).
+
+Dataset merges (database.events) go through the same path per changed user;
+when more users changed than the queue holds, all cached recs are dropped
+instead, and catalog changes also drop the in-memory models.
+"""
+
+from __future__ import annotations
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from cache import invalidate_all_recs, invalidate_user_recs
+from database.events import subscribe
+
+logger = logging.getLogger(__name__)
+
+REFRESH_WORKERS = int(os.getenv("REC_REFRESH_WORKERS", "1"))
+REFRESH_MAX_DEPTH = int(os.getenv("REC_REFRESH_MAX_DEPTH", "1000"))
+REFRESH_ENGINES = [e.strip() for e in os.getenv("REC_REFRESH_ENGINES", "content,item_item").split(",") if e.strip()]
+
+
+def refresh_user_recs(user_id: int, engines: Iterable[str] = REFRESH_ENGINES) -> None:
+    """Recompute and cache the lists the home page asks for (default k per engine)."""
+    # a result cached by an earlier, now-outdated refresh must not be reused
+    invalidate_user_recs(user_id)
+    if "content" in engines:
+        from recommender.content import personalized_titles_for_user as content_recs
+        content_recs(user_id=user_id)
+    if "item_item" in engines:
+        from recommender.baseline import personalized_titles_for_user as item_item_recs
+        item_item_recs(user_id)
+
+
+class RefreshQueue:
+    """deduplicating, bounded work queue drained by daemon threads"""
+
+    def __init__(
+        self,
+        refresh_fn: Callable[[int], None] = refresh_user_recs,
+        workers: int = REFRESH_WORKERS,
+        max_depth: int = REFRESH_MAX_DEPTH,
+    ):
+        self.refresh_fn = refresh_fn
+        self.workers = max(int(workers), 1)
+        self.max_depth = max(int(max_depth), 1)
+        self._pending: "OrderedDict[int, float]" = OrderedDict()   # user_id -> enqueue time
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._in_flight = 0
+        self._counters = {
+            "enqueued": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def enqueue(self, user_id: int) -> bool:
+        """queue a refresh; returns False only when the queue was full"""
+        uid = int(user_id)
+        with self._cond:
+            if uid in self._pending:
+                self._counters["deduplicated"] += 1
+                return True
+            if len(self._pending) >= self.max_depth:
+                self._counters["dropped"] += 1
+                return False
+            self._pending[uid] = time.monotonic()
+            self._counters["enqueued"] += 1
+            self._ensure_started()
+            self._cond.notify()
+        return True
+
+    def _ensure_started(self) -> None:
+        # caller holds self._cond
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"rec-refresh-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                uid, queued_at = self._pending.popitem(last=False)
+                self._in_flight += 1
+                self._wait_seconds += time.monotonic() - queued_at
+
+            t0 = time.monotonic()
+            ok = True
+            try:
+                self.refresh_fn(uid)
+            except Exception:
+                ok = False
+                logger.exception("recommendation refresh failed for user %s", uid)
+
+            with self._cond:
+                self._in_flight -= 1
+                self._run_seconds += time.monotonic() - t0
+                self._counters["completed" if ok else "failed"] += 1
+
+    def metrics(self) -> dict:
+        with self._cond:
+            done = self._counters["completed"] + self._counters["failed"]
+            return {
+                **self._counters,
+                "depth": len(self._pending),
+                "max_depth": self.max_depth,
+                "in_flight": self._in_flight,
+                "workers": self.workers,
+                "avg_wait_ms": (self._wait_seconds / done * 1000.0) if done else 0.0,
+                "avg_refresh_ms": (self._run_seconds / done * 1000.0) if done else 0.0,
+            }
+
+
+refresh_queue = RefreshQueue()
+
+
+def notify_ratings_changed(user_id: int) -> None:
+    """call after any committed rating write for `user_id`"""
+    invalidate_user_recs(user_id)
+    refresh_queue.enqueue(user_id)
+
+
+@subscribe
+def on_dataset_changed(changes) -> None:
+    """database.events subscriber for bulk changes (dataset merges)"""
+    if len(changes.user_ids) > refresh_queue.max_depth:
+        invalidate_all_recs()
+    else:
+        for uid in changes.user_ids:
+            notify_ratings_changed(uid)
+    if changes.movie_ids:
+        # item features / neighbourhoods cover the old catalog: refit on next use
+        # (artifacts trained before the merge carry the old catalog_id and are skipped)
+        from recommender.artifacts import model_store
+        model_store.drop()
+        invalidate_all_recs()
@@ -0,0 +1,60 @@
+"""
+shm.py
+Share dicts of NumPy arrays between processes without pickling them.
+
+The parent copies each array into a named SharedMemory block once and passes
+a small spec {key: (block_name, shape, dtype)} to workers, which map the
+same pages read-only.
+"""
+
+from __future__ import annotations
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+Spec = Dict[str, Tuple[str, Tuple[int, ...], str]]
+
+
+def share_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[Spec, List[shared_memory.SharedMemory]]:
+    """Copy arrays into new shared blocks. Caller must release_arrays(blocks, unlink=True)."""
+    spec: Spec = {}
+    blocks: List[shared_memory.SharedMemory] = []
+    try:
+        for key, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+            spec[key] = (block.name, tuple(arr.shape), arr.dtype.str)
+    except Exception:
+        release_arrays(blocks, unlink=True)
+        raise
+    return spec, blocks
+
+
+def attach_arrays(spec: Spec) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    """Map the arrays described by `spec`; keep the returned blocks alive while in use."""
+    arrays: Dict[str, np.ndarray] = {}
+    blocks: List[shared_memory.SharedMemory] = []
+    for key, (name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        arr.flags.writeable = False
+        arrays[key] = arr
+    return arrays, blocks
+
+
+def release_arrays(blocks: List[shared_memory.SharedMemory], unlink: bool = False) -> None:
+    for block in blocks:
+        try:
+            block.close()
+            if unlink:
+                block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def spec_nbytes(spec: Spec) -> int:
+    return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in spec.values())
@@ -0,0 +1,253 @@
+"""
+snapshot.py
+Columnar on-disk snapshot of the ratings table, so model fits read ratings
+from memory-mapped arrays instead of parsing every row out of the database.
+
+    recommender/snapshot/ratings/CURRENT                name of the live version
+    recommender/snapshot/ratings/<version>/user_id.npy  int32, sorted by user
+                                           movie_id.npy int32
+                                           rating.npy   float32
+                                           timestamp.npy int64
+                                           meta.json    marker, watermark, rows
+
+ratings_arrays() brings the snapshot up to date, then returns it mmapped:
+- the version marker (database identity + dataset_meta.load_id, renewed by
+  every full MovieLens load) differs, or there is no snapshot: full rebuild
+- otherwise only users whose user_stats.updated_at is at or after the
+  watermark (the time the previous read started, minus SNAPSHOT_SLACK_S for
+  writes still in flight) are re-read and spliced in
+- too many changed users (SNAPSHOT_REBUILD_FRACTION), or a row count that no
+  longer lines up with user_stats afterwards: full rebuild
+
+New versions go into their own directory and are published by replacing
+CURRENT atomically: readers holding the previous mmaps are unaffected and
+concurrent workers need no lock.
+"""
+
+from __future__ import annotations
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from database.connection import DATABASE_URL, DB_PATH, get_db
+from database.paramstyle import PH
+from memory import accountant, array_bytes
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(os.getenv("RATINGS_SNAPSHOT_DIR", Path(__file__).resolve().parent / "snapshot" / "ratings"))
+#set RATINGS_SNAPSHOT=0 to always read ratings straight from the database
+SNAPSHOT_ENABLED = os.getenv("RATINGS_SNAPSHOT", "1").strip().lower() not in ("0", "false", "no", "")
+SNAPSHOT_SLACK_S = int(os.getenv("SNAPSHOT_SLACK_S", "5"))
+SNAPSHOT_REBUILD_FRACTION = float(os.getenv("SNAPSHOT_REBUILD_FRACTION", "0.25"))
+#old versions kept next to CURRENT (other processes may still map them)
+SNAPSHOT_KEEP = 2
+FETCH_ROWS = 100_000
+
+COLUMNS = {"user_id": np.int32, "movie_id": np.int32, "rating": np.float32, "timestamp": np.int64}
+
+
+def _db_identity() -> str:
+    if DATABASE_URL:
+        from urllib.parse import urlsplit
+        u = urlsplit(DATABASE_URL)
+        return f"pg://{u.hostname}:{u.port or 5432}{u.path}"
+    return f"sqlite://{Path(DB_PATH).resolve()}"
+
+
+def version_marker() -> str:
+    """database identity + the load id written by the last full MovieLens load"""
+    load_id = ""
+    try:
+        with get_db(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT value FROM dataset_meta WHERE key = 'load_id'")
+            row = cur.fetchone()
+            load_id = row[0] if row else ""
+    except Exception:
+        # schema predates dataset_meta
+        pass
+    return f"{_db_identity()}#{load_id}"
+
+
+def _read_columns(conn, sql: str, params=()) -> Dict[str, np.ndarray]:
+    from recommender.data_loader import column_chunks, streaming_cursor
+    cur = streaming_cursor(conn, FETCH_ROWS)
+    cur.execute(sql, params)
+    parts = {name: [] for name in COLUMNS}
+    for chunk in column_chunks(cur, COLUMNS, FETCH_ROWS):
+        for name, arr in chunk.items():
+            parts[name].append(arr)
+    cur.close()
+    return {
+        name: np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMNS[name])
+        for name, chunks in parts.items()
+    }
+
+
+def _sort_by_user(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    order = np.argsort(arrays["user_id"], kind="stable")
+    return {name: arr[order] for name, arr in arrays.items()}
+
+
+def _stats_total(cur) -> int:
+    cur.execute("SELECT COALESCE(SUM(n_ratings), 0) FROM user_stats")
+    return int(cur.fetchone()[0])
+
+
+class RatingsSnapshot:
+    def __init__(self, root: Path | str = SNAPSHOT_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._live: Optional[tuple[str, dict, Dict[str, np.ndarray]]] = None   # (version, meta, arrays)
+
+    # ---- disk layout ----
+    def _current_version(self) -> Optional[str]:
+        try:
+            return (self.root / "CURRENT").read_text(encoding="utf-8").strip() or None
+        except OSError:
+            return None
+
+    def _open(self, version: str) -> Optional[tuple[dict, Dict[str, np.ndarray]]]:
+        src = self.root / version
+        try:
+            meta = json.loads((src / "meta.json").read_text(encoding="utf-8"))
+            arrays = {
+                name: np.load(src / f"{name}.npy", mmap_mode="r" if meta["rows"] else None)
+                for name in COLUMNS
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta, arrays
+
+    def _publish(self, arrays: Dict[str, np.ndarray], meta: dict) -> str:
+        version = f"{int(time.time() * 1000)}-{os.getpid()}"
+        tmp = self.root / f".{version}.tmp"
+        tmp.mkdir(parents=True)
+        for name, arr in arrays.items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(arr, dtype=COLUMNS[name]))
+        (tmp / "meta.json").write_text(json.dumps({**meta, "version": version}, indent=2), encoding="utf-8")
+        tmp.rename(self.root / version)
+        pointer = self.root / f".CURRENT.{os.getpid()}"
+        pointer.write_text(version, encoding="utf-8")
+        os.replace(pointer, self.root / "CURRENT")
+        self._prune(keep=version)
+        return version
+
+    def _prune(self, keep: str) -> None:
+        versions = sorted(p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith("."))
+        old = [p for p in versions if p.name != keep]
+        for path in old[:-SNAPSHOT_KEEP] if SNAPSHOT_KEEP > 0 else old:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---- building ----
+    def _build_full(self, marker: str) -> str:
+        with span("snapshot.full"), get_db(readonly=True) as conn:
+            cur = conn.cursor()
+            # watermark first (same clock as user_stats.updated_at): anything
+            # written while we read is re-read next time
+            watermark = int(time.time())
+            stats_total = _stats_total(cur)
+            arrays = _sort_by_user(_read_columns(conn, "SELECT user_id, movie_id, rating, timestamp FROM ratings"))
+        rows = len(arrays["user_id"])
+        logger.info("ratings snapshot: full build, %d rows", rows)
+        return self._publish(arrays, {
+            "marker": marker,
+            "watermark": watermark,
+            "rows": rows,
+            # ratings without stats (or the reverse) are tolerated, as long as the gap stays put
+            "stats_gap": rows - stats_total,
+            "built_at": int(time.time()),
+            "full_build_at": int(time.time()),
+        })
+
+    def _refresh(self, meta: dict, arrays: Dict[str, np.ndarray]) -> Optional[str]:
+        """splice in users changed since the watermark; None if a full build is needed"""
+        since = int(meta["watermark"]) - SNAPSHOT_SLACK_S
+        with span("snapshot.refresh"), get_db(readonly=True) as conn:
+            cur = conn.cursor()
+            watermark = int(time.time())
+            stats_total = _stats_total(cur)
+            cur.execute(f"SELECT COUNT(*) FROM user_stats WHERE updated_at >= {PH}", (since,))
+            n_changed = int(cur.fetchone()[0])
+            if n_changed == 0:
+                return meta["version"] if meta["rows"] - stats_total == meta["stats_gap"] else None
+            cur.execute("SELECT COUNT(*) FROM user_stats")
+            n_users = int(cur.fetchone()[0])
+            if n_changed > SNAPSHOT_REBUILD_FRACTION * max(n_users, 1):
+                return None
+            cur.execute(f"SELECT user_id FROM user_stats WHERE updated_at >= {PH}", (since,))
+            changed = np.asarray([r[0] for r in cur.fetchall()], dtype=COLUMNS["user_id"])
+            fresh = _sort_by_user(_read_columns(
+                conn,
+                f"""
+                SELECT user_id, movie_id, rating, timestamp FROM ratings
+                WHERE user_id IN (SELECT user_id FROM user_stats WHERE updated_at >= {PH})
+                """,
+                (since,),
+            ))
+
+        keep = ~np.isin(arrays["user_id"], changed)
+        kept_users = arrays["user_id"][keep]
+        at = np.searchsorted(kept_users, fresh["user_id"], side="right")
+        merged = {
+            name: np.insert(arrays[name][keep] if name != "user_id" else kept_users, at, fresh[name])
+            for name in COLUMNS
+        }
+        rows = len(merged["user_id"])
+        if rows - stats_total != meta["stats_gap"]:
+            # users vanished from user_stats, or rows changed without touching it
+            return None
+        logger.info("ratings snapshot: refreshed %d users (%d rows)", len(changed), len(fresh["user_id"]))
+        return self._publish(merged, {**meta, "watermark": watermark,
+                                      "rows": rows, "built_at": int(time.time())})
+
+    # ---- public ----
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """up-to-date ratings columns (memory-mapped, sorted by user_id)"""
+        with self._lock:
+            marker = version_marker()
+            version = self._current_version()
+            opened = self._open(version) if version else None
+            if opened is not None and opened[0].get("marker") == marker:
+                meta, arrays = opened
+                try:
+                    version = self._refresh(meta, arrays)
+                except Exception:
+                    logger.exception("ratings snapshot: incremental refresh failed; rebuilding")
+                    version = None
+            else:
+                version = None
+            if version is None:
+                version = self._build_full(marker)
+            if self._live is None or self._live[0] != version:
+                meta, arrays = self._open(version)
+                self._live = (version, meta, arrays)
+            return self._live[2]
+
+    def memory_usage(self) -> dict:
+        live = self._live
+        if live is None:
+            return {"bytes": 0, "mapped_bytes": 0, "items": 0}
+        private = mapped = 0
+        for arr in live[2].values():
+            p, m = array_bytes(arr)
+            private += p
+            mapped += m
+        return {"bytes": private, "mapped_bytes": mapped, "items": int(live[1]["rows"]), "version": live[0]}
+
+
+ratings_snapshot = RatingsSnapshot()
+accountant.register("ratings_snapshot", "snapshot", ratings_snapshot.memory_usage)
+
+
+def ratings_arrays() -> Dict[str, np.ndarray]:
+    return ratings_snapshot.arrays()
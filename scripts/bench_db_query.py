@@ -0,0 +1,314 @@
+"""
+bench_db_query.py
+Microbenchmarks for the hot helpers in database.db_query.
+
+    python scripts/bench_db_query.py run --output bench/db_query.json
+    python scripts/bench_db_query.py run --backend all --samples 50      # + Postgres if reachable
+    python scripts/bench_db_query.py compare bench/main.json bench/db_query.json --threshold 0.2
+
+run times each case against SQLite (the configured DB_PATH, or --sqlite-path)
+and, with --backend postgres/all, against Postgres (--postgres-url, else
+BENCH_DATABASE_URL / DATABASE_URL; skipped when no server answers). Each
+backend runs in its own subprocess because database.connection picks the
+backend at import time.
+
+Every case is warmed up, then sampled --samples times; one extra call counts
+the SQL statements it issues (database.query_log.count_queries).
+upsert_rating writes to a scratch user (--bench-user-id) that is inserted
+into users first (ratings.user_id is a foreign key on Postgres) and deleted
+with its ratings and stats afterwards.
+
+compare exits 1 when a case's median time grows by more than --threshold or
+its query count goes up.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import statistics
+
+# ✅ Add project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+BENCH_USER_ID = 2_000_000_000
+
+
+# ------------------------------
+# Cases
+# ------------------------------
+def _pick_user() -> int:
+    """user with the most ratings (worst case for per-user queries)"""
+    from database.connection import get_db
+
+    with get_db(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM ratings GROUP BY user_id ORDER BY COUNT(*) DESC, user_id LIMIT 1;")
+        row = cur.fetchone()
+    if not row:
+        raise SystemExit("ratings table is empty; load data first")
+    return int(row[0])
+
+
+def build_cases(user_id: int, bench_user_id: int) -> dict:
+    from database import db_query as q
+
+    state = {"i": 0}
+
+    def upsert():
+        #alternate movie + value so every call really writes
+        state["i"] += 1
+        q.upsert_rating(bench_user_id, 1 + state["i"] % 50, 0.5 + (state["i"] % 10) * 0.5)
+
+    cases = {
+        "get_ratings_for_user": lambda: q.get_ratings_for_user(user_id),
+        "search_movies_by_title[star]": lambda: q.search_movies_by_title("star", limit=20),
+        "search_movies_by_title[lord of the]": lambda: q.search_movies_by_title("lord of the", limit=20),
+        "top_unseen_for_user": lambda: q.top_unseen_for_user(user_id, limit=20),
+        "get_user_rating_stats": lambda: q.get_user_rating_stats(user_id),
+        "upsert_rating": upsert,
+    }
+    for sort in ("title", "year", "rating"):
+        cases[f"list_movies[sort={sort}]"] = lambda s=sort: q.list_movies(None, sort=s, direction="desc", page=3)
+    cases["list_movies[genre=Drama,sort=rating]"] = lambda: q.list_movies("Drama", sort="rating", direction="desc", page=3)
+    return cases
+
+
+def _cleanup(bench_user_id: int) -> None:
+    from database.connection import get_db
+    from database.paramstyle import PH
+
+    with get_db(readonly=False) as conn:
+        cur = conn.cursor()
+        for table in ("ratings", "user_genre_stats", "user_stats", "users"):
+            cur.execute(f"DELETE FROM {table} WHERE user_id = {PH};", (bench_user_id,))
+
+
+def _create_bench_user(bench_user_id: int) -> None:
+    """scratch users row for the write cases (leftovers of a killed run are replaced)"""
+    from database.connection import get_db
+    from database.paramstyle import PH
+
+    _cleanup(bench_user_id)
+    with get_db(readonly=False) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"INSERT INTO users (user_id, username) VALUES ({PH}, {PH});",
+            (bench_user_id, f"__bench_{bench_user_id}"),
+        )
+
+
+def time_case(fn, warmup: int, samples: int) -> dict:
+    from database.query_log import count_queries
+
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    with count_queries() as counter:
+        fn()
+    times.sort()
+    return {
+        "samples": samples,
+        "min_ms": round(times[0], 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.fmean(times), 4),
+        "p95_ms": round(times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))], 4),
+        "stdev_ms": round(statistics.stdev(times), 4) if len(times) > 1 else 0.0,
+        "queries": counter["queries"],
+    }
+
+
+def _table_count(table: str) -> int:
+    from database.connection import get_db
+
+    with get_db(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {table};")
+        return int(cur.fetchone()[0])
+
+
+def run_backend(args) -> dict:
+    """runs inside the per-backend subprocess"""
+    from database.connection import DATABASE_URL, DB_PATH
+
+    user_id = args.user_id or _pick_user()
+    cases = build_cases(user_id, args.bench_user_id)
+    if args.case:
+        cases = {k: v for k, v in cases.items() if any(c in k for c in args.case)}
+
+    results = {}
+    _create_bench_user(args.bench_user_id)
+    try:
+        for name, fn in cases.items():
+            try:
+                results[name] = time_case(fn, args.warmup, args.samples)
+            except Exception as ex:
+                #keep going; a broken case shows up in the results instead of aborting the run
+                results[name] = {"error": f"{type(ex).__name__}: {ex}"}
+                print(f"  {name:<40} ❌ {results[name]['error']}", file=sys.stderr)
+                continue
+            r = results[name]
+            print(f"  {name:<40} median {r['median_ms']:9.3f} ms  p95 {r['p95_ms']:9.3f} ms  "
+                  f"queries {r['queries']}", file=sys.stderr)
+    finally:
+        _cleanup(args.bench_user_id)
+
+    return {
+        "backend": "postgres" if DATABASE_URL else "sqlite",
+        "database": DATABASE_URL.rsplit("@", 1)[-1] if DATABASE_URL else str(DB_PATH),
+        "user_id": user_id,
+        "movies": _table_count("movies"),
+        "ratings": _table_count("ratings"),
+        "cases": results,
+    }
+
+
+# ------------------------------
+# Commands
+# ------------------------------
+def _postgres_url(args) -> str | None:
+    url = args.postgres_url or os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        return None
+    url = url.replace("postgresql+psycopg2://", "postgresql://", 1)
+    try:
+        import psycopg2
+        psycopg2.connect(url, connect_timeout=2).close()
+        return url
+    except Exception as ex:
+        print(f"⚠️  skipping postgres: {ex}".strip(), file=sys.stderr)
+        return None
+
+
+def cmd_run(args) -> int:
+    backends = ["sqlite", "postgres"] if args.backend == "all" else [args.backend]
+    report = {
+        "created_at": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "warmup": args.warmup,
+        "samples": args.samples,
+        "backends": {},
+    }
+    for backend in backends:
+        #query counts come from the get_db instrumentation
+        env = dict(os.environ, DB_INSTRUMENT="1")
+        if backend == "sqlite":
+            env["DATABASE_URL"] = ""
+            if args.sqlite_path:
+                env["DB_PATH"] = os.path.abspath(args.sqlite_path)
+        else:
+            url = _postgres_url(args)
+            if url is None:
+                continue
+            env["DATABASE_URL"] = url
+        print(f"{backend}:", file=sys.stderr)
+        cmd = [sys.executable, os.path.abspath(__file__), "_backend",
+               "--warmup", str(args.warmup), "--samples", str(args.samples),
+               "--bench-user-id", str(args.bench_user_id)]
+        if args.user_id:
+            cmd += ["--user-id", str(args.user_id)]
+        for c in args.case or []:
+            cmd += ["--case", c]
+        out = subprocess.run(cmd, env=env, cwd=project_root, stdout=subprocess.PIPE, text=True)
+        if out.returncode != 0:
+            print(f"❌ {backend} run failed (exit {out.returncode})", file=sys.stderr)
+            return out.returncode
+        report["backends"][backend] = json.loads(out.stdout)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+        print(f"✅ wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+def cmd_backend(args) -> int:
+    print(json.dumps(run_backend(args), sort_keys=True))
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.old, encoding="utf-8") as fh:
+        old = json.load(fh)
+    with open(args.new, encoding="utf-8") as fh:
+        new = json.load(fh)
+
+    failures = []
+    for backend, new_b in sorted(new["backends"].items()):
+        old_b = old.get("backends", {}).get(backend)
+        if not old_b:
+            continue
+        print(f"{backend}:")
+        print(f"  {'case':<40} {'old ms':>10} {'new ms':>10} {'change':>8} {'queries':>9}")
+        for name, n in sorted(new_b["cases"].items()):
+            o = old_b["cases"].get(name)
+            if "error" in n:
+                print(f"  {name:<40} ❌ {n['error']}")
+                if o and "error" not in o:
+                    failures.append(f"{backend}/{name}: now fails ({n['error']})")
+                continue
+            if not o or "error" in o:
+                print(f"  {name:<40} {'-':>10} {n['median_ms']:>10.3f} {'new':>8} {n['queries']:>9}")
+                continue
+            change = (n["median_ms"] - o["median_ms"]) / o["median_ms"] if o["median_ms"] else 0.0
+            flag = ""
+            if change > args.threshold:
+                flag = " ❌"
+                failures.append(f"{backend}/{name}: median {o['median_ms']:.3f} -> {n['median_ms']:.3f} ms ({change:+.0%})")
+            if n["queries"] > o["queries"]:
+                flag = " ❌"
+                failures.append(f"{backend}/{name}: queries {o['queries']} -> {n['queries']}")
+            print(f"  {name:<40} {o['median_ms']:>10.3f} {n['median_ms']:>10.3f} {change:>+8.0%} "
+                  f"{o['queries']:>4}->{n['queries']:<4}{flag}")
+
+    for f in failures:
+        print(f"❌ {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark database.db_query helpers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--warmup", type=int, default=3, help="untimed calls per case")
+    common.add_argument("--samples", type=int, default=20, help="timed calls per case")
+    common.add_argument("--user-id", type=int, default=None, help="user for per-user cases (default: most ratings)")
+    common.add_argument("--bench-user-id", type=int, default=BENCH_USER_ID, help="scratch user written by upsert_rating")
+    common.add_argument("--case", action="append", help="only cases whose name contains this (repeatable)")
+
+    p_run = sub.add_parser("run", parents=[common], help="run the suite and write JSON results")
+    p_run.add_argument("--backend", choices=["sqlite", "postgres", "all"], default="sqlite")
+    p_run.add_argument("--sqlite-path", default=None, help="SQLite file (default: DB_PATH / database/movies.db)")
+    p_run.add_argument("--postgres-url", default=None, help="default: BENCH_DATABASE_URL or DATABASE_URL")
+    p_run.add_argument("--output", default=None, help="JSON results path (default: stdout)")
+    p_run.set_defaults(func=cmd_run)
+
+    p_backend = sub.add_parser("_backend", parents=[common], help=argparse.SUPPRESS)
+    p_backend.set_defaults(func=cmd_backend)
+
+    p_cmp = sub.add_parser("compare", help="compare two result files")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.2, help="allowed median slowdown (0.2 = 20%%)")
+    p_cmp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+generate_synthetic.py
+Generate a MovieLens-shaped dataset (movies/ratings/tags/links CSVs) of any
+size for scale testing, with power-law movie popularity and user activity.
+
+Output is streamed in chunks of users, so memory stays flat no matter how many
+ratings are written, and the files load with database.load_movielens.main:
+
+    python scripts/generate_synthetic.py --ratings 1M --out data/synthetic-1m
+    python scripts/generate_synthetic.py --ratings 25M --out data/synthetic-25m --load
+
+ratings.csv is sorted by userId then movieId, like the real dataset.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# ✅ Add project root to Python path (for --load)
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+GENRES = [
+    "Drama", "Comedy", "Thriller", "Action", "Romance", "Adventure", "Crime", "Sci-Fi",
+    "Horror", "Fantasy", "Children", "Animation", "Mystery", "Documentary", "War",
+    "Musical", "Western", "IMAX", "Film-Noir",
+]
+#rough MovieLens genre frequencies
+GENRE_WEIGHTS = np.array([44, 39, 19, 18, 16, 14, 12, 10, 10, 8, 7, 6, 6, 4, 4, 3, 2, 2, 1], dtype=float)
+
+TAGS = [
+    "atmospheric", "funny", "twist ending", "dark comedy", "visually appealing", "classic",
+    "thought-provoking", "based on a book", "quirky", "sci-fi", "dystopia", "soundtrack",
+    "psychology", "great acting", "slow", "violence", "surreal", "predictable", "romance", "cult film",
+]
+
+_SUFFIX = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+
+def parse_count(text: str) -> int:
+    """'1M' / '25m' / '100k' / '2500000' -> int"""
+    t = str(text).strip().upper().replace("_", "")
+    if t and t[-1] in _SUFFIX:
+        return int(float(t[:-1]) * _SUFFIX[t[-1]])
+    return int(t)
+
+
+def power_law_weights(n: int, alpha: float, rng: np.random.Generator) -> np.ndarray:
+    """Zipf-like weights 1/rank^alpha assigned to items in random order (plus a thin uniform floor)"""
+    w = 1.0 / np.arange(1, n + 1, dtype=float) ** alpha
+    w = 0.9 * w / w.sum() + 0.1 / n
+    rng.shuffle(w)
+    return w / w.sum()
+
+
+def user_activity(n_users: int, n_ratings: int, n_movies: int, min_per_user: int,
+                  rng: np.random.Generator) -> np.ndarray:
+    """per-user rating counts: long-tailed (lognormal), >= min_per_user, summing to ~n_ratings"""
+    cap = max(min_per_user, int(n_movies * 0.5))
+    weights = rng.lognormal(mean=0.0, sigma=1.3, size=n_users)
+    counts = np.full(n_users, min_per_user, dtype=np.int64)
+    # hand out the remaining ratings by weight; mass above the cap goes to everyone else
+    for _ in range(10):
+        deficit = n_ratings - int(counts.sum())
+        open_ = counts < cap
+        if deficit <= 0 or not open_.any():
+            break
+        w = np.where(open_, weights, 0.0)
+        counts = np.minimum(counts + np.floor(w / w.sum() * deficit).astype(np.int64), cap)
+    return counts
+
+
+def write_movies(out: str, n_movies: int, rng: np.random.Generator) -> np.ndarray:
+    """movies.csv + links.csv; returns per-movie mean rating (latent quality)"""
+    movie_ids = np.arange(1, n_movies + 1)
+    years = rng.integers(1920, 2024, size=n_movies)
+    probs = GENRE_WEIGHTS / GENRE_WEIGHTS.sum()
+    n_genres = rng.choice([1, 2, 3, 4], size=n_movies, p=[0.35, 0.35, 0.2, 0.1])
+    genres = ["|".join(sorted(rng.choice(GENRES, size=g, replace=False, p=probs))) for g in n_genres]
+    titles = [f"Synthetic Movie {mid} ({y})" for mid, y in zip(movie_ids, years)]
+    pd.DataFrame({"movieId": movie_ids, "title": titles, "genres": genres}).to_csv(
+        os.path.join(out, "movies.csv"), index=False
+    )
+
+    tmdb = rng.permutation(n_movies * 4)[:n_movies] + 1
+    pd.DataFrame({
+        "movieId": movie_ids,
+        "imdbId": [f"{i:07d}" for i in rng.permutation(9_000_000)[:n_movies] + 100_000],
+        "tmdbId": tmdb,
+    }).to_csv(os.path.join(out, "links.csv"), index=False)
+
+    return np.clip(rng.normal(3.5, 0.45, size=n_movies), 1.0, 4.8)
+
+
+def write_ratings_and_tags(out: str, counts: np.ndarray, popularity: np.ndarray, quality: np.ndarray,
+                           tag_fraction: float, chunk_rows: int, rng: np.random.Generator) -> tuple[int, int]:
+    """stream ratings.csv / tags.csv one block of users at a time"""
+    n_movies = len(popularity)
+    cdf = np.cumsum(popularity)
+    cdf[-1] = 1.0
+    ratings_path = os.path.join(out, "ratings.csv")
+    tags_path = os.path.join(out, "tags.csv")
+    n_ratings = n_tags = 0
+    first = True
+    t0 = time.perf_counter()
+
+    start = 0
+    n_users = len(counts)
+    while start < n_users:
+        # take as many users as fit into one chunk (at least one)
+        end = start + max(1, int(np.searchsorted(np.cumsum(counts[start:]), chunk_rows)))
+        end = min(end, n_users)
+        block = counts[start:end]
+        user_ids = np.arange(start + 1, end + 1)
+
+        # draw with replacement, drop duplicate (user, movie) pairs, and top up
+        # users that came out short for a few rounds
+        keys = np.empty(0, dtype=np.int64)
+        need = block.copy()
+        for _ in range(6):
+            owner = np.repeat(user_ids.astype(np.int64), (need * 1.3 + 3).astype(np.int64) * (need > 0))
+            movie_idx = np.searchsorted(cdf, rng.random(owner.size))
+            keys = np.unique(np.concatenate((keys, owner * n_movies + movie_idx)))   # sorted by user, then movie
+            need = block - np.bincount(keys // n_movies - start - 1, minlength=block.size)
+            if (need <= 0).all():
+                break
+        users = keys // n_movies
+        movies = keys % n_movies
+
+        # trim each user back to their target count (random subset keeps popularity skew)
+        order = np.lexsort((rng.random(users.size), users))
+        users, movies = users[order], movies[order]
+        starts = np.searchsorted(users, user_ids)
+        rank = np.arange(users.size) - np.repeat(starts, np.diff(np.append(starts, users.size)))
+        keep = rank < block[users - start - 1]
+        users, movies = users[keep], movies[keep]
+        resort = np.lexsort((movies, users))
+        users, movies = users[resort], movies[resort]
+
+        user_bias = rng.normal(0.0, 0.4, size=block.size)
+        raw = quality[movies] + user_bias[users - start - 1] + rng.normal(0.0, 0.8, size=users.size)
+        ratings = np.clip(np.round(raw * 2) / 2, 0.5, 5.0)
+
+        first_ts = rng.integers(820_000_000, 1_690_000_000, size=block.size)
+        span = rng.integers(3600, 5 * 365 * 86400, size=block.size)
+        ts = first_ts[users - start - 1] + (rng.random(users.size) * span[users - start - 1]).astype(np.int64)
+
+        chunk = pd.DataFrame({"userId": users, "movieId": movies + 1, "rating": ratings, "timestamp": ts})
+        chunk.to_csv(ratings_path, mode="w" if first else "a", header=first, index=False, float_format="%.1f")
+
+        tagged = chunk.sample(frac=tag_fraction, random_state=int(rng.integers(2**31))) if tag_fraction > 0 else chunk.iloc[:0]
+        tags = pd.DataFrame({
+            "userId": tagged["userId"].to_numpy(),
+            "movieId": tagged["movieId"].to_numpy(),
+            "tag": rng.choice(TAGS, size=len(tagged)),
+            "timestamp": tagged["timestamp"].to_numpy() + 60,
+        }).sort_values(["userId", "movieId"])
+        tags.to_csv(tags_path, mode="w" if first else "a", header=first, index=False)
+
+        n_ratings += len(chunk)
+        n_tags += len(tags)
+        first = False
+        start = end
+        elapsed = time.perf_counter() - t0
+        print(f"  users {end:,}/{n_users:,}  ratings {n_ratings:,}  ({n_ratings / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    return n_ratings, n_tags
+
+
+def generate(out: str, n_ratings: int, n_users: int | None = None, n_movies: int | None = None,
+             min_per_user: int = 20, movie_alpha: float = 1.0, tag_fraction: float = 0.035,
+             chunk_rows: int = 1_000_000, seed: int = 0) -> None:
+    #default shape follows MovieLens: ~155 ratings/user, catalog ~ 12*sqrt(ratings)
+    n_users = n_users or max(100, n_ratings // 155)
+    n_movies = n_movies or max(1_000, int(12 * np.sqrt(n_ratings)))
+    rng = np.random.default_rng(seed)
+    os.makedirs(out, exist_ok=True)
+
+    print(f"Generating ~{n_ratings:,} ratings, {n_users:,} users, {n_movies:,} movies -> {out}")
+    quality = write_movies(out, n_movies, rng)
+    popularity = power_law_weights(n_movies, movie_alpha, rng)
+    counts = user_activity(n_users, n_ratings, n_movies, min_per_user, rng)
+    written, tags = write_ratings_and_tags(out, counts, popularity, quality, tag_fraction, chunk_rows, rng)
+    print(f"✅ wrote {written:,} ratings and {tags:,} tags")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic MovieLens-shaped dataset.")
+    parser.add_argument("--ratings", type=parse_count, default=parse_count("1M"), help="approximate rating count (e.g. 1M, 10M, 25M)")
+    parser.add_argument("--users", type=parse_count, default=None, help="user count (default: ratings / 155)")
+    parser.add_argument("--movies", type=parse_count, default=None, help="movie count (default: 12 * sqrt(ratings))")
+    parser.add_argument("--min-per-user", type=int, default=20, help="minimum ratings per user")
+    parser.add_argument("--alpha", type=float, default=1.0, help="movie popularity power-law exponent")
+    parser.add_argument("--tag-fraction", type=float, default=0.035, help="share of ratings that also get a tag")
+    parser.add_argument("--chunk-rows", type=parse_count, default=parse_count("1M"), help="rows generated per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--load", action="store_true", help="load the result into the configured database")
+    args = parser.parse_args(argv)
+
+    generate(args.out, args.ratings, n_users=args.users, n_movies=args.movies,
+             min_per_user=args.min_per_user, movie_alpha=args.alpha,
+             tag_fraction=args.tag_fraction, chunk_rows=args.chunk_rows, seed=args.seed)
+
+    if args.load:
+        from database.init_db import main as init_db
+        from database.load_movielens import main as load_db
+        init_db()
+        load_db(args.out)
+
+
+if __name__ == "__main__":
+    main()
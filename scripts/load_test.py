@@ -0,0 +1,417 @@
+"""
+load_test.py
+HTTP load generator for the Flask app with per-route latency percentiles.
+
+    python scripts/load_test.py --duration 30 --concurrency 16
+    python scripts/load_test.py --gunicorn --gunicorn-workers 4 --duration 60 --output reports/load.json
+    python scripts/load_test.py --url http://127.0.0.1:5000 --mix content=60,movies=40
+    python scripts/load_test.py --max-p95 content=250 --max-error-rate 0.01 --baseline reports/load.json
+
+Targets the app in-process through the Flask test client (default), a running
+server (--url) or a local gunicorn it starts itself (--gunicorn). A pool of
+threads replays a weighted mix of routes as seeded users: loadtest_<n>
+accounts are created through /auth/signup and given ratings through
+/api/ratings/batch, so this writes to whatever database the target uses
+(signup also drops a user_profile/loadtest_<n>.json per account).
+
+Reports p50/p95/p99, throughput and error rate per route (JSON, sorted keys)
+and exits 1 when a --max-* threshold or a --baseline regression check fails.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+# ✅ Add project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+PASSWORD = "loadtest-password"
+
+#weights used when --mix is not given
+DEFAULT_MIX = {"movies": 25, "search": 20, "content": 25, "click": 15, "stats": 15}
+
+CLICK_BUTTONS = ["get_rec_button", "view_statistics_button", "add_rating_submit"]
+
+
+# ------------------------------
+# Clients
+# ------------------------------
+class FlaskClient:
+    """in-process client (one per simulated user; not shared between threads)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, params=None, json_body=None, form=None):
+        resp = self.client.open(path, method=method, query_string=params, json=json_body, data=form)
+        return resp.status_code, len(resp.get_data()), (resp.get_json(silent=True) if resp.is_json else None)
+
+
+class HttpClient:
+    """real HTTP client for --url / --gunicorn"""
+
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.timeout = timeout
+
+    def request(self, method, path, params=None, json_body=None, form=None):
+        resp = self.session.request(
+            method, self.base_url + path, params=params, json=json_body, data=form,
+            timeout=self.timeout, allow_redirects=False,
+        )
+        body = None
+        if resp.headers.get("Content-Type", "").startswith("application/json"):
+            body = resp.json()
+        return resp.status_code, len(resp.content), body
+
+
+def start_gunicorn(workers: int, threads: int, port: int | None = None):
+    """start `gunicorn app:app` on a free local port and wait for /api/ping"""
+    import requests
+
+    if port is None:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+        cwd=project_root,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            if requests.get(url + "/api/ping", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+
+# ------------------------------
+# Seeding
+# ------------------------------
+def load_catalog(client, pages: int = 5) -> tuple[list[int], list[str]]:
+    """movie ids + search terms taken from the first pages of /api/movies"""
+    movie_ids, terms = [], set()
+    for page in range(1, pages + 1):
+        status, _, body = client.request("GET", "/api/movies", params={"page": page, "page_size": 100, "sort": "rating", "dir": "desc"})
+        if status != 200 or not body:
+            break
+        for m in body.get("items") or body.get("movies") or []:
+            movie_ids.append(int(m["movie_id"]))
+            words = [w for w in str(m.get("title", "")).split() if len(w) >= 4 and w.isalpha()]
+            if words:
+                terms.add(words[0][:6].lower())
+    if not movie_ids:
+        raise RuntimeError("no movies returned by /api/movies; is the database loaded?")
+    return movie_ids, sorted(terms) or ["the"]
+
+
+def seed_user(client, username: str, movie_ids: list[int], n_ratings: int, rng: random.Random) -> int:
+    """create (if needed) and log in `username`, give it ratings; returns its user_id"""
+    client.request("POST", "/auth/signup", form={"username": username, "password": PASSWORD})
+    status, _, _ = client.request("POST", "/auth/login", json_body={"username": username, "password": PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"login failed for {username} (HTTP {status})")
+    picks = rng.sample(movie_ids, min(n_ratings, len(movie_ids)))
+    ratings = [[mid, rng.choice([2.5, 3.0, 3.5, 4.0, 4.0, 4.5, 5.0])] for mid in picks]
+    status, _, body = client.request("POST", "/api/ratings/batch", json_body={"ratings": ratings})
+    if status != 200 or not body:
+        raise RuntimeError(f"seeding ratings failed for {username} (HTTP {status})")
+    return int(body["user_id"])
+
+
+# ------------------------------
+# Route mix
+# ------------------------------
+def build_request(route: str, rng: random.Random, user_id: int, movie_ids: list[int], terms: list[str]):
+    """(method, path, params, json_body) for one call of `route`"""
+    if route == "movies":
+        params = {
+            "sort": rng.choice(["title", "year", "rating"]),
+            "dir": rng.choice(["asc", "desc"]),
+            "page": rng.randint(1, 20),
+            "page_size": 20,
+        }
+        if rng.random() < 0.3:
+            params["genre"] = rng.choice(["Drama", "Comedy", "Action", "Thriller", "Romance", "Sci-Fi"])
+        return "GET", "/api/movies", params, None
+    if route == "search":
+        return "GET", "/api/movies/search", {"q": rng.choice(terms), "limit": 20}, None
+    if route == "content":
+        return "GET", "/api/recommendations/content", {"user_id": user_id, "k": 20}, None
+    if route == "click":
+        button = rng.choice(CLICK_BUTTONS)
+        body = {"button": button}
+        if button == "add_rating_submit":
+            body.update(movie_id=rng.choice(movie_ids), rating=rng.choice([3.0, 3.5, 4.0, 4.5, 5.0]))
+        return "POST", "/api/button-click", None, body
+    if route == "stats":
+        return "GET", "/api/user/stats", None, None
+    raise ValueError(f"unknown route: {route}")
+
+
+def parse_mix(text: str | None) -> dict[str, float]:
+    """'content=60,movies=40' -> {"content": 60.0, "movies": 40.0}"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown route {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_thresholds(values: list[str] | None) -> dict[str, float]:
+    """['250', 'content=400'] -> {"*": 250.0, "content": 400.0}"""
+    out = {}
+    for v in values or []:
+        name, sep, ms = v.partition("=")
+        if sep:
+            out[name.strip()] = float(ms)
+        else:
+            out["*"] = float(name)
+    return out
+
+
+# ------------------------------
+# Runner
+# ------------------------------
+class Recorder:
+    """per-thread sample lists merged once at the end (no shared lock on the hot path)"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)     # route -> [(latency_s, status, nbytes)]
+
+    def add(self, route, latency, status, nbytes):
+        self.samples[route].append((latency, status, nbytes))
+
+
+def _worker(users, mix, movie_ids, terms, seed, stop_at, warmup_until, max_requests, counter, recorder):
+    rng = random.Random(seed)
+    routes, weights = list(mix), list(mix.values())
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            return
+        if max_requests is not None:
+            with counter["lock"]:
+                if counter["n"] >= max_requests:
+                    return
+                counter["n"] += 1
+        client, user_id = rng.choice(users)
+        route = rng.choices(routes, weights)[0]
+        method, path, params, body = build_request(route, rng, user_id, movie_ids, terms)
+        t0 = time.perf_counter()
+        try:
+            status, nbytes, _ = client.request(method, path, params=params, json_body=body)
+        except Exception:
+            status, nbytes = 0, 0
+        latency = time.perf_counter() - t0
+        if t0 >= warmup_until:
+            recorder.add(route, latency, status, nbytes)
+
+
+def summarize(samples: dict[str, list], wall: float) -> dict:
+    def stats(rows):
+        lat_ms = np.array([r[0] for r in rows]) * 1000.0
+        errors = sum(1 for r in rows if r[1] == 0 or r[1] >= 400)
+        return {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 5) if rows else 0.0,
+            "throughput_rps": round(len(rows) / wall, 2) if wall > 0 else 0.0,
+            "mean_ms": round(float(lat_ms.mean()), 3) if rows else 0.0,
+            "max_ms": round(float(lat_ms.max()), 3) if rows else 0.0,
+            **{f"p{q}_ms": round(float(np.percentile(lat_ms, q)), 3) if rows else 0.0 for q in (50, 95, 99)},
+            "bytes": int(sum(r[2] for r in rows)),
+        }
+
+    routes = {name: stats(rows) for name, rows in sorted(samples.items())}
+    routes["all"] = stats([r for rows in samples.values() for r in rows])
+    return routes
+
+
+def check(report: dict, max_p95: dict, max_p99: dict, max_error_rate: float | None,
+          baseline: dict | None, max_regression: float) -> list[str]:
+    """list of threshold / regression failures (empty when everything passes)"""
+    failures = []
+    for route, s in report["routes"].items():
+        if not s["requests"]:
+            continue
+        for label, limits in (("p95", max_p95), ("p99", max_p99)):
+            limit = limits.get(route, limits.get("*") if route != "all" else limits.get("all"))
+            if limit is not None and s[f"{label}_ms"] > limit:
+                failures.append(f"{route}: {label} {s[f'{label}_ms']:.1f}ms > {limit:.1f}ms")
+        if max_error_rate is not None and s["error_rate"] > max_error_rate:
+            failures.append(f"{route}: error rate {s['error_rate']:.2%} > {max_error_rate:.2%}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old.get("p95_ms"):
+            allowed = old["p95_ms"] * (1.0 + max_regression)
+            if s["p95_ms"] > allowed:
+                failures.append(
+                    f"{route}: p95 {s['p95_ms']:.1f}ms regressed from {old['p95_ms']:.1f}ms "
+                    f"(> {max_regression:.0%} allowed)"
+                )
+    return failures
+
+
+def run(args) -> dict:
+    proc = None
+    if args.gunicorn:
+        proc, url = start_gunicorn(args.gunicorn_workers, args.gunicorn_threads)
+    else:
+        url = args.url
+
+    try:
+        if url:
+            make_client = lambda: HttpClient(url)
+        else:
+            from app import app
+            make_client = lambda: FlaskClient(app)
+
+        mix = parse_mix(args.mix)
+        movie_ids, terms = load_catalog(make_client())
+
+        #seed users once, then give every thread its own logged-in clients
+        seed_rng = random.Random(args.seed)
+        user_ids = []
+        for i in range(args.users):
+            user_ids.append(seed_user(make_client(), f"{args.user_prefix}{i}", movie_ids, args.seed_ratings, seed_rng))
+        print(f"seeded {len(user_ids)} users, {len(movie_ids)} catalog movies, {len(terms)} search terms", file=sys.stderr)
+
+        thread_users = []
+        for t in range(args.concurrency):
+            mine = [i for i in range(args.users) if i % args.concurrency == t] or [t % args.users]
+            clients = []
+            for i in mine:
+                c = make_client()
+                c.request("POST", "/auth/login", json_body={"username": f"{args.user_prefix}{i}", "password": PASSWORD})
+                clients.append((c, user_ids[i]))
+            thread_users.append(clients)
+
+        start = time.perf_counter()
+        warmup_until = start + args.warmup
+        stop_at = warmup_until + args.duration if args.requests is None else float("inf")
+        counter = {"n": 0, "lock": threading.Lock()}
+        recorders = [Recorder() for _ in range(args.concurrency)]
+        threads = [
+            threading.Thread(
+                target=_worker,
+                args=(thread_users[t], mix, movie_ids, terms, args.seed + 1000 + t,
+                      stop_at, warmup_until, args.requests, counter, recorders[t]),
+                daemon=True,
+            )
+            for t in range(args.concurrency)
+        ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - max(warmup_until, start)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    samples = defaultdict(list)
+    for rec in recorders:
+        for route, rows in rec.samples.items():
+            samples[route].extend(rows)
+
+    return {
+        "config": {
+            "target": "gunicorn" if args.gunicorn else ("url" if args.url else "flask_test_client"),
+            "concurrency": args.concurrency,
+            "duration_s": args.duration if args.requests is None else None,
+            "requests": args.requests,
+            "warmup_s": args.warmup,
+            "users": args.users,
+            "mix": mix,
+            "seed": args.seed,
+        },
+        "wall_seconds": round(wall, 3),
+        "routes": summarize(samples, wall),
+    }
+
+
+def print_table(report: dict) -> None:
+    print(f"{'route':>10} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)", file=sys.stderr)
+    for route, s in report["routes"].items():
+        print(f"{route:>10} {s['requests']:>7} {s['throughput_rps']:>8.1f} {s['error_rate'] * 100:>6.2f} "
+              f"{s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}", file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the Flask API and report per-route latency.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default=None, help="base URL of a running server (default: in-process test client)")
+    target.add_argument("--gunicorn", action="store_true", help="start a local gunicorn for the run")
+    parser.add_argument("--gunicorn-workers", type=int, default=4)
+    parser.add_argument("--gunicorn-threads", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds (after warmup)")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests instead of --duration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of traffic excluded from the report")
+    parser.add_argument("--mix", default=None, help=f"route weights, default {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())}")
+    parser.add_argument("--users", type=int, default=20, help="seeded users")
+    parser.add_argument("--user-prefix", default="loadtest_")
+    parser.add_argument("--seed-ratings", type=int, default=30, help="ratings given to each seeded user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p95", action="append", help="fail if p95 exceeds MS or ROUTE=MS (repeatable)")
+    parser.add_argument("--max-p99", action="append", help="fail if p99 exceeds MS or ROUTE=MS (repeatable)")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="fail above this error rate (e.g. 0.01)")
+    parser.add_argument("--baseline", default=None, help="previous JSON report to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 increase over --baseline")
+    parser.add_argument("--output", default=None, help="JSON report path (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.concurrency < 1:
+        parser.error("--users and --concurrency must be >= 1")
+
+    report = run(args)
+    print_table(report)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    failures = check(report, parse_thresholds(args.max_p95), parse_thresholds(args.max_p99),
+                     args.max_error_rate, baseline, args.max_regression)
+    report["failures"] = failures
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    for f in failures:
+        print(f"❌ {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+memory_report.py
+Show what the big in-memory structures of a worker cost.
+
+    python scripts/memory_report.py --url http://127.0.0.1:8000 --token $ADMIN_TOKEN
+    python scripts/memory_report.py --url http://127.0.0.1:8000 --token $ADMIN_TOKEN --tracemalloc
+    python scripts/memory_report.py --engine item_item --engine content --tracemalloc   # offline
+
+With --url it reads /api/admin/memory of a running server (one gunicorn
+worker answers per request). Without it, it loads the selected engines'
+models in this process the way a worker would (artifact, else fit from the
+database) and reports the same accounting (memory.accountant).
+"""
+
+import os
+import sys
+import json
+import argparse
+
+# ✅ Add project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+
+def _mb(n) -> str:
+    return "-" if n is None else f"{n / 1e6:10.1f}"
+
+
+def print_report(report: dict) -> None:
+    print(f"{'structure':<22} {'kind':<8} {'private MB':>10} {'mapped MB':>10} {'items':>7}")
+    for r in report["structures"]:
+        print(f"{r['name']:<22} {r['kind']:<8} {_mb(r['bytes'])} {_mb(r['mapped_bytes'])} {r.get('items', ''):>7}")
+        for name, m in (r.get("models") or {}).items():
+            print(f"  {name:<20} {'':<8} {_mb(m['bytes'])} {_mb(m['mapped_bytes'])}")
+    print(f"{'total':<22} {'':<8} {_mb(report['total_bytes'])} {_mb(report['total_mapped_bytes'])}")
+    print(f"{'process rss':<22} {'':<8} {_mb(report.get('rss_bytes'))}")
+    if report.get("budget_bytes"):
+        print(f"{'budget':<22} {'':<8} {_mb(report['budget_bytes'])}")
+    top = report.get("tracemalloc_top")
+    if top and top.get("tracing"):
+        print(f"\ntracemalloc: {top['traced_bytes'] / 1e6:.1f} MB traced, peak {top['traced_peak_bytes'] / 1e6:.1f} MB")
+        for row in top["top"]:
+            print(f"  {row['bytes'] / 1e6:9.2f} MB {row['count']:>9} blocks  {row['where']}")
+
+
+def remote_report(url: str, token: str | None, tracemalloc: bool, limit: int) -> dict:
+    import requests
+
+    headers = {"X-Admin-Token": token} if token else {}
+    base = url.rstrip("/")
+    if tracemalloc:
+        requests.post(f"{base}/api/admin/memory/tracemalloc", json={"action": "start"}, headers=headers, timeout=30)
+    resp = requests.get(
+        f"{base}/api/admin/memory",
+        params={"tracemalloc": 1, "limit": limit} if tracemalloc else None,
+        headers=headers, timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def local_report(engines: list[str], tracemalloc: bool, limit: int) -> dict:
+    import memory
+    from recommender.artifacts import get_model
+
+    if tracemalloc:
+        memory.tracemalloc_start()
+    for name in engines:
+        get_model(name)
+    report = memory.accountant.report()
+    if tracemalloc:
+        report["tracemalloc_top"] = memory.tracemalloc_top(limit=limit)
+    return report
+
+
+def main(argv=None) -> None:
+    from recommender.engines import ENGINES
+
+    parser = argparse.ArgumentParser(description="Report in-memory structure sizes.")
+    parser.add_argument("--url", default=None, help="running server to query (default: load models locally)")
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN"), help="admin token (default: $ADMIN_TOKEN)")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), help="local mode: engines to load (default: all)")
+    parser.add_argument("--tracemalloc", action="store_true", help="include top allocating lines")
+    parser.add_argument("--limit", type=int, default=15, help="tracemalloc rows")
+    parser.add_argument("--json", action="store_true", help="print raw JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        report = remote_report(args.url, args.token, args.tracemalloc, args.limit)
+    else:
+        report = local_report(args.engine or sorted(ENGINES), args.tracemalloc, args.limit)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# tracing.py
+"""
+Tiny in-process tracing for the recommendation pipeline.
+
+    from tracing import span, traced
+
+    with span("score"):
+        scores = X @ uvec
+
+    @traced("metadata")
+    def fetch(...): ...
+
+Every span feeds the pipeline_stage_duration_seconds{stage} histogram in
+metrics.registry. When a trace is active (api.instrumentation starts one per
+HTTP request) spans are also collected as a nested tree, which the request
+hooks return as a Server-Timing header and, for JSON responses, a "_trace"
+field when the client asks for it (X-Debug-Trace: 1 or ?debug=trace).
+
+Spans opened from other threads (e.g. a thread pool inside a request) hang
+off the trace root unless that thread already has an open span.
+"""
+
+import time
+import threading
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
+
+from metrics import registry
+
+STAGE_LATENCY = registry.histogram(
+    "pipeline_stage_duration_seconds", "Recommendation pipeline stage latency in seconds.", ["stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+class Trace:
+    __slots__ = ("t0", "root", "_stacks")
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.root: dict = {"name": "request", "start_ms": 0.0, "children": []}
+        self._stacks: dict[int, list] = {}
+
+    def _stack(self) -> list:
+        tid = threading.get_ident()
+        stack = self._stacks.get(tid)
+        if stack is None:
+            stack = self._stacks[tid] = []
+        return stack
+
+    def tree(self) -> dict:
+        self.root["ms"] = round((time.perf_counter() - self.t0) * 1000.0, 3)
+        return self.root
+
+    def totals(self) -> dict[str, float]:
+        """total ms per stage name across the whole tree (repeated stages add up)"""
+        out: dict[str, float] = {}
+
+        def walk(node):
+            for child in node["children"]:
+                if "ms" in child:
+                    out[child["name"]] = out.get(child["name"], 0.0) + child["ms"]
+                walk(child)
+
+        walk(self.root)
+        return out
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+class span:
+    """context manager timing one stage; nests under the open span of this thread"""
+    __slots__ = ("name", "_t0", "_node", "_trace")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._trace = trace = _current.get()
+        self._node = None
+        self._t0 = time.perf_counter()
+        if trace is not None:
+            stack = trace._stack()
+            parent = stack[-1] if stack else trace.root
+            self._node = {"name": self.name, "start_ms": round((self._t0 - trace.t0) * 1000.0, 3), "children": []}
+            parent["children"].append(self._node)
+            stack.append(self._node)
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self._t0
+        STAGE_LATENCY.observe(dt, stage=self.name)
+        if self._node is not None:
+            self._node["ms"] = round(dt * 1000.0, 3)
+            stack = self._trace._stack()
+            if stack and stack[-1] is self._node:
+                stack.pop()
+        return False
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """decorator form of span(); defaults to the function name"""
+    def deco(fn):
+        stage = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def start_trace():
+    """begin collecting spans in the current context; returns a token for end_trace()"""
+    return _current.set(Trace())
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def end_trace(token) -> None:
+    _current.reset(token)
+
+
+def server_timing(trace: Trace) -> str:
+    """Server-Timing header value: one entry per stage name, in first-seen order"""
+    parts = []
+    for i, (name, ms) in enumerate(trace.totals().items()):
+        safe = "".join(c if c.isalnum() or c in "_-" else "_" for c in name)
+        parts.append(f"{safe};dur={ms:.3f}")
+    return ", ".join(parts)